@@ -53,7 +53,7 @@ class L2Pyr(Pyr):
         # self.__synapse_create()
 
         # run record_current_soma(), defined in Cell()
-        self.record_current_soma()
+        self.record_current_soma(paramrw.recintervals(p)[1])
 
     # insert IClamps in all situations
     # temporarily an external function taking the p dict
@@ -239,6 +239,13 @@ class L2Pyr(Pyr):
       pt3dclear(sec=dend[5]); pt3dadd(-50, 715, 0, 1,sec=dend[5]); pt3dadd(-156, 609, 0, 1,sec=dend[5])
       pt3dclear(sec=dend[6]); pt3dadd(-50, 715, 0, 1,sec=dend[6]); pt3dadd(56, 609, 0, 1,sec=dend[6])
 
+    # re-applies the biophysics with the values in p (for NetworkOnNode.update_params)
+    # mechanisms are already inserted, so this only resets their parameters
+    def set_biophys (self, p):
+        self.p_all = paramrw.compare_dictionaries(self.p_all, p)
+        self.__biophys_soma()
+        self.__biophys_dends()
+
     # Adds biophysics to soma
     def __biophys_soma (self):
         # set soma biophysics specified in Pyr
@@ -444,11 +451,11 @@ class L2Pyr(Pyr):
     def parreceive_ext (self, type, gid, gid_dict, pos_dict, p_ext):
         if type.startswith(('evprox', 'evdist')):
             if self.celltype in p_ext.keys():
-                gid_ev = gid + gid_dict[type][0]
+                gid_ev, pos_ev = self.evinput_src(type, gid, gid_dict, pos_dict, p_ext)
 
                 # separate dictionaries for ampa and nmda evoked inputs
                 nc_dict_ampa = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][0], # index 0 for ampa weight
                     'A_delay': p_ext[self.celltype][2], # index 2 for delay
                     'lamtha': p_ext['lamtha_space'],
@@ -457,7 +464,7 @@ class L2Pyr(Pyr):
                 }
 
                 nc_dict_nmda = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][1], # index 1 for nmda weight
                     'A_delay': p_ext[self.celltype][2], # index 2 for delay
                     'lamtha': p_ext['lamtha_space'],
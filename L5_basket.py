@@ -146,10 +146,10 @@ class L5Basket(BasketSingle):
     def parreceive_ext(self, type, gid, gid_dict, pos_dict, p_ext):
         if type.startswith(('evprox', 'evdist')): # shouldn't this just check for evprox?
             if self.celltype in p_ext.keys():
-                gid_ev = gid + gid_dict[type][0]
+                gid_ev, pos_ev = self.evinput_src(type, gid, gid_dict, pos_dict, p_ext)
 
                 nc_dict_ampa = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][0], # index 0 is ampa weight
                     'A_delay': p_ext[self.celltype][2], # index 2 is delay
                     'lamtha': p_ext['lamtha_space'],
@@ -158,7 +158,7 @@ class L5Basket(BasketSingle):
                 }
 
                 nc_dict_nmda = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][1], # index 1 is nmda weight
                     'A_delay': p_ext[self.celltype][2], # index 2 is delay
                     'lamtha': p_ext['lamtha_space'],
@@ -90,7 +90,7 @@ class L5Pyr(Pyr):
         self.list_IClamp = []
 
         # run record current soma, defined in Cell()
-        self.record_current_soma()
+        self.record_current_soma(paramrw.recintervals(p)[1])
 
     # insert IClamps in all situations
     # temporarily an external function taking the p dict
@@ -280,6 +280,13 @@ class L5Pyr(Pyr):
         # self.list_dend[6].connect(self.list_dend[5], 1, 0)
         # self.list_dend[7].connect(self.list_dend[5], 1, 0)
 
+    # re-applies the biophysics with the values in p (for NetworkOnNode.update_params)
+    # mechanisms are already inserted, so this only resets their parameters
+    def set_biophys (self, p):
+        self.p_all = paramrw.compare_dictionaries(self.p_all, p)
+        self.__biophys_soma()
+        self.__biophys_dends()
+
     # adds biophysics to soma
     def __biophys_soma(self):
         # set soma biophysics specified in Pyr
@@ -545,10 +552,10 @@ class L5Pyr(Pyr):
     def parreceive_ext(self, type, gid, gid_dict, pos_dict, p_ext):
         if type.startswith(('evprox', 'evdist')):
             if self.celltype in p_ext.keys():
-                gid_ev = gid + gid_dict[type][0]
+                gid_ev, pos_ev = self.evinput_src(type, gid, gid_dict, pos_dict, p_ext)
 
                 nc_dict_ampa = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][0], # index 0 for ampa weight
                     'A_delay': p_ext[self.celltype][2], # index 2 for delay
                     'lamtha': p_ext['lamtha_space'],
@@ -557,7 +564,7 @@ class L5Pyr(Pyr):
                 }
 
                 nc_dict_nmda = {
-                    'pos_src': pos_dict[type][gid],
+                    'pos_src': pos_ev,
                     'A_weight': p_ext[self.celltype][1], # index 1 for nmda weight
                     'A_delay': p_ext[self.celltype][2], # index 2 for delay
                     'lamtha': p_ext['lamtha_space'],
@@ -0,0 +1,79 @@
+# bench_connect.py - time network construction against grid size
+#
+# compares the per-cell parconnect() loops (legacy_connect=True) with the
+# connectivity table in NetworkOnNode and checks both produce the same NetCons
+#
+# usage: nrniv -python bench_connect.py [param file] [N_pyr_x ...]
+#    or: mpiexec -np 4 nrniv -python -mpi bench_connect.py param/default.param 10 20 30
+
+import os
+import sys
+import time
+import numpy as np
+from neuron import h
+h.load_file("stdrun.hoc")
+import network
+import paramrw
+
+pc = h.ParallelContext()
+pcID = int(pc.id())
+
+# NetCon signature of every cell on this node: (post gid, pre gid, weight, delay)
+def getconns (net):
+  lconn = []
+  for cell in net.cells:
+    for key in ['ncfrom_L2Pyr', 'ncfrom_L2Basket', 'ncfrom_L5Pyr', 'ncfrom_L5Basket']:
+      for nc in getattr(cell, key):
+        lconn.append((cell.gid, nc.srcgid(), nc.weight[0], nc.delay))
+  return sorted(lconn)
+
+# builds the network once and returns the max build time across nodes, plus its connections
+def timebuild (p, legacy_connect):
+  pc.barrier()
+  pc.gid_clear()
+  t0 = time.time()
+  net = network.NetworkOnNode(p, legacy_connect=legacy_connect)
+  pc.barrier()
+  tbuild = pc.allreduce(time.time() - t0, 2) # max over nodes
+  lconn = getconns(net)
+  ncell, nconn = net.N_cells, pc.allreduce(len(lconn), 1)
+  del net
+  pc.gid_clear()
+  return tbuild, ncell, nconn, lconn
+
+if __name__ == '__main__':
+  f_psim = os.path.join('param', 'default.param')
+  lgrid = []
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): f_psim = arg
+    elif arg.isdigit(): lgrid.append(int(arg))
+  if not lgrid: lgrid = [10, 15, 20, 30]
+
+  p_exp = paramrw.ExpParams(f_psim)
+  if len(p_exp.expmt_groups) > 0: expmt_group = p_exp.expmt_groups[0]
+  else: expmt_group = None
+  p = p_exp.return_pdict(expmt_group, 0)
+  h.tstop = p['tstop']
+  h.dt = p['dt']
+  h.celsius = p['celsius']
+
+  if pcID == 0:
+    print('nhost: %d, param file: %s' % (int(pc.nhost()), f_psim))
+    print('%8s %8s %10s %12s %12s %8s %6s' % ('N_pyr_x', 'cells', 'netcons', 'legacy (s)', 'table (s)', 'speedup', 'same'))
+
+  for n in lgrid:
+    p['N_pyr_x'] = p['N_pyr_y'] = n
+    tlegacy, ncell, nconn, lconn_legacy = timebuild(p, True)
+    ttable, ncell, nconn, lconn_table = timebuild(p, False)
+    # weights/delays must agree to within floating point rounding on every node
+    same = len(lconn_legacy) == len(lconn_table)
+    if same:
+      a, b = np.array(lconn_legacy), np.array(lconn_table)
+      same = np.array_equal(a[:, :2], b[:, :2]) and np.allclose(a[:, 2:], b[:, 2:], rtol=1e-12, atol=0)
+    same = pc.allreduce(float(same), 3) > 0 # min over nodes
+    if pcID == 0:
+      print('%8d %8d %10d %12.3f %12.3f %8.1f %6s' % (n, ncell, nconn, tlegacy, ttable, tlegacy / ttable, same))
+
+  pc.runworker()
+  pc.done()
+  h.quit()
@@ -0,0 +1,40 @@
+# bench_cvode.py - speed and accuracy of variable step (cvode param) against fixed step runs
+#
+# runs each param file with fixed steps (reference) and with CVODE, and reports the
+# speedup and the error of the normalized dipole against the reference (see simcompare.py)
+#
+# default.param with tstop 40 (1 core): fixed steps take about 21 s; CVODE takes 191 s with
+# atol 1e-1 (5.2% rel. err.), 188 s with 1e-2 (2.3%) and 229 s with 1e-3 (2.8%). no tolerance
+# is faster, so cvode stays off by default
+#
+# usage: python bench_cvode.py [param files, default param/*.param] [ncore=1] [atol=1e-3,1e-4]
+
+import os
+import sys
+import glob
+import simcompare
+
+# returns a list of (param file, atol, error dict) for all files and tolerances
+def bench (lparamf, ncore=1, latol=[1e-3]):
+  lres = []
+  print('%-36s %8s %9s %9s %7s %12s %10s' % ('param file', 'atol', 'fixed s', 'cvode s', 'speedup', 'RMSE nAm', 'rel. err'))
+  for fparam in lparamf:
+    for atol in latol:
+      try:
+        derr = simcompare.compare(fparam, {'cvode': 1, 'cvode_atol': atol}, ncore, dref={'cvode': 0})
+      except RuntimeError as e:
+        print('%-36s %8g failed: %s' % (os.path.basename(fparam), atol, str(e)))
+        continue
+      lres.append((fparam, atol, derr))
+      print('%-36s %8g %9.2f %9.2f %7.2f %12.6f %9.3f%%' % (os.path.basename(fparam), atol, derr['tref'], derr['tcmp'],
+                                                           derr['tref'] / derr['tcmp'], derr['rmse'], 100. * derr['relerr']))
+  return lres
+
+if __name__ == '__main__':
+  lparamf, ncore, latol = [], 1, [1e-3]
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): lparamf.append(arg)
+    elif arg.startswith('ncore='): ncore = int(arg.split('=')[1])
+    elif arg.startswith('atol='): latol = [float(x) for x in arg.split('=')[1].split(',')]
+  if not lparamf: lparamf = sorted(glob.glob(os.path.join('param', '*.param')))
+  bench(lparamf, ncore, latol)
@@ -0,0 +1,41 @@
+# bench_outfmt.py - save and load time of the output tables as text and as .npy
+# (see fileio.write_table), for the dipole files of a run with many trials
+#
+# usage: python bench_outfmt.py [ntrial=100] [tstop=170] [dt=0.025]
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+import numpy as np
+import fileio as fio
+from dipolefn import write_dpl
+
+def bench (ntrial=100, tstop=170., dt=0.025):
+  nt = int(round(tstop / dt)) + 1
+  x = np.column_stack((dt * np.arange(nt), np.random.randn(nt, 3)))
+  tmpdir = tempfile.mkdtemp()
+  lres = []
+  try:
+    for outfmt in ['txt', 'npy']:
+      lf = [os.path.join(tmpdir, '%s_dpl_%d.txt' % (outfmt, i)) for i in range(ntrial)]
+      t0 = time.time()
+      for f in lf: write_dpl(f, x, outfmt)
+      tsave = time.time() - t0
+      t0 = time.time()
+      for f in lf: fio.read_table(f)
+      tload = time.time() - t0
+      lres.append((outfmt, tsave, tload))
+      print('%s: save %.3f s, load %.3f s for %d trials of %d x 4' % (outfmt, tsave, tload, ntrial, nt))
+  finally:
+    shutil.rmtree(tmpdir, ignore_errors=True)
+  return lres
+
+if __name__ == '__main__':
+  ntrial, tstop, dt = 100, 170., 0.025
+  for arg in sys.argv[1:]:
+    if arg.startswith('ntrial='): ntrial = int(arg.split('=')[1])
+    elif arg.startswith('tstop='): tstop = float(arg.split('=')[1])
+    elif arg.startswith('dt='): dt = float(arg.split('=')[1])
+  bench(ntrial, tstop, dt)
@@ -0,0 +1,43 @@
+# bench_solver.py - wall time of the solver layouts (run.py cacheeff, nthread, multisplit)
+# against the default layout, and check that all give the same dipole
+#
+# usage: python bench_solver.py [param file] [ncore=1] [ntrial=1] [threads=2,4]
+#   (each threads value is run alone, with cacheeff and with multisplit)
+
+import os
+import sys
+import simcompare
+
+# run.py arguments of each layout, the first one being the reference
+def layouts (lthread):
+  ll = [('default', ''), ('cacheeff', 'cacheeff')]
+  for n in lthread:
+    if n < 2: continue
+    ll.append(('%d threads' % n, 'nthread %d' % n))
+    ll.append(('%d threads, cacheeff' % n, 'nthread %d cacheeff' % n))
+    ll.append(('%d threads, multisplit' % n, 'nthread %d multisplit' % n))
+  return ll
+
+# runs fparam with each layout on ncore ranks; returns a list of (name, wall time s, dipole error dict)
+def bench (fparam, ncore=1, ntrial=1, lthread=[2, 4]):
+  lres = []
+  dpl_ref = None
+  for name, extra in layouts(lthread):
+    twall, out = simcompare.runsim(fparam, ncore, ntrial, extra)
+    dpl = simcompare.readdpl(fparam)
+    if dpl_ref is None: dpl_ref = dpl
+    derr = simcompare.dplerr(dpl_ref, dpl)
+    lres.append((name, twall, derr))
+    print('%s: %.2f s, speedup %.2f, dipole max abs difference %g nAm' % (name, twall, lres[0][1] / twall, derr['maxerr']))
+  return lres
+
+if __name__ == '__main__':
+  fparam = os.path.join('param', 'default.param')
+  ncore, ntrial, lthread = 1, 1, [2, 4]
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): fparam = arg
+    elif arg.startswith('ncore='): ncore = int(arg.split('=')[1])
+    elif arg.startswith('ntrial='): ntrial = int(arg.split('=')[1])
+    elif arg.startswith('threads='): lthread = [int(x) for x in arg.split('=')[1].split(',')]
+  print('%s: %d trials on %d cores' % (fparam, ntrial, ncore))
+  bench(fparam, ncore, ntrial, lthread)
@@ -0,0 +1,38 @@
+# bench_trials.py - wall time of trial-parallel runs (run.py trialgroups) against the
+# sequential trial loop, and check that both give the same trial-averaged dipole
+#
+# usage: python bench_trials.py [param file] [ncore=4] [ntrial=8] [groups=2,4]
+#   (each groups value must divide ncore; groups=ncore runs one trial per rank)
+
+import os
+import sys
+import simcompare
+
+# runs fparam with ntrial trials on ncore ranks split into each of lgroups trial groups
+# (1: sequential); returns a list of (groups, wall time s, dipole error dict)
+def bench (fparam, ncore=4, ntrial=8, lgroups=[2, 4]):
+  lres = []
+  dpl_ref = None
+  for groups in [1] + [g for g in lgroups if g > 1]:
+    if ncore % groups:
+      print('skipping %d trial groups: does not divide %d cores' % (groups, ncore))
+      continue
+    extra = 'trialgroups %d' % groups if groups > 1 else ''
+    twall, out = simcompare.runsim(fparam, ncore, ntrial, extra)
+    dpl = simcompare.readdpl(fparam)
+    if dpl_ref is None: dpl_ref = dpl
+    derr = simcompare.dplerr(dpl_ref, dpl)
+    lres.append((groups, twall, derr))
+    print('%d trial groups: %.2f s, speedup %.2f, dipole max abs difference %g nAm' % (groups, twall, lres[0][1] / twall, derr['maxerr']))
+  return lres
+
+if __name__ == '__main__':
+  fparam = os.path.join('param', 'default.param')
+  ncore, ntrial, lgroups = 4, 8, [2, 4]
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): fparam = arg
+    elif arg.startswith('ncore='): ncore = int(arg.split('=')[1])
+    elif arg.startswith('ntrial='): ntrial = int(arg.split('=')[1])
+    elif arg.startswith('groups='): lgroups = [int(x) for x in arg.split('=')[1].split(',')]
+  print('%s: %d trials on %d cores' % (fparam, ntrial, ncore))
+  bench(fparam, ncore, ntrial, lgroups)
@@ -10,6 +10,15 @@ from neuron import h
 # global variables, should be node-independent
 h("dp_total_L2 = 0."); h("dp_total_L5 = 0.") # put here since these variables used in cells
 
+# records ref into vec every rdt ms, or every step if rdt is 0 (Vector.record with a
+# sampling interval); sec: section of ref, for threads
+def record (vec, ref, rdt=0., sec=None):
+  if sec is None:
+    if rdt > 0.: vec.record(ref, rdt)
+    else: vec.record(ref)
+  elif rdt > 0.: vec.record(ref, rdt, sec=sec)
+  else: vec.record(ref, sec=sec)
+
 # Units for e: mV
 # Units for gbar: S/cm^2
 
@@ -45,9 +54,10 @@ class Cell ():
       self.ncfrom_extpois = []
       self.ncfrom_ev = []
 
-    def record_volt_soma (self):
+    # rdt: recording interval (ms), 0 records every step
+    def record_volt_soma (self, rdt=0.):
       self.vsoma = h.Vector()
-      self.vsoma.record(self.soma(0.5)._ref_v)
+      record(self.vsoma, self.soma(0.5)._ref_v, rdt)
 
     def get_sections (self): return [self.soma]
 
@@ -157,6 +167,34 @@ class Cell ():
             # set the pp dipole's ztan value to the last value from y_diff
             dpp.ztan = y_diff[-1]
 
+    # piece (0 or 1) of sect when the cell is split at soma(0) (see dipole_cellsum): 0 for
+    # the sections that hang off soma(0), 1 for the soma and the sections off soma(1)
+    def split_piece (self, sect):
+        while sect != self.soma:
+            pseg = sect.parentseg()
+            if pseg.sec == self.soma: return int(pseg.x > 0.)
+            sect = pseg.sec
+        return 1
+
+    # with threads the cells can not all add to dp_total_L2/L5 (see dipole_insert), so
+    # the dipole of this cell is summed into the Qcell of one of its Dipoles and recorded
+    # in dpl_rec. every sum is only written by the mechanisms of one thread: split gives
+    # one sum per piece, for cells split at soma(0) across threads
+    # (ParallelContext.multisplit), where soma(0) carries no dipole mechanism. rdt:
+    # recording interval (ms), 0 every step
+    def dipole_cellsum (self, split=False, rdt=0.):
+        piece = [self.split_piece(sect) if split else 0 for sect in self.list_all]
+        # the sum of each piece is kept by the Dipole of its first section
+        dsum = dict((i, self.dipole_pp[piece.index(i)]) for i in set(piece))
+        for sect, dpp, i in zip(self.list_all, self.dipole_pp, piece):
+            h.setpointer(dsum[i]._ref_Qcell, 'Qtotal', dpp)
+            for seg in sect: h.setpointer(dsum[i]._ref_Qcell, 'Qtotal', seg.dipole)
+        self.dpl_rec = []
+        for i in sorted(dsum):
+            vec = h.Vector()
+            record(vec, dsum[i]._ref_Qcell, rdt)
+            self.dpl_rec.append(vec)
+
     # Add IClamp to a segment
     def insert_IClamp (self, sect_name, props_IClamp):
       # def insert_iclamp(self, sect_name, seg_loc, tstart, tstop, weight):
@@ -177,7 +215,7 @@ class Cell ():
 
     # simple function to record current
     # for now only at the soma
-    def record_current_soma (self):
+    def record_current_soma (self, rdt=0.):
       # a soma exists at self.soma
       self.rec_i = h.Vector()
       try:
@@ -188,7 +226,7 @@ class Cell ():
         # iterate through keys and record currents appropriately
         for key in self.dict_currents:
           self.dict_currents[key] = h.Vector()
-          self.dict_currents[key].record(self.synapses[key]._ref_i)
+          record(self.dict_currents[key], self.synapses[key]._ref_i, rdt)
       except:
         print("Warning in Cell(): record_current_soma() was called, but no self.synapses dict was found")
         pass
@@ -263,6 +301,27 @@ class Cell ():
       
       return nc
 
+    # parallel connect FROM presyn TO postsyn with weight and delay already computed
+    # (see NetworkOnNode connectivity table)
+    def parconnect_gid (self, gid_presyn, postsyn, weight, delay, threshold):
+      nc = self.pc.gid_connect(gid_presyn, postsyn)
+      nc.threshold = threshold
+      nc.weight[0] = weight
+      nc.delay = delay
+      return nc
+
+    # gid and position of the evoked input source for this cell: one source per cell,
+    # or one per rank when the network shares synchronous evoked sources (p_ext['shared'])
+    def evinput_src (self, type, gid, gid_dict, pos_dict, p_ext):
+      if p_ext.get('shared', 0): i = int(self.pc.id())
+      else: i = gid
+      return i + gid_dict[type][0], pos_dict[type][i]
+
+    # synapses live either in self.synapses or as attributes of the cell
+    def get_synapse (self, name):
+      if hasattr(self, 'synapses') and name in self.synapses: return self.synapses[name]
+      return getattr(self, name)
+
     # pardistance function requires pre position, since it is calculated on POST cell
     def __pardistance (self, pos_pre):
       dx = self.pos[0] - pos_pre[0]
@@ -0,0 +1,174 @@
+# ckpt.py - simulation checkpoints with SaveState
+#
+# Checkpoint caches the network state at t = tckpt, keyed by a hash of everything that
+# determines the trajectory up to tckpt: the network params, dt, celsius, the number of
+# ranks, the feed events up to tckpt and the params of the feeds that have them. Later
+# runs and trials with the same key restore that state and only integrate from tckpt.
+# Uses in run.py:
+#   burn-in: tckpt is the settling period the analysis discards anyway ([sim] burnin);
+#     with tckpt before the first input, trials and runs that only differ in their
+#     inputs share the cache
+#   forks: tckpt is the start of an optimization chunk (forkat argument); candidates
+#     only change inputs of the chunk, so they share the simulated prefix
+#
+# the cache is one SaveState file per rank plus the recordings made up to tckpt, under
+# the given directory; it assumes the same compiled mechanisms, delete it after changing them
+
+import os
+import json
+import hashlib
+import time
+import numpy as np
+from neuron import h
+from fileio import safemkdir
+
+# params that do not change the simulated trajectory (output and analysis settings)
+lout_keys = [
+  'sim_prefix', 'tstop', 'N_trials', 'N_sims', 'Run_Date', 'expmt_groups',
+  'save_figs', 'save_spec_data', 'f_max_spec', 'dipole_scalefctr', 'dipole_smooth_win',
+  'prng_seedcore_opt',
+]
+
+# prefixes of the params of the external inputs (see paramrw.create_pext); they enter
+# the key through the feed param dicts of NetworkOnNode instead
+lfeed_prefixes = (
+  't_evprox_', 't_evdist_', 'sigma_t_ev', 'gbar_ev', 'numspikes_ev', 'prng_seedcore_',
+  'input_prox_', 'input_dist_', 'f_input_', 't0_input_', 'tstop_input_', 'f_stdev_',
+  'events_per_cycle_', 'distribution_', 'repeats_', 'sync_evinput', 'inc_evinput',
+  't0_pois', 'T_pois',
+)
+
+def is_feed_key (key):
+  return key.startswith(lfeed_prefixes) or '_Gauss_' in key or '_Pois_' in key
+
+# feed events at or before tmax on this node, as sorted (time, gid)
+def early_events (net, tmax):
+  lev = []
+  for feed in net.get_feeds():
+    times = np.array(feed.eventvec.to_python())
+    lev += [(float(t), feed.gid) for t in times[times <= tmax]]
+  return sorted(lev)
+
+# params of the feeds (by feed type, extinput feeds by index) that have events in lev
+def feed_params (net, lev):
+  dfeed = {}
+  for t, gid in lev:
+    type = net.gid_to_type(gid)
+    if type == 'extinput':
+      ind = gid - net.gid_dict['extinput'][0]
+      dfeed['extinput_%d' % ind] = net.p_ext[ind]
+    else:
+      dfeed[type] = net.p_unique[type]
+  return dfeed
+
+# hash of everything that determines the state at tckpt; lev are the feed events of all ranks
+def ckpt_key (net, tckpt, lev, dextra=None):
+  d = {}
+  for key, val in net.p.items():
+    if key in lout_keys or is_feed_key(key): continue
+    d[key] = val
+  d['__tckpt'] = tckpt
+  d['__dt'] = h.dt
+  d['__celsius'] = h.celsius
+  d['__nhost'] = net.n_hosts
+  d['__loadbal'] = net.loadbal
+  d['__src'] = [(src, len(net.gid_dict[src])) for src in net.src_list_new]
+  d['__events'] = lev
+  d['__feeds'] = feed_params(net, lev)
+  if dextra: d['__extra'] = dextra
+  return hashlib.md5(json.dumps(d, sort_keys=True, default=str).encode()).hexdigest()
+
+class Checkpoint ():
+  # lrec: recorded vectors, the first one recording h.t
+  # dextra: anything else that changes the initial state (e.g. state template file)
+  # label: name of the checkpoint in messages
+  # lrdt: recording interval of each vector of lrec (ms, 0: every step)
+  def __init__ (self, net, lrec, tckpt, cachedir, dextra=None, label='checkpoint', lrdt=None):
+    self.net = net
+    self.lrec = lrec
+    self.lrdt = lrdt if lrdt is not None else [0.] * len(lrec)
+    self.tckpt = tckpt
+    self.cachedir = cachedir
+    self.dextra = dextra
+    self.label = label
+    self.lpre = []
+    self.spk_pre = np.zeros((0, 2))
+
+  def __fname (self, ext):
+    return os.path.join(self.cachedir, '%s_%d.%s' % (self.key, self.net.rank, ext))
+
+  # brings the network from h.finitialize() to tckpt: restores the cached state if every
+  # rank has it, otherwise integrates and saves it. recordings restart at tckpt (call
+  # h.frecord_init() next) and finish() puts the earlier recordings back in front
+  # must be called on all ranks; returns True when the state came from the cache
+  def run (self):
+    pc = self.net.pc
+    lev = sorted(sum(pc.py_allgather(early_events(self.net, self.tckpt)), []))
+    self.key = ckpt_key(self.net, self.tckpt, lev, self.dextra)
+    dat = None
+    if os.path.exists(self.__fname('dat')) and os.path.exists(self.__fname('npz')):
+      try:
+        dat = np.load(self.__fname('npz'))
+        if int(dat['nrec']) != len(self.lrec): dat = None
+      except:
+        dat = None
+    if pc.allreduce(float(dat is not None), 3) > 0: # min over ranks
+      self.__restore(dat)
+      return True
+    self.__save()
+    return False
+
+  def __restore (self, dat):
+    t0 = time.time()
+    ss = h.SaveState()
+    f = h.File()
+    f.ropen(self.__fname('dat'))
+    ss.fread(f)
+    ss.restore()
+    if h.cvode.active(): h.cvode.re_init()
+    for feed in self.net.get_feeds(): feed.restart()
+    self.lpre = [dat['rec_%d' % i] for i in range(len(self.lrec))]
+    self.spk_pre = dat['spk']
+    trestore = self.net.pc.allreduce(time.time() - t0, 2)
+    if self.net.rank == 0:
+      print('%s: restored t=%g ms from cache in %.3f s (integrating it took %.3f s)' % (self.label, h.t, trestore, float(dat['twall'])))
+
+  def __save (self):
+    pc = self.net.pc
+    t0 = time.time()
+    pc.psolve(self.tckpt)
+    twall = pc.allreduce(time.time() - t0, 2)
+    # points before h.t; the point at h.t is recorded again after h.frecord_init()
+    tvec = np.array(self.lrec[0].to_python())
+    npre = int((tvec < h.t - 0.5 * h.dt).sum())
+    # vectors recorded every rdt ms: the points at 0, rdt, ... before h.t
+    lnpre = [int(np.ceil((h.t - 0.5 * h.dt) / rdt)) if rdt > 0. else npre for rdt in self.lrdt]
+    self.lpre = [np.array(vec.to_python())[:n] for vec, n in zip(self.lrec, lnpre)]
+    self.spk_pre = np.column_stack((self.net.spiketimes.to_python(), self.net.spikegids.to_python()))
+    self.net.spiketimes.resize(0)
+    self.net.spikegids.resize(0)
+    if self.net.rank == 0: safemkdir(self.cachedir)
+    pc.barrier()
+    ss = h.SaveState()
+    ss.save()
+    # write under temporary names so a concurrent run (or trial group) never reads or
+    # writes a partial file
+    tmp = '.%d.tmp' % os.getpid()
+    f = h.File()
+    f.wopen(self.__fname('dat' + tmp))
+    ss.fwrite(f)
+    f.close()
+    darr = dict(('rec_%d' % i, pre) for i, pre in enumerate(self.lpre))
+    with open(self.__fname('npz' + tmp), 'wb') as fp:
+      np.savez(fp, twall=twall, nrec=len(self.lrec), spk=self.spk_pre.reshape(-1, 2), **darr)
+    os.replace(self.__fname('dat' + tmp), self.__fname('dat'))
+    os.replace(self.__fname('npz' + tmp), self.__fname('npz'))
+    if self.net.rank == 0: print('%s: saved t=%g ms to cache (integration took %.3f s)' % (self.label, h.t, twall))
+
+  # puts the recordings and spikes up to tckpt in front of the ones made after run()
+  def finish (self):
+    for vec, pre in zip(self.lrec, self.lpre):
+      if len(pre): vec.insrt(0, h.Vector(pre))
+    if len(self.spk_pre):
+      self.net.spiketimes.insrt(0, h.Vector(self.spk_pre[:, 0]))
+      self.net.spikegids.insrt(0, h.Vector(self.spk_pre[:, 1]))
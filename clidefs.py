@@ -139,7 +139,7 @@ def exec_welch_max(ddata, opts):
     # iterate through dipoles
     for fdpl, fparam in zip(list_dpl, list_param):
         # grab the dt (needed for the Welch)
-        dt = paramrw.find_param(fparam, 'dt')
+        dt = paramrw.recdt(fparam) # sample interval of the recordings
 
         # grab the dipole
         dpl = dipolefn.Dipole(fdpl)
@@ -701,7 +701,7 @@ def exec_dipolemin(ddata, expmt_group, n_sim, n_trial, t_interval):
     # assume just the first file
     fdpl = [file for file in dpl_list if trial_prefix in file][0]
 
-    data = np.loadtxt(open(fdpl, 'r'))
+    data = fio.read_table(fdpl)
     t_vec = data[:, 0]
     data_dpl = data[:, 1]
 
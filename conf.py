@@ -26,6 +26,20 @@ homeout = 1
 [sim]
 simf = run.py
 paramf = param/default.param
+loadbal = 0
+loadbalf =
+stateinit =
+burnin = 0
+spkfmt = txt
+server = 0
+serverport = 5005
+trialgroups = 0
+outfmt = txt
+streamwin = 0
+vsomafmt = float64
+nthread = 1
+cacheeff = 0
+multisplit = 0
 [draw]
 drawindivdpl = 1
 drawindivrast = 1
@@ -36,6 +50,9 @@ tstop = Simulation duration; Evoked response simulations typically take 170 ms w
 dt = Simulation timestep - shorter timesteps mean more accuracy but longer runtimes.
 [opt]
 decay_multiplier = 1.6
+fork = 0
+abort = 0
+abortfac = 1.0
 """
 
 # parameter used for optimization
@@ -128,6 +145,20 @@ def readconf (fn="hnn.cfg",nohomeout=False):
 
   d['simf'] = confstr('sim','simf','run.py')
   d['paramf'] = confstr('sim','paramf',os.path.join('param','default.param'))
+  d['loadbal'] = confint('sim','loadbal',0) # 0 round-robin gid assignment, 1 cost-weighted
+  d['loadbalf'] = confstr('sim','loadbalf','') # optional measured cost profile (see loadbal.py)
+  d['stateinit'] = confstr('sim','stateinit','') # optional full-state templates (see statetemplate.py)
+  d['burnin'] = conffloat('sim','burnin',0.0) # ms of burn-in to cache with SaveState, 0 off (see ckpt.py)
+  d['spkfmt'] = confstr('sim','spkfmt','txt') # spike files: txt, npy (binary) or both (see spikefn.write_spikes)
+  d['outfmt'] = confstr('sim','outfmt','txt') # dipole and current files: txt, npy or both (see fileio.write_table)
+  d['streamwin'] = conffloat('sim','streamwin',0.0) # > 0: stream the recordings to disk every this many ms (see recstream.py)
+  d['vsomafmt'] = confstr('sim','vsomafmt','float64') # somatic voltage shards: float64 or float32 (see vsomastore.py)
+  d['simserver'] = confint('sim','server',0) # GUI runs simulations on a persistent server (see simserver.py)
+  d['serverport'] = confint('sim','serverport',5005)
+  d['trialgroups'] = confint('sim','trialgroups',0) # > 1: run the trials in parallel on groups of ranks
+  d['nthread'] = confint('sim','nthread',1) # threads per rank (pc.nthread)
+  d['cacheeff'] = confint('sim','cacheeff',0) # 1: cache efficient memory layout (cvode.cache_efficient)
+  d['multisplit'] = confint('sim','multisplit',0) # 1: split pyramidal cells at the soma across threads
 
 
   # dbase - optional config setting to change base output directory
@@ -166,6 +197,9 @@ def readconf (fn="hnn.cfg",nohomeout=False):
   d['fontsize'] = confint("draw","fontsize",0)
 
   d['decay_multiplier'] = conffloat('opt','decay_multiplier',1.6)
+  d['optfork'] = confint('opt','fork',0) # share the simulated prefix of an optimization step (see ckpt.py)
+  d['optabort'] = confint('opt','abort',0) # stop optimization runs that can not beat the best error (see earlyabort.py)
+  d['optabortfac'] = conffloat('opt','abortfac',1.0) # stop when the error bound exceeds abortfac * best error
 
   readtips(d) # read tooltips for parameters
 
@@ -4,7 +4,7 @@
 # rev 2013-11-19 (SL: added simple convert function)
 # last major: (SL: added layers for plot to axis command)
 
-import numpy as np
+import fileio as fio
 
 class SynapticCurrent():
     def __init__(self, fcurrent):
@@ -12,7 +12,7 @@ class SynapticCurrent():
 
     # parses the input file
     def __parse_f(self, fcurrent):
-        x = np.loadtxt(open(fcurrent, 'r'))
+        x = fio.read_table(fcurrent)
         self.t = x[:, 0]
 
         # this really should be a dictionary
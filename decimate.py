@@ -0,0 +1,77 @@
+# decimate.py - anti-aliased decimation of the recordings (param record_dt with record_aa)
+#
+# the dipoles and somatic currents are recorded every dt step and reduced across ranks;
+# a Decimator low-pass filters them below the Nyquist frequency of record_dt and keeps
+# every q-th row. rows can arrive in chunks (the windows of a streamed run, see
+# recstream.py): the filter state is carried over, so chunked and whole runs agree
+
+import numpy as np
+
+# low-pass FIR taps for decimation by q: hamming windowed sinc with the cutoff at 0.8 of
+# the new Nyquist frequency, 2*hw+1 taps, unity gain at 0 Hz
+def lowpass_taps (q, hw=None):
+  if hw is None: hw = 4 * q
+  n = np.arange(-hw, hw + 1)
+  fc = 0.4 / q # cycles per input row
+  taps = 2. * fc * np.sinc(2. * fc * n) * np.hamming(2 * hw + 1)
+  return taps / taps.sum()
+
+class Decimator ():
+  # output row k is the filtered input at row k*q (centered filter, no delay), the ends
+  # of the signal are extended with the first and last rows. columns in lpick (time)
+  # are picked, not filtered
+  def __init__ (self, q, lpick=(0,), hw=None):
+    self.q = q
+    self.lpick = list(lpick)
+    self.taps = lowpass_taps(q, hw)
+    self.hw = len(self.taps) // 2
+    self.buf = None # input rows not used up yet; buf[0] is input row i0
+    self.i0 = 0
+    self.nin = self.nout = 0
+
+  # output rows nout..kmax-1
+  def __emit (self, kmax):
+    lk = np.arange(self.nout, kmax)
+    y = np.zeros((len(lk), self.buf.shape[1]))
+    if len(lk):
+      c = lk * self.q - self.i0 # centers in buf
+      for col in range(self.buf.shape[1]):
+        if col in self.lpick:
+          y[:, col] = self.buf[c, col]
+        else: # only the rows these outputs need
+          seg = self.buf[c[0] - self.hw:c[-1] + self.hw + 1, col]
+          y[:, col] = np.convolve(seg, self.taps, 'valid')[c - c[0]]
+      self.nout = kmax
+    drop = self.nout * self.q - self.hw - self.i0
+    if drop > 0:
+      self.buf = self.buf[drop:]
+      self.i0 += drop
+    return y
+
+  # adds the rows of x (n x ncol); returns the output rows that are complete
+  def push (self, x):
+    x = np.asarray(x, dtype='float64')
+    x = x.reshape(len(x), -1)
+    if self.buf is None:
+      if not len(x): return np.zeros((0, x.shape[1]))
+      self.buf = np.concatenate((np.repeat(x[:1], self.hw, 0), x))
+      self.i0 = -self.hw
+    else:
+      self.buf = np.concatenate((self.buf, x))
+    self.nin += len(x)
+    # output k needs the input rows up to k*q + hw
+    kmax = (self.nin - 1 - self.hw) // self.q + 1 if self.nin > self.hw else 0
+    return self.__emit(max(kmax, self.nout))
+
+  # the remaining output rows, up to the last input row
+  def finish (self):
+    if self.buf is None: return np.zeros((0, 1))
+    self.buf = np.concatenate((self.buf, np.repeat(self.buf[-1:], self.hw, 0)))
+    return self.__emit((self.nin - 1) // self.q + 1)
+
+# decimates the rows of x by q in one go
+def decimate (x, q, lpick=(0,)):
+  if q <= 1: return np.asarray(x)
+  dec = Decimator(q, lpick)
+  y = dec.push(x)
+  return np.concatenate((y, dec.finish().reshape(-1, y.shape[1])))
@@ -17,17 +17,22 @@ from filt import boxfilt, hammfilt, emptyfilt
 
 # class Dipole() is for a single set of f_dpl and f_param
 class Dipole():
-    def __init__(self, f_dpl): # fix to allow init from data in memory (not disk)
+    def __init__(self, f_dpl):
         """ some usage: dpl = Dipole(file_dipole, file_param)
             this gives dpl.t and dpl.dpl
+            f_dpl can also be an array in memory with the columns of the file
+            (t, agg, L2, L5); the dipoles are copied from it
         """
         self.units = None
         self.N = None
         self.__parse_f(f_dpl)
 
-    # opens the file and sets units
+    # opens the file (or takes the array) and sets units
     def __parse_f(self, f_dpl):
-        x = np.loadtxt(open(f_dpl, 'r'))
+        if isinstance(f_dpl, np.ndarray):
+            x = np.array(f_dpl, dtype='float64')
+        else:
+            x = fio.read_table(f_dpl)
         # better implemented as a dict
         self.t = x[:, 0]
         self.dpl = {
@@ -69,11 +74,18 @@ class Dipole():
       for key in self.dpl.keys(): self.dpl[key] *= fctr
       return fctr
 
+    # winsz: window in samples
     def smooth (self, winsz):
       if winsz <= 1: return 
       #for key in self.dpl.keys(): self.dpl[key] = boxfilt(self.dpl[key],winsz)
       for key in self.dpl.keys(): self.dpl[key] = hammfilt(self.dpl[key],winsz)
 
+    # smooths with a window of winms ms at the sample interval of the dipole (the
+    # recording interval, record_dt, of the simulation)
+    def smooth_ms (self, winms):
+      if self.N < 2: return
+      self.smooth(winms / (self.t[1] - self.t[0]))
+
     # average stationary dipole over a time window
     def mean_stationary(self, opts_input={}):
         # opts is default AND input to below, can be modified by opts_input
@@ -145,11 +157,15 @@ class Dipole():
 
     # ext function to renormalize
     # this function changes in place but does NOT write the new values to the file
+    # f_param is a param file or a param dict
     def baseline_renormalize(self, f_param):
         # only baseline renormalize if the units are fAm
         if self.units == 'fAm':
-            N_pyr_x = paramrw.find_param(f_param, 'N_pyr_x')
-            N_pyr_y = paramrw.find_param(f_param, 'N_pyr_y')
+            if isinstance(f_param, dict):
+                N_pyr_x, N_pyr_y = f_param['N_pyr_x'], f_param['N_pyr_y']
+            else:
+                N_pyr_x = paramrw.find_param(f_param, 'N_pyr_x')
+                N_pyr_y = paramrw.find_param(f_param, 'N_pyr_y')
             # N_pyr cells in grid. This is PER LAYER
             N_pyr = N_pyr_x * N_pyr_y
             # dipole offset calculation: increasing number of pyr cells (L2 and L5, simultaneously)
@@ -188,13 +204,13 @@ class Dipole():
 
     # function to write to a file!
     # f_dpl must be fully specified
-    def write(self, f_dpl):
-        with open(f_dpl, 'w') as f:
-            for t, x_agg, x_L2, x_L5 in zip(self.t, self.dpl['agg'], self.dpl['L2'], self.dpl['L5']):
-                f.write("%03.3f\t" % t)
-                f.write("%9.8f\t" % x_agg)
-                f.write("%9.8f\t" % x_L2)
-                f.write("%9.8f\n" % x_L5)
+    def write(self, f_dpl, outfmt='txt'):
+        write_dpl(f_dpl, np.column_stack((self.t, self.dpl['agg'], self.dpl['L2'], self.dpl['L5'])), outfmt)
+
+# writes x (columns t, agg, L2, L5) in the format of the dipole files, in one go
+# outfmt: 'txt', 'npy' or 'both' (see fileio.write_table)
+def write_dpl(f_dpl, x, outfmt='txt'):
+    fio.write_table(f_dpl, x, ['%03.3f', '%9.8f', '%9.8f', '%9.8f'], outfmt)
 
 # throwaway save method for now - see note
 def dpl_convert_and_save(ddata, i=0, j=0):
@@ -0,0 +1,99 @@
+# earlyabort.py - stop optimization runs whose error can no longer beat the best one
+#
+# for an optimization step the GUI writes the target (external dipoles, weights, time
+# range) and the best error so far to a .npz file and passes it to run.py (abort <file>).
+# run.py then integrates in segments, and after each one computes the weighted RMSE of
+# the finished part of the normalized dipole as simdat.weighted_rmse does, but divided by
+# the weights of the whole time range. the squared errors of the rest of the run only add
+# to it, so it is a lower bound on the final error (up to the resampling done by
+# weighted_rmse); once it exceeds the best error the run stops and rank 0 writes the
+# bound to aborted.txt in the output directory instead of the outputs. the output tables
+# of an earlier run there (dipoles, currents, spikes) are removed, so they are not read
+# as the outputs of the aborted run
+
+import os
+import numpy as np
+from neuron import h
+from dipolefn import Dipole
+import decimate
+
+fabort = 'aborted.txt'
+tseg = 10. # ms integrated between checks
+
+# ldat: external dipoles (columns t, dipole, ...); weights: one per recorded sample (every
+# paramrw.recdt ms) from 0 ms
+def write_target (fname, ldat, weights, tstart, tstop, besterr):
+  darr = dict(('dat_%d' % i, dat) for i, dat in enumerate(ldat))
+  np.savez(fname, ndat=len(ldat), weights=weights, tstart=tstart, tstop=tstop, besterr=besterr, **darr)
+
+# (bound, t) of an aborted run in ddir, or None if the last run finished
+def read_aborted (ddir):
+  fname = os.path.join(ddir, fabort)
+  if not os.path.isfile(fname): return None
+  with open(fname, 'r') as fp: sp = fp.read().split()
+  return float(sp[0]), float(sp[1])
+
+class ErrorBound ():
+  # dt: sample interval of the weights
+  def __init__ (self, fname, p, dt):
+    dat = np.load(fname)
+    self.ldat = [dat['dat_%d' % i] for i in range(int(dat['ndat']))]
+    self.weights = dat['weights']
+    self.tstart = float(dat['tstart'])
+    self.tstop = float(dat['tstop'])
+    self.besterr = float(dat['besterr'])
+    self.p = p
+    self.dt = dt
+    # normalization of the final error: the weights of the whole range
+    self.wsum = self.weights[self.__index(self.tstart):self.__index(self.tstop)].sum()
+    self.halfwin = 0.5 * p['dipole_smooth_win'] # ms at the edges that smoothing still changes
+
+  def __index (self, t):
+    return min(int(round(t / self.dt)), len(self.weights))
+
+  # lower bound on the final error from the raw dipoles recorded so far (fAm)
+  def bound (self, t, L2, L5):
+    if self.wsum <= 0. or not self.ldat or not len(t): return 0.
+    # smoothing a record shorter than its window (filt.hammfilt) gives the window's length
+    if t[-1] - t[0] < self.p['dipole_smooth_win']: return 0.
+    # recorded every step (record_aa): decimated to the grid of the weights first, like
+    # the saved dipole (see run.savedat)
+    q = int(round(self.dt / (t[1] - t[0]))) if len(t) > 1 else 1
+    if q > 1:
+      i0 = int(np.argmax(np.round(t / (t[1] - t[0])).astype(int) % q == 0)) # first point on the grid
+      t, L2, L5 = decimate.decimate(np.column_stack((t, L2, L5))[i0:], q).T
+    dpl = Dipole(np.column_stack((t, L2 + L5, L2, L5)))
+    dpl.baseline_renormalize(self.p)
+    dpl.convert_fAm_to_nAm()
+    dpl.scale(self.p['dipole_scalefctr'])
+    dpl.smooth_ms(self.p['dipole_smooth_win'])
+    t0 = self.tstart
+    if t[0] > 0.: t0 = max(t0, t[0] + self.halfwin) # recordings restarted at a checkpoint
+    sel = (t >= t0) & (t < min(self.tstop, t[-1] - self.halfwin))
+    if not sel.any(): return 0.
+    w = self.weights[np.minimum(np.round(t[sel] / self.dt).astype(int), len(self.weights) - 1)]
+    lerr = []
+    for dat in self.ldat:
+      for c in range(1, dat.shape[1]):
+        dpl2 = np.interp(t[sel], dat[:, 0], dat[:, c])
+        lerr.append(np.sqrt((w * (dpl.dpl['agg'][sel] - dpl2) ** 2).sum() / self.wsum))
+    return np.mean(lerr)
+
+  # pc.psolve(tstop) in segments; must be called on all ranks. returns the error bound if
+  # the run was stopped (on all ranks), None if it reached tstop
+  def psolve (self, pc, tstop, t_vec, dp_rec_L2, dp_rec_L5, stream=None):
+    lt, lL2, lL5 = [], [], []
+    while h.t < tstop:
+      i0 = sum(len(x) for x in lt)
+      pc.psolve(min(h.t + tseg, tstop))
+      if stream is not None: stream.tick() # progress record (see progress.py)
+      # summed dipoles of the new part only
+      L2, L5 = h.Vector(dp_rec_L2.as_numpy()[i0:]), h.Vector(dp_rec_L5.as_numpy()[i0:])
+      pc.allreduce(L2, 1); pc.allreduce(L5, 1)
+      lt.append(t_vec.as_numpy()[i0:].copy()); lL2.append(L2.as_numpy().copy()); lL5.append(L5.as_numpy().copy())
+      if h.t >= self.tstop + self.halfwin: continue # the rest does not change the error
+      err = 0.
+      if int(pc.id()) == 0: err = self.bound(np.concatenate(lt), np.concatenate(lL2), np.concatenate(lL5))
+      err = pc.allreduce(err, 2) # rank 0 decides for all
+      if err > self.besterr: return err
+    return None
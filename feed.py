@@ -8,10 +8,130 @@ import numpy as np
 import itertools as it # this used?
 from neuron import h
 
+# number of wait times to draw per block: expected count over the interval plus a margin
+def pois_blocksize (lamtha, tinterval):
+  n = max(lamtha * tinterval / 1000., 0.)
+  return int(n + 5. * np.sqrt(n)) + 16
+
+# Poisson event times in [t0, T) starting from t_gen, with rate lamtha in Hz
+# wait times come from the cdf of the exp wait time distribution, in ms
+# wait times are drawn in blocks and accumulated with cumsum; the prng stream and the
+# sequential sums are the same as drawing and adding one wait time at a time, so the
+# result is identical to the original per-event loop
+def pois_times (prng, lamtha, t_gen, t0, T):
+  lval = []
+  nblock = pois_blocksize(lamtha, T - t_gen)
+  while t_gen < T:
+    t_wait = -1000. * np.log(1. - prng.rand(nblock)) / lamtha
+    t_cum = np.cumsum(np.append(t_gen, t_wait))[1:]
+    # the per-event loop stops at the first time >= T
+    iend = np.searchsorted(t_cum >= T, True)
+    if iend < len(t_cum): t_cum = t_cum[:iend+1]
+    t_gen = t_cum[-1]
+    lval.append(t_cum[(t_cum >= t0) & (t_cum < T)])
+  if lval: return np.concatenate(lval)
+  return np.array([])
+
+# generates the event times of one unique feed type (extpois, extgauss, evprox*, evdist*)
+# for every cell with vectorized draws from one prng stream per feed type (feed_batch mode)
+# the stream does not depend on the gid or number of ranks, so results are reproducible
+# across nhost, but they are not the same as the per-gid streams of ParFeedAll
+class ParFeedBatch ():
+  # lcelltype is the cell type of each cell gid (index = cell gid)
+  # gid_start is the first gid of this feed type (feed gid = gid_start + cell gid)
+  def __init__ (self, ty, p_ext, lcelltype, gid_start):
+    self.ty = ty
+    self.p_ext = p_ext
+    self.lcelltype = np.array(lcelltype)
+    self.gid_start = gid_start
+    self.times = {}
+    self.set_prng()
+    self.set_event_times()
+
+  def inc_prng (self, inc):
+    self.seed += inc
+    self.prng = np.random.RandomState(self.seed)
+
+  def set_prng (self, seed = None):
+    if seed is None: self.seed = self.p_ext['prng_seedcore']
+    else: self.seed = seed
+    self.prng = np.random.RandomState(self.seed)
+
+  # event times of feed gid
+  def get_times (self, gid):
+    return self.times.get(gid - self.gid_start, np.array([]))
+
+  # cell types in order of first gid, so draws happen in a fixed order
+  def __celltypes (self):
+    lty = []
+    for ty in self.lcelltype:
+      if ty not in lty: lty.append(ty)
+    return lty
+
+  def set_event_times (self, inc_evinput = 0.0):
+    self.times = {}
+    for celltype in self.__celltypes():
+      if celltype not in self.p_ext.keys(): continue
+      lgid = np.flatnonzero(self.lcelltype == celltype)
+      if self.ty == 'extpois':
+        self.__create_extpois(celltype, lgid)
+      elif self.ty == 'extgauss':
+        self.__create_extgauss(celltype, lgid)
+      elif self.ty.startswith(('evprox', 'evdist')):
+        self.__create_evoked(celltype, lgid, inc_evinput)
+
+  # keeps positive values of each row, sorted, as the times of the corresponding gid
+  def __store_rows (self, lgid, vals):
+    vals = np.sort(vals, axis=1)
+    for gid, row in zip(lgid, vals): self.times[int(gid)] = row[row > 0]
+
+  def __create_extpois (self, celltype, lgid):
+    if self.p_ext[celltype][0] <= 0.0 and self.p_ext[celltype][1] <= 0.0: return
+    t0, T = self.p_ext['t_interval']
+    lamtha = self.p_ext[celltype][3]
+    if lamtha <= 0.: return
+    t_start = t0 - lamtha * 2
+    nblock = pois_blocksize(lamtha, T - t_start)
+    # cumulative wait times of every cell at once, extended by blocks until all rows pass T
+    t_gen = np.full(len(lgid), t_start)
+    active = np.arange(len(lgid))
+    lblock = []
+    while len(active):
+      t_wait = -1000. * np.log(1. - self.prng.rand(len(active), nblock)) / lamtha
+      t_cum = t_gen[active, np.newaxis] + np.cumsum(t_wait, axis=1)
+      lblock.append((active, t_cum))
+      t_gen[active] = t_cum[:, -1]
+      active = active[t_cum[:, -1] < T]
+    lval = [[] for gid in lgid]
+    for active, t_cum in lblock:
+      for i, row in zip(active, t_cum): lval[i].append(row[(row >= t0) & (row < T)])
+    for gid, lrow in zip(lgid, lval): self.times[int(gid)] = np.concatenate(lrow)
+
+  def __create_extgauss (self, celltype, lgid):
+    if self.p_ext[celltype][0] <= 0.0 and self.p_ext[celltype][1] <= 0.0: return
+    mu = self.p_ext[celltype][3]
+    sigma = self.p_ext[celltype][4]
+    self.__store_rows(lgid, self.prng.normal(mu, sigma, (len(lgid), 50)))
+
+  def __create_evoked (self, celltype, lgid, inc):
+    mu = self.p_ext['t0'] + inc
+    sigma = self.p_ext[celltype][3]
+    numspikes = int(self.p_ext['numspikes'])
+    if not sigma:
+      vals = np.full((len(lgid), numspikes), mu)
+    elif self.p_ext['sync_evinput']:
+      # synchronous inputs: all cells share one draw
+      vals = np.tile(self.prng.normal(mu, sigma, numspikes), (len(lgid), 1))
+    else:
+      vals = self.prng.normal(mu, sigma, (len(lgid), numspikes))
+    self.__store_rows(lgid, vals)
+
 class ParFeedAll ():
   # p_ext has a different structure for the extinput
   # usually, p_ext is a dict of cell types
-  def __init__ (self, ty, celltype, p_ext, gid):
+  # batch (optional) is a ParFeedBatch that generates the event times of this feed type
+  # for all cells at once; otherwise times come from this feed's own per-gid prng
+  def __init__ (self, ty, celltype, p_ext, gid, batch=None):
     #print("ParFeedAll __init__")
     # VecStim setup
     self.eventvec = h.Vector()
@@ -21,6 +141,7 @@ class ParFeedAll ():
     self.celltype = celltype
     self.ty = ty # feed type
     self.gid = gid
+    self.batch = batch
     self.set_prng() # sets seeds for random num generator
     self.set_event_times() # sets event times into self.eventvec and plays into self.vs (VecStim)
 
@@ -57,7 +178,10 @@ class ParFeedAll ():
   def set_event_times (self, inc_evinput = 0.0):
     # print('self.p_ext:',self.p_ext)
     # each of these methods creates self.eventvec for playback
-    if self.ty == 'extpois':
+    if self.batch is not None:
+      # times already generated (for the current trial) by the batch
+      self.eventvec.from_python(self.batch.get_times(self.gid))
+    elif self.ty == 'extpois':
       self.__create_extpois()
     elif self.ty.startswith(('evprox', 'evdist')):
       self.__create_evoked(inc_evinput)
@@ -68,10 +192,12 @@ class ParFeedAll ():
     # load eventvec into VecStim object
     self.vs.play(self.eventvec)
 
-  # based on cdf for exp wait time distribution from unif [0, 1)
-  # returns in ms based on lamtha in Hz
-  def __t_wait (self, lamtha):
-    return -1000. * np.log(1. - self.prng.rand()) / lamtha
+  # continues playing eventvec from the current time h.t, e.g. after a SaveState restore:
+  # earlier events are skipped and the VecStim's self-events from the saved state are ignored
+  def restart (self):
+    self.vs.play(self.eventvec)
+    if not hasattr(self, 'nc_restart'): self.nc_restart = h.NetCon(None, self.vs)
+    self.nc_restart.event(h.t)
 
   # new external pois designation
   def __create_extpois (self):
@@ -85,13 +211,8 @@ class ParFeedAll ():
     # values MUST be sorted for VecStim()!
     # start the initial value
     if lamtha > 0.:
-      val_pois = np.array([])      
       t_gen = t0 - lamtha * 2 # start before t0 to remove artifact of lower event rate at start of period
-      while t_gen < T:
-        t_gen += self.__t_wait(lamtha) # move forward by the wait time (so as to not clobber base off of t_gen)
-        if t_gen >= t0 and t_gen < T: # make sure event time is within the specified interval
-          # vals are guaranteed to be monotonically increasing, no need to sort
-          val_pois = np.append(val_pois, t_gen) 
+      val_pois = pois_times(self.prng, lamtha, t_gen, t0, T)
     else:
       val_pois = np.array([])
     # checks the distribution stats
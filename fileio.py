@@ -6,6 +6,7 @@
 
 import datetime, fnmatch, os, shutil, sys
 import subprocess, multiprocessing
+import threading, queue, time
 import numpy as np
 import paramrw
 
@@ -31,6 +32,9 @@ class SimulationPaths ():
                         'figspec': 'spec.png',
                         'figspk': 'spk.png',
                         'param': 'param.txt',
+                        'vsoma': 'vsoma.json',
+                        'gidreg': 'gidreg.npz',
+                        'lfp': 'lfp.txt',
                       }
     # empty until a sim is created or read
     self.fparam = None
@@ -68,6 +72,7 @@ class SimulationPaths ():
     self.expmt_groups = expmt_groups
     # prefix for these simulations in both filenames and directory in ddate
     self.sim_prefix = sim_prefix
+    self.trial_prefix_str = self.sim_prefix + "-%03d-T%02d"
     # create date and sim directories if necessary
     self.ddate = self.__datedir()
     self.dsim = self.__simdir()
@@ -165,6 +170,11 @@ class SimulationPaths ():
     f_datatype = [f for f in f_list if trial_prefix in f][0]
     return f_datatype
 
+  # file of one sim and trial of an expmt_group, in the datatype directory (see create_dirs)
+  def create_sim_filename (self, expmt_group, key, n_sim, n_trial):
+    fname_short = (self.trial_prefix_str % (n_sim, n_trial)) + '-' + self.__datatypes[key]
+    return os.path.join(self.dexpmt_dict[expmt_group], key, fname_short)
+
   # requires dict lookup
   def create_filename (self, expmt_group, key):
     d = self.__simdir()
@@ -188,8 +198,11 @@ class SimulationPaths ():
     if os.path.exists(ddata):
       for root, dirnames, filenames in os.walk(ddata):
         for fname in fnmatch.filter(filenames, '*'+fext): file_list.append(os.path.join(root, fname))
+        # tables written only as .npy, by their text names (see write_table)
+        if fext.endswith('.txt'):
+          for fname in fnmatch.filter(filenames, '*'+npyname(fext)): file_list.append(os.path.join(root, fname[:-4] + '.txt'))
     # sort file list? untested
-    file_list.sort()
+    file_list = sorted(set(file_list))
     return file_list
 
   def exp_files_of_type (self, datatype):
@@ -200,6 +213,74 @@ class SimulationPaths ():
     for key in d: d[key] = [file for file in self.filelists[datatype] if key in file.split("/")[-1]]
     return d
 
+# output tables (dipoles, currents, spikes) are written as text, as a binary .npy next to
+# the text file name, or both ([sim] outfmt and spkfmt in conf.py). writing one format
+# removes the other's file from an earlier run, so both hold the same table when both exist.
+# readers pass the text file name and get the .npy version if there is one
+def npyname (fname):
+  return os.path.splitext(fname)[0] + '.npy'
+
+# writes the 2D array x in one go; fmt: np.savetxt formats; outfmt: 'txt', 'npy' or 'both'
+def write_table (fname, x, fmt, outfmt='txt'):
+  x = np.asarray(x, dtype='float64')
+  if outfmt in ('txt', 'both'):
+    with open(fname, 'wb') as fp: np.savetxt(fp, x, fmt=fmt, delimiter='\t')
+  elif os.path.isfile(fname): os.remove(fname)
+  if outfmt in ('npy', 'both'):
+    np.save(npyname(fname), x)
+  elif os.path.isfile(npyname(fname)): os.remove(npyname(fname))
+
+# reads a table written by write_table; mmap: memory-map a .npy version (read only)
+def read_table (fname, mmap=False):
+  fnpy = npyname(fname)
+  if os.path.isfile(fnpy):
+    return np.load(fnpy, mmap_mode='r' if mmap else None)
+  if os.stat(fname).st_size == 0: return np.zeros(0)
+  return np.loadtxt(fname)
+
+# table fname exists as text or .npy
+def table_exists (fname):
+  return os.path.isfile(fname) or os.path.isfile(npyname(fname))
+
+# removes table fname in both formats
+def remove_table (fname):
+  for f in [fname, npyname(fname)]:
+    if os.path.isfile(f): os.remove(f)
+
+# runs output writes (func, args) in a background thread, in the order they were submitted
+class AsyncWriter ():
+  # ontask: optional function called with the wall time (s) of each finished write
+  def __init__ (self, ontask=None):
+    self.q = queue.Queue()
+    self.thread = None
+    self.ontask = ontask
+    self.error = None # first failed write since the last join
+
+  def submit (self, func, *args):
+    if self.thread is None:
+      self.thread = threading.Thread(target=self.__run, daemon=True)
+      self.thread.start()
+    self.q.put((func, args))
+
+  def __run (self):
+    while True:
+      func, args = self.q.get()
+      t0 = time.time()
+      try:
+        func(*args)
+      except Exception as e:
+        print('Warning: output write failed:', e)
+        if self.error is None: self.error = e
+      if self.ontask is not None: self.ontask(time.time() - t0)
+      self.q.task_done()
+
+  # waits until all submitted writes are done; raises the first write error
+  def join (self):
+    self.q.join()
+    if self.error is not None:
+      e, self.error = self.error, None
+      raise e
+
 # Cleans input files
 def clean_lines (file):
   with open(file) as f_in:
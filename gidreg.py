@@ -0,0 +1,79 @@
+# gidreg.py - array-backed gid registry
+#
+# one entry per gid: type code, position index within its type and owning rank
+# lookups are O(1) array indexing instead of scanning the ranges in gid_dict
+
+import numpy as np
+
+class GidRegistry ():
+  # gid_dict maps source name -> contiguous gids (range, list or np array, may be empty)
+  # lsrc optionally fixes the order of the names (e.g. NetworkOnNode.src_list_new)
+  def __init__ (self, gid_dict, lsrc=None):
+    if lsrc is None: lsrc = list(gid_dict.keys())
+    self.names = list(lsrc)
+    self.starts = np.zeros(len(self.names), dtype=np.int64)
+    self.stops = np.zeros(len(self.names), dtype=np.int64)
+    for i, name in enumerate(self.names):
+      gids = gid_dict[name]
+      if len(gids):
+        self.starts[i] = gids[0]
+        self.stops[i] = gids[-1] + 1
+    self.N = int(self.stops.max()) if len(self.names) else 0
+    self.__create_arrays()
+
+  def __create_arrays (self):
+    self.code = {}
+    self.type_code = np.full(self.N, -1, dtype=np.int16)
+    self.pos_ind = np.zeros(self.N, dtype=np.int32)
+    self.rank = np.full(self.N, -1, dtype=np.int32)
+    for i, name in enumerate(self.names):
+      self.code[name] = i
+      start, stop = self.starts[i], self.stops[i]
+      self.type_code[start:stop] = i
+      self.pos_ind[start:stop] = np.arange(stop - start)
+
+  # builds a registry from the gid ranges stored in an output param file
+  @classmethod
+  def from_param (cls, fparam):
+    import paramrw
+    gid_dict, _ = paramrw.read(fparam)
+    return cls(gid_dict)
+
+  # type name of gid, None if the gid is unknown
+  def gid_to_type (self, gid):
+    gid = int(gid)
+    if gid < 0 or gid >= self.N or self.type_code[gid] < 0: return None
+    return self.names[self.type_code[gid]]
+
+  # index of gid within its type (index into pos_dict[type])
+  def pos_index (self, gid): return int(self.pos_ind[int(gid)])
+
+  # rank that owns gid (-1 if not assigned)
+  def owner (self, gid): return int(self.rank[int(gid)])
+
+  def set_owner (self, gids, rank): self.rank[np.asarray(gids, dtype=np.int64)] = rank
+
+  # vectorized type codes for an array of gids
+  def codes (self, gids): return self.type_code[np.asarray(gids, dtype=np.int64)]
+
+  def type_range (self, name):
+    i = self.code[name]
+    return range(int(self.starts[i]), int(self.stops[i]))
+
+  # gid_dict compatible view, in registry order
+  def gid_dict (self):
+    return dict((name, self.type_range(name)) for name in self.names)
+
+  # compact serialization next to the output (ranges + owning ranks)
+  def save (self, fname):
+    np.savez_compressed(fname, names=np.array(self.names), starts=self.starts, stops=self.stops, rank=self.rank)
+
+  @classmethod
+  def load (cls, fname):
+    dat = np.load(fname)
+    gid_dict = {}
+    for name, start, stop in zip(dat['names'], dat['starts'], dat['stops']):
+      gid_dict[str(name)] = range(int(start), int(stop))
+    reg = cls(gid_dict, [str(name) for name in dat['names']])
+    reg.rank[:] = dat['rank']
+    return reg
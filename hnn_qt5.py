@@ -11,7 +11,7 @@ from PyQt5.QtCore import QMetaObject, QUrl
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 import matplotlib.pyplot as plt
 import multiprocessing
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, TimeoutExpired
 import shlex, shutil
 from collections import OrderedDict
 from copy import deepcopy
@@ -21,18 +21,25 @@ import conf
 import numpy as np
 from math import ceil, isclose
 import spikefn
+import fileio as fio
 import params_default
 from paramrw import quickreadprm, usingOngoingInputs, countEvokedInputs, usingEvokedInputs, ExpParams
-from paramrw import chunk_evinputs, get_inputs, trans_input, find_param, validate_param_file
+from paramrw import chunk_evinputs, get_inputs, trans_input, find_param, validate_param_file, recdt
 from simdat import SIMCanvas, getinputfiles, updatedat
 from gutils import setscalegeom, lowresdisplay, setscalegeomcenter, getmplDPI, getscreengeom
 import nlopt
 from psutil import cpu_count, wait_procs, process_iter, NoSuchProcess
-from threading import Lock
+from threading import Lock, Thread
 import traceback
+import atexit
+import simserver
+import earlyabort
+import progress
 from collections import namedtuple
+import itertools
 
 prtime = False
+nprogressf = itertools.count() # numbers the progress files of spawned runs (see spawn_sim)
 
 def isWindows ():
   # are we on windows? or linux/mac ?
@@ -497,6 +504,32 @@ def kill_and_check_nrniv_procs():
       pids = [ str(proc.pid) for proc in running ]
       print("ERROR: failed to kill nrniv process(es) %s" % ','.join(pids))
 
+# persistent simulation server, used instead of a new mpiexec per run with
+# [sim] server = 1 (see simserver.py)
+simserverproc = None
+simclient = None
+
+def stop_simserver (kill=False):
+  global simserverproc, simclient
+  if simclient is not None and not kill:
+    try:
+      simclient.quit()
+    except (OSError, RuntimeError):
+      pass
+  if simserverproc is not None:
+    if not kill:
+      try:
+        simserverproc.wait(timeout=10)
+      except TimeoutExpired:
+        kill = True
+    if kill:
+      simserverproc.kill()
+      simserverproc.wait()
+      kill_and_check_nrniv_procs()
+  simserverproc = simclient = None
+
+atexit.register(stop_simserver)
+
 def bringwintotop (win):
   # bring a pyqt5 window to the top (parents still stay behind children)
   # based on examples from https://www.programcreek.com/python/example/101663/PyQt5.QtCore.Qt.WindowActive
@@ -581,6 +614,14 @@ class RunSimThread (QThread):
 
 
   def killproc (self):
+    if dconf['simserver'] and simserverproc is not None:
+      # stopping a request stops the server; the next run starts a new one
+      stop_simserver(kill=True)
+      self.lock.acquire()
+      self.killed = True
+      self.lock.release()
+      return
+
     if self.proc is None:
       # any nrniv processes found are not part of current sim
       return
@@ -605,7 +646,9 @@ class RunSimThread (QThread):
     self.killed = True
     self.lock.release()
 
-  def spawn_sim (self, simlength, banner=False):
+  # forkat: start time of the current optimization chunk; runs share the state at that
+  # time through a checkpoint (see ckpt.py)
+  def spawn_sim (self, simlength, banner=False, forkat=None, abortf=None):
     global paramf, hyperthreading
     import simdat
 
@@ -626,12 +669,37 @@ class RunSimThread (QThread):
       cmd = mpicmd + str(self.ncore) + nrniv_cmd + simf + ' ' + paramf + ' ntrial ' + str(self.ntrial) + ' simlength ' + str(simlength)
     else:
       cmd = mpicmd + str(self.ncore) + nrniv_cmd + simf + ' ' + paramf + ' ntrial ' + str(self.ntrial)
+    if not self.onNSG and forkat: cmd += ' forkat ' + str(forkat)
+    if not self.onNSG and abortf: cmd += ' abort ' + abortf
+    if not self.onNSG:
+      # progress records of the run (see progress.py), shown in waitsimwin; one file per
+      # spawned run, so that a retry does not share it with the follower of the failed one
+      fprog = os.path.join(dconf['datdir'], 'progress_%d_%d.jsonl' % (os.getpid(), next(nprogressf)))
+      if os.path.isfile(fprog): os.remove(fprog)
+      cmd += ' progress ' + fprog
     cmdargs = shlex.split(cmd,posix="win" not in sys.platform) # https://github.com/maebert/jrnl/issues/348
     if debug: print("cmd:",cmd,"cmdargs:",cmdargs)
     if prtime:
       self.proc = Popen(cmdargs,cwd=os.getcwd())
     else: 
       self.proc = Popen(cmdargs,stdout=PIPE,stderr=PIPE,cwd=os.getcwd(),universal_newlines=True)
+    if not self.onNSG: Thread(target=self.follow_progress, args=(fprog, self.proc), daemon=True).start()
+
+  # shows the progress records of a spawned simulation until it exits, then removes the
+  # progress file, whether the run finished or failed
+  def follow_progress (self, fprog, proc):
+    try:
+      for d in progress.follow(fprog, proc):
+        try:
+          self.updatewaitsimwin(progress.describe(d))
+        except:
+          if debug: print('RunSimThread updatewaitsimwin exception...')
+    finally:
+      proc.wait() # the run may still write after its last record
+      try:
+        if os.path.isfile(fprog): os.remove(fprog)
+      except OSError:
+        if debug: print('RunSimThread could not remove', fprog)
 
   def get_proc_stream (self, stream, print_to_console=False):
     try:
@@ -649,7 +717,7 @@ class RunSimThread (QThread):
     stream.close()
 
   # run sim command via mpi, then delete the temp file.
-  def runsim (self, is_opt=False, banner=True, simlength=None):
+  def runsim (self, is_opt=False, banner=True, simlength=None, forkat=None, abortf=None):
     import simdat
 
     global defncore, paramf, hyperthreading
@@ -657,44 +725,47 @@ class RunSimThread (QThread):
     self.killed = False
     self.lock.release()
 
-    self.spawn_sim(simlength, banner=banner)
-    retried = False
-
-    #cstart = time()
-    while True:
-      status = self.proc.poll()
-      if not status is None:
-        if status == 0:
-          # success, use same number of cores next time
-          defncore = self.ncore
-          break
-        elif status == 1 and not retried:
-          self.ncore = ceil(self.ncore/2)
-          txt = "INFO: Failed starting mpiexec, retrying with %d cores" % self.ncore
-          print(txt)
-          self.updatewaitsimwin(txt)
-          self.spawn_sim(simlength, banner=banner)
-          retried = True
-        else:
-          txt = "Simulation exited with return code %d. Stderr from console:"%status
-          print(txt)
-          self.updatewaitsimwin(txt)
-          self.get_proc_stream(self.proc.stderr, print_to_console=True)
-          kill_and_check_nrniv_procs()
+    if dconf['simserver'] and not self.onNSG:
+      self.runsim_server(simlength, forkat, abortf)
+    else:
+      self.spawn_sim(simlength, banner=banner, forkat=forkat, abortf=abortf)
+      retried = False
+
+      #cstart = time()
+      while True:
+        status = self.proc.poll()
+        if not status is None:
+          if status == 0:
+            # success, use same number of cores next time
+            defncore = self.ncore
+            break
+          elif status == 1 and not retried:
+            self.ncore = ceil(self.ncore/2)
+            txt = "INFO: Failed starting mpiexec, retrying with %d cores" % self.ncore
+            print(txt)
+            self.updatewaitsimwin(txt)
+            self.spawn_sim(simlength, banner=banner, forkat=forkat, abortf=abortf)
+            retried = True
+          else:
+            txt = "Simulation exited with return code %d. Stderr from console:"%status
+            print(txt)
+            self.updatewaitsimwin(txt)
+            self.get_proc_stream(self.proc.stderr, print_to_console=True)
+            kill_and_check_nrniv_procs()
+            raise RuntimeError
+
+        self.get_proc_stream(self.proc.stdout, print_to_console=False)
+
+        # check if proc was killed
+        self.lock.acquire()
+        if self.killed:
+          self.lock.release()
+          # exit using RuntimeError
           raise RuntimeError
+        else:
+          self.lock.release()
 
-      self.get_proc_stream(self.proc.stdout, print_to_console=False)
-
-      # check if proc was killed
-      self.lock.acquire()
-      if self.killed:
-        self.lock.release()
-        # exit using RuntimeError
-        raise RuntimeError
-      else:
-        self.lock.release()
-
-      sleep(1)
+        sleep(1)
 
     #cend = time()
     #rtime = cend - cstart
@@ -709,6 +780,27 @@ class RunSimThread (QThread):
       simdat.updatelsimdat(paramf,simdat.ddat['dpl']) # update lsimdat and its current sim index
 
 
+  # runs the current param file on the simulation server, starting it on first use
+  def runsim_server (self, simlength, forkat, abortf=None):
+    global simserverproc, simclient
+    try:
+      if simclient is None:
+        self.updatewaitsimwin('Starting simulation server with %d cores...' % self.ncore)
+        simserverproc, simclient = simserver.start_server(paramf, self.ncore, dconf['serverport'], simf)
+      rep = simclient.run(paramf, self.ntrial, simlength or 0.0, forkat or 0.0, abortf or '')
+    except (OSError, RuntimeError) as e:
+      txt = "Simulation server failed: %s" % str(e)
+      print(txt)
+      self.updatewaitsimwin(txt)
+      stop_simserver(kill=True)
+      raise RuntimeError
+    if rep['status'] != 'ok':
+      txt = "Simulation server error: %s" % rep.get('error', '')
+      print(txt)
+      self.updatewaitsimwin(txt)
+      raise RuntimeError
+    self.updatewaitsimwin('Simulation request took %.3f s' % rep['tclient'])
+
   def optmodel (self):
     import simdat
 
@@ -807,6 +899,11 @@ class RunSimThread (QThread):
     self.opt_start = self.baseparamwin.optparamwin.get_chunk_start(step)
     self.opt_end = self.baseparamwin.optparamwin.get_chunk_end(step)
     self.opt_weights = self.baseparamwin.optparamwin.get_chunk_weights(step)
+    # the simulations of this step share the state at opt_start; forks of earlier steps are stale
+    forkat = None
+    if dconf['optfork'] and self.opt_start > 0:
+      forkat = self.opt_start
+      shutil.rmtree(os.path.join(dconf['datdir'], 'fork'), ignore_errors=True)
     def optrun (new_params, grad=0):
       txt = "Optimization step %d, simulation %d" % (step + 1,
                                                      self.optsim + 1)
@@ -837,27 +934,41 @@ class RunSimThread (QThread):
       sleep(1)
 
       # run the simulation, but stop early if possible
-      self.runsim(is_opt=True, banner=False, simlength=self.opt_end)
-
-      # calculate wRMSE for all steps
-      simdat.weighted_rmse(simdat.ddat,
-                           self.opt_end,
-                           self.opt_weights,
-                           tstart=self.opt_start)
-      err = simdat.ddat['werrtot']
-
-      if self.last_step:
-        # weighted RMSE with weights of all 1's is the same as
-        # regular RMSE
-        simdat.ddat['errtot'] = simdat.ddat['werrtot']
-        txt = "RMSE = %f"%err
+      abortf = None
+      if dconf['optabort'] and self.stepminopterr < 1e9 and 'dextdata' in simdat.ddat:
+        # the run stops once its error can not beat the best of this step
+        abortf = os.path.join(basedir, 'opttarget.npz')
+        earlyabort.write_target(abortf, list(simdat.ddat['dextdata'].values()), self.opt_weights,
+                                self.opt_start, self.opt_end, self.stepminopterr * max(1.0, dconf['optabortfac']))
+      self.runsim(is_opt=True, banner=False, simlength=self.opt_end, forkat=forkat, abortf=abortf)
+
+      aborted = None
+      if abortf: aborted = earlyabort.read_aborted(basedir)
+      if aborted is not None:
+        # dominated: the lower bound on the error of the full run
+        err, tabort = aborted
+        simdat.ddat['errtot'] = err
+        txt = "stopped at %.1f ms, RMSE >= %f" % (tabort, err)
       else:
-        # calculate regular RMSE for displaying on plot
-        simdat.calcerr(simdat.ddat,
-                      self.opt_end,
-                      tstart=self.opt_start)
+        # calculate wRMSE for all steps
+        simdat.weighted_rmse(simdat.ddat,
+                             self.opt_end,
+                             self.opt_weights,
+                             tstart=self.opt_start)
+        err = simdat.ddat['werrtot']
+
+        if self.last_step:
+          # weighted RMSE with weights of all 1's is the same as
+          # regular RMSE
+          simdat.ddat['errtot'] = simdat.ddat['werrtot']
+          txt = "RMSE = %f"%err
+        else:
+          # calculate regular RMSE for displaying on plot
+          simdat.calcerr(simdat.ddat,
+                        self.opt_end,
+                        tstart=self.opt_start)
 
-        txt = "weighted RMSE = %f, RMSE = %f"% (err,simdat.ddat['errtot'])
+          txt = "weighted RMSE = %f, RMSE = %f"% (err,simdat.ddat['errtot'])
 
       print(txt)
       self.updatewaitsimwin(os.linesep+'Simulation finished: ' + txt + os.linesep) # print error
@@ -2542,7 +2653,7 @@ class OptEvokedInputParamDialog (EvokedInputParamDialog):
       # din proivdes a complete parameter set
       self.din = din
       self.simlength = float(din['tstop'])
-      self.sim_dt = float(din['dt'])
+      self.sim_dt = recdt(din) # sample interval of the recorded dipole, for the chunk weights
 
       self.cleanLabels()
       self.removeAllInputs() # turn off any previously set inputs
@@ -2615,6 +2726,7 @@ class RunParamDialog (DictDialog):
 
     self.drun = OrderedDict([('tstop', 250.), # simulation end time (ms)
                              ('dt', 0.025), # timestep
+                             ('record_dt', 0.0), # recording interval (0: every timestep)
                              ('celsius',37.0), # temperature
                              ('N_trials',1), # number of trials
                              ('threshold',0.0)]) # firing threshold
@@ -2644,6 +2756,7 @@ class RunParamDialog (DictDialog):
 
     self.addtransvar('tstop','Duration (ms)')
     self.addtransvar('dt','Integration Timestep (ms)')
+    self.addtransvar('record_dt','Recording Interval (ms)')
     self.addtransvar('celsius','Temperature (C)')
     self.addtransvar('threshold','Firing Threshold (mV)')
     self.addtransvar('N_trials','Trials')
@@ -3573,7 +3686,7 @@ class HNNGUI (QMainWindow):
     global basedir
 
     spikefile = os.path.join(basedir,'spk.txt')
-    if os.path.isfile(spikefile):
+    if spikefn.spikes_exist(spikefile):
       lcmd = [getPyComm(), 'visrast.py',paramf,spikefile]
     else:
       QMessageBox.information(self, "HNN", "WARNING: no spiking data at %s" % spikefile)
@@ -3588,7 +3701,7 @@ class HNNGUI (QMainWindow):
     global basedir
 
     dipole_file = os.path.join(basedir,'dpl.txt')
-    if os.path.isfile(dipole_file):
+    if fio.table_exists(dipole_file): # text or .npy (see fileio.write_table)
       lcmd = [getPyComm(), 'visdipole.py',paramf,dipole_file]
     else:
       QMessageBox.information(self, "HNN", "WARNING: no dipole data at %s" % dipole_file)
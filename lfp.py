@@ -98,7 +98,8 @@ def transfer_resistance2 (exyz):
 # represents a simple LFP electrode
 class LFPElectrode ():
 
-  def __init__ (self, coord, sigma = 3.0, pc = None, usePoint = True):
+  # nstep: the LFP is computed every nstep integration steps (recording interval)
+  def __init__ (self, coord, sigma = 3.0, pc = None, usePoint = True, nstep = 1):
 
     self.sigma = sigma # extracellular conductivity in mS/cm (uniform for simplicity)
     # see http://jn.physiology.org/content/104/6/3388.long shows table of values with conductivity
@@ -108,6 +109,8 @@ class LFPElectrode ():
 
     self.imem_ptrvec = self.imem_vec = self.rx = self.vx = self.vres = None
     self.bscallback = self.fih = None
+    self.nstep = max(1, int(nstep))
+    self.istep = 0
 
     if pc is None: self.pc = h.ParallelContext()
     else: self.pc = pc
@@ -191,6 +194,7 @@ class LFPElectrode ():
     self.vres = self.transfer_resistance(self.coord)
     self.lfp_t = h.Vector()
     self.lfp_v = h.Vector()
+    self.istep = 0
 
     #for i, cellinfo in enumerate(gidinfo.values()):
     #  seg = cellinfo.cell.soma(0.5)
@@ -204,6 +208,8 @@ class LFPElectrode ():
 
   def callback (self):
     # print('In lfp callback - pc.id = ',self.pc.id(),' t=',self.pc.t(0))
+    self.istep += 1
+    if (self.istep - 1) % self.nstep: return # sampled every nstep steps
     self.imem_ptrvec.gather(self.imem_vec)
     #s = pc.allreduce(imem_vec.sum(), 1) #verify sum i_membrane_ == stimulus
     #if rank == 0: print pc.t(0), s
@@ -0,0 +1,114 @@
+# loadbal.py - cost-weighted gid assignment across ranks
+#
+# per-gid cost is estimated from prototype cells (segments, density mechanisms,
+# point processes) plus the number of incoming NetCons, or read from a measured
+# profile; gids are then partitioned with a greedy LPT (longest processing time first)
+#
+# measuring a profile: nrniv -python loadbal.py param/default.param profile.json
+
+import os
+import sys
+import json
+import heapq
+import time
+import numpy as np
+from neuron import h
+from L2_pyramidal import L2Pyr
+from L5_pyramidal import L5Pyr
+from L2_basket import L2Basket
+from L5_basket import L5Basket
+
+# relative cost weights used by the estimate (units of one segment w/o mechanisms)
+cost_pp = 1. # per point process (synapses, IClamps, dipole)
+cost_nc = 0.01 # per incoming NetCon (only costs when events arrive)
+cost_feed = 0.1 # per artificial feed (VecStim)
+
+# creates a single cell of the given type, not registered with the ParallelContext
+def create_prototype (celltype, p):
+  pos = (0, 0, 0)
+  if celltype == 'L2_pyramidal': return L2Pyr(-1, pos, p)
+  elif celltype == 'L5_pyramidal': return L5Pyr(-1, pos, p)
+  elif celltype == 'L2_basket': return L2Basket(-1, pos)
+  elif celltype == 'L5_basket': return L5Basket(-1, pos)
+
+# per-timestep cost of a cell from its compartments, mechanisms and point processes
+def cell_complexity (cell):
+  cost = 0.
+  seclist = h.SectionList()
+  seclist.wholetree(sec=cell.soma)
+  for sect in seclist:
+    for seg in sect:
+      cost += 1. + len([mech for mech in seg])
+      cost += cost_pp * len(seg.point_processes())
+  return cost
+
+# estimated cost per cell type; dnc_in gives the number of incoming NetCons per cell of each type
+def estimate_costs (p, lcelltype, dnc_in):
+  dcost = {}
+  for celltype in lcelltype:
+    cell = create_prototype(celltype, p)
+    dcost[celltype] = cell_complexity(cell) + cost_nc * dnc_in.get(celltype, 0)
+    del cell
+  return dcost
+
+# measured cost per cell type: seconds per fadvance() of a lone prototype cell
+def measure_costs (p, lcelltype, nstep=4000):
+  dcost = {}
+  h.dt = p['dt']
+  h.celsius = p['celsius']
+  for celltype in lcelltype:
+    cell = create_prototype(celltype, p)
+    h.finitialize()
+    t0 = time.time()
+    for i in range(nstep): h.fadvance()
+    dcost[celltype] = (time.time() - t0) / nstep
+    del cell
+  return dcost
+
+# reads a profile of per cell type costs; returns None on failure
+def read_profile (fname):
+  try:
+    with open(fname, 'r') as fp: return json.load(fp)
+  except:
+    print("Warning: could not read load balance profile %s" % fname)
+    return None
+
+def write_profile (fname, dcost):
+  with open(fname, 'w') as fp: json.dump(dcost, fp, indent=2)
+
+# greedy LPT: the largest remaining item goes to the least loaded rank
+# ties are broken by item index and rank number, so every rank computes the same assignment
+def lpt_partition (lcost, nhost):
+  ranks = np.zeros(len(lcost), dtype=int)
+  loads = np.zeros(nhost)
+  heap = [(0., rank) for rank in range(nhost)]
+  for i in sorted(range(len(lcost)), key=lambda i: (-lcost[i], i)):
+    load, rank = heapq.heappop(heap)
+    ranks[i] = rank
+    loads[rank] = load + lcost[i]
+    heapq.heappush(heap, (loads[rank], rank))
+  return ranks, loads
+
+# imbalance as max/mean, 1.0 is perfect
+def imbalance (loads):
+  loads = np.asarray(loads, dtype=float)
+  if loads.mean() <= 0.: return 1.
+  return loads.max() / loads.mean()
+
+if __name__ == '__main__':
+  import paramrw
+  h.load_file("stdrun.hoc")
+  f_psim = os.path.join('param', 'default.param')
+  fout = 'loadbal_profile.json'
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): f_psim = arg
+    elif arg.endswith('.json'): fout = arg
+  p_exp = paramrw.ExpParams(f_psim)
+  if len(p_exp.expmt_groups) > 0: expmt_group = p_exp.expmt_groups[0]
+  else: expmt_group = None
+  p = p_exp.return_pdict(expmt_group, 0)
+  dcost = measure_costs(p, ['L2_basket', 'L2_pyramidal', 'L5_basket', 'L5_pyramidal'])
+  for celltype, cost in dcost.items(): print('%14s: %.3e s/step' % (celltype, cost))
+  write_profile(fout, dcost)
+  print('wrote', fout)
+  h.quit()
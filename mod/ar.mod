@@ -15,6 +15,7 @@ NEURON {
     SUFFIX ar
     NONSPECIFIC_CURRENT i
     RANGE gbar, i
+    THREADSAFE
 }
 
 PARAMETER {
@@ -22,6 +22,7 @@ NEURON {
     RANGE m, h, gca, gbar
     RANGE minf, hinf, mtau, htau
     GLOBAL q10, temp, tadj, vmin, vmax, vshift, tshift
+    THREADSAFE
 }
 
 PARAMETER {
@@ -64,6 +65,9 @@ ASSIGNED {
 STATE { m h }
 
 INITIAL {
+    : tadj is a per thread copy (THREADSAFE), but rates() only sets it when the
+    : table is built, which one thread does
+    tadj = q10^((celsius - temp - tshift) / 10)
     trates(v+vshift)
     m = minf
     h = hinf
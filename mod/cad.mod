@@ -49,6 +49,7 @@ NEURON {
     RANGE ca, taur
     GLOBAL depth, cainf
     : GLOBAL depth, cainf, taur
+    THREADSAFE
 }
 
 UNITS {
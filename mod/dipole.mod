@@ -5,6 +5,11 @@
 : last rev: (SL: Added back Qtotal, which WAS used in par version)
 
 NEURON {
+    : before the POINTERs, which nocmodl otherwise takes as not thread safe. the sums
+    : (Qsum, Qtotal) must only be written from one thread: with threads each cell
+    : sums into the Qcell of one of its Dipoles (cell.py dipole_cellsum) instead of
+    : dp_total_L2/L5
+    THREADSAFE
     SUFFIX dipole
     RANGE ri, ia, Q, ztan
     POINTER pv
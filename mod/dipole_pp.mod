@@ -5,6 +5,11 @@
 : last rev: (SL: added Qtotal back, used for par calc)
 
 NEURON {
+    : before the POINTERs, which nocmodl otherwise takes as not thread safe. the sums
+    : (Qsum, Qtotal) must only be written from one thread: with threads each cell
+    : sums into the Qcell of one of its Dipoles (cell.py dipole_cellsum) instead of
+    : dp_total_L2/L5
+    THREADSAFE
     POINT_PROCESS Dipole
     RANGE ri, ia, Q, ztan
     POINTER pv
@@ -12,6 +17,9 @@ NEURON {
     : for POINT_PROCESS. Gets additions from dipole
     RANGE Qsum
     POINTER Qtotal
+
+    : with threads, the Qtotal of all the mechanisms of a cell point here
+    RANGE Qcell
 }
 
 UNITS {
@@ -32,6 +40,7 @@ ASSIGNED {
     Q (fAm)
     Qsum (fAm)
     Qtotal (fAm)
+    Qcell (fAm)
 }
 
 : solve for v's first then use them
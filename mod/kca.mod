@@ -25,6 +25,7 @@ NEURON {
     RANGE ninf, ntau
     GLOBAL Ra, Rb, caix
     GLOBAL q10, temp, tadj, vmin, vmax, tshift
+    THREADSAFE
 }
 
 UNITS {
@@ -23,6 +23,7 @@ NEURON {
     RANGE ninf, ntau
     GLOBAL Ra, Rb
     GLOBAL q10, temp, tadj, vmin, vmax, tshift
+    THREADSAFE
 }
 
 UNITS {
@@ -82,6 +83,9 @@ STATE {
 }
 
 INITIAL {
+    : tadj is a per thread copy (THREADSAFE), but rates() only sets it when the
+    : table is built, which one thread does
+    tadj = q10^((celsius - temp - tshift) / 10)
     trates(v)
     n = ninf
 }
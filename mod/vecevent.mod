@@ -2,28 +2,43 @@
 
 NEURON {
     ARTIFICIAL_CELL VecStim
+    THREADSAFE
 }
 
 ASSIGNED {
     index
     etime (ms)
     space
+    gen
 }
 
 INITIAL {
     index = 0
+    gen = 1
     element()
     if (index > 0) {
-        net_send(etime - t, 1)
+        net_send(etime - t, gen)
     }
 }
 
 NET_RECEIVE (w) {
-    if (flag == 1) {
+    if (flag == 0) {
+        : restart (external event, see ParFeedAll.restart): continue from the first
+        : element at or after t; self-events scheduled before the restart are ignored
+        gen = gen + 1
+        index = 0
+        element()
+        while (index > 0 && etime < t) {
+            element()
+        }
+        if (index > 0) {
+            net_send(etime - t, gen)
+        }
+    } else if (flag == gen) {
         net_event(t)
         element()
         if (index > 0) {
-            net_send(etime - t, 1)
+            net_send(etime - t, gen)
         }
     }
 }
@@ -9,29 +9,114 @@ import numpy as np
 import sys
 
 from neuron import h
-from feed import ParFeedAll
+from feed import ParFeedAll, ParFeedBatch
 from L2_pyramidal import L2Pyr
 from L5_pyramidal import L5Pyr
 from L2_basket import L2Basket
 from L5_basket import L5Basket
 import paramrw as paramrw
+import loadbal
+import statetemplate
+import simprofile
+from gidreg import GidRegistry
+
+# cell-to-cell projections keyed by postsynaptic cell type, listed in the
+# order the per-cell parconnect() methods create them
+# each entry: (presyn type, ncfrom list, lamtha, A_delay, autapses, [(weight param, synapse), ...])
+dconn_spec = {
+  'L2_basket': [
+    ('L2_pyramidal', 'ncfrom_L2Pyr', 3., 1., False, [('gbar_L2Pyr_L2Basket', 'soma_ampa')]),
+    ('L2_basket', 'ncfrom_L2Basket', 20., 1., True, [('gbar_L2Basket_L2Basket', 'soma_gabaa')]),
+  ],
+  'L2_pyramidal': [
+    ('L2_pyramidal', 'ncfrom_L2Pyr', 3., 1., False, [
+      ('gbar_L2Pyr_L2Pyr_ampa', 'apicaloblique_ampa'),
+      ('gbar_L2Pyr_L2Pyr_ampa', 'basal2_ampa'),
+      ('gbar_L2Pyr_L2Pyr_ampa', 'basal3_ampa'),
+      ('gbar_L2Pyr_L2Pyr_nmda', 'apicaloblique_nmda'),
+      ('gbar_L2Pyr_L2Pyr_nmda', 'basal2_nmda'),
+      ('gbar_L2Pyr_L2Pyr_nmda', 'basal3_nmda'),
+    ]),
+    ('L2_basket', 'ncfrom_L2Basket', 50., 1., True, [
+      ('gbar_L2Basket_L2Pyr_gabaa', 'soma_gabaa'),
+      ('gbar_L2Basket_L2Pyr_gabab', 'soma_gabab'),
+    ]),
+  ],
+  'L5_basket': [
+    ('L5_basket', 'ncfrom_L5Basket', 20., 1., False, [('gbar_L5Basket_L5Basket', 'soma_gabaa')]),
+    ('L5_pyramidal', 'ncfrom_L5Pyr', 3., 1., True, [('gbar_L5Pyr_L5Basket', 'soma_ampa')]),
+    ('L2_pyramidal', 'ncfrom_L2Pyr', 3., 1., True, [('gbar_L2Pyr_L5Basket', 'soma_ampa')]),
+  ],
+  'L5_pyramidal': [
+    ('L5_pyramidal', 'ncfrom_L5Pyr', 3., 1., False, [
+      ('gbar_L5Pyr_L5Pyr_ampa', 'apicaloblique_ampa'),
+      ('gbar_L5Pyr_L5Pyr_ampa', 'basal2_ampa'),
+      ('gbar_L5Pyr_L5Pyr_ampa', 'basal3_ampa'),
+      ('gbar_L5Pyr_L5Pyr_nmda', 'apicaloblique_nmda'),
+      ('gbar_L5Pyr_L5Pyr_nmda', 'basal2_nmda'),
+      ('gbar_L5Pyr_L5Pyr_nmda', 'basal3_nmda'),
+    ]),
+    ('L5_basket', 'ncfrom_L5Basket', 70., 1., True, [
+      ('gbar_L5Basket_L5Pyr_gabaa', 'soma_gabaa'),
+      ('gbar_L5Basket_L5Pyr_gabab', 'soma_gabab'),
+    ]),
+    ('L2_pyramidal', 'ncfrom_L2Pyr', 3., 1., True, [
+      ('gbar_L2Pyr_L5Pyr', 'basal2_ampa'),
+      ('gbar_L2Pyr_L5Pyr', 'basal3_ampa'),
+      ('gbar_L2Pyr_L5Pyr', 'apicaltuft_ampa'),
+      ('gbar_L2Pyr_L5Pyr', 'apicaloblique_ampa'),
+    ]),
+    ('L2_basket', 'ncfrom_L2Basket', 50., 1., True, [('gbar_L2Basket_L5Pyr', 'apicaltuft_gabaa')]),
+  ],
+}
+
+# approximate memory per NetCon (NEURON NetCon plus its python wrapper), for pruning reports
+nc_bytes = 200
+
+# params that decide which cells, sections, sources or NetCons exist;
+# changing any of them needs a new NetworkOnNode (see update_params)
+ltopology_keys = [
+  'N_pyr_x', 'N_pyr_y', 'tstop', 'dt', 'threshold', 'save_vsoma', 'record_dt', 'record_aa',
+  'prune_weight', 'prune_frac', 'feed_batch', 'evinput_shared',
+]
+
+# L2Pyr_/L5Pyr_ params that are mechanism values; the others (geometry, synapse
+# kinetics) are fixed when the sections and synapses are created
+lbiophys_tags = ('_gkbar_', '_gnabar_', '_gl_', '_el_', '_gbar_', '_taur_')
+
+# cell-to-cell weight params in dconn_spec
+lconn_weight_keys = set(key for lproj in dconn_spec.values() for proj in lproj for key, name in proj[5])
+
+# synchronous evoked inputs that get one source per rank (with evinput_shared)
+def get_shared_keys (p, p_unique):
+  if not p.get('evinput_shared', 0): return []
+  return [key for key, p_type in p_unique.items() if key.startswith(('evprox', 'evdist')) and p_type['sync_evinput']]
 
 # create Network class
 class NetworkOnNode ():
 
-    def __init__ (self, p):
+    def __init__ (self, p, legacy_connect=False, loadbal=0, floadbal=''):
       # set the params internally for this net
       # better than passing it around like ...
       self.p = p
-      # Number of time points
-      # Originally used to create the empty vec for synaptic currents,
-      # ensuring that they exist on this node irrespective of whether
-      # or not cells of relevant type actually do
-      self.N_t = np.arange(0., h.tstop, self.p['dt']).size + 1
-      # Create a h.Vector() with size 1xself.N_t, zero'd
+      # legacy_connect uses the per-cell parconnect() loops instead of the connectivity table
+      self.legacy_connect = legacy_connect
+      # loadbal: 0 round-robin gid assignment, 1 cost-weighted (LPT)
+      # floadbal: optional measured profile of per cell type costs (see loadbal.py)
+      self.loadbal = loadbal
+      self.floadbal = floadbal
+      self.load_pred = None # predicted load per rank (only with loadbal)
+      self.nthread = 1 # threads of this node (see setup_threads)
+      self.multisplit = False # pyramidal cells split across threads (see setup_threads)
+      # recording intervals (ms, 0: every step) of the somatic voltages and of the currents
+      # and dipoles (see paramrw.recintervals)
+      self.rdt_vsoma, self.rdt_rec = paramrw.recintervals(p)
+      # summed somatic currents of the pyramidal cells on this node; they exist on this
+      # node irrespective of whether or not cells of relevant type actually do, and are
+      # sized to the recordings by aggregate_currents
       self.current = {
-        'L5Pyr_soma': h.Vector(self.N_t, 0),
-        'L2Pyr_soma': h.Vector(self.N_t, 0),
+        'L5Pyr_soma': h.Vector(),
+        'L2Pyr_soma': h.Vector(),
       }
       # int variables for grid of pyramidal cells (for now in both L2 and L5)
       self.gridpyr = {
@@ -58,6 +143,10 @@ class NetworkOnNode ():
       # p_unique represent ext inputs that are going to go to each cell
       self.p_ext, self.p_unique = paramrw.create_pext(self.p, h.tstop)
       self.N_extinput = len(self.p_ext)
+      # synchronous evoked inputs shared by all cells on a rank (one source per rank)
+      # and the unique inputs that still have one source per cell
+      self.shared_keys = self.__set_shared_evinputs()
+      self.cell_feed_keys = [key for key in self.p_unique.keys() if key not in self.shared_keys]
       # Source list of names
       # in particular order (cells, extinput, alpha names of unique inputs)
       self.src_list_new = self.__create_src_list()
@@ -77,6 +166,8 @@ class NetworkOnNode ():
       # global dictionary of gid and cell type
       self.gid_dict = {}
       self.__create_gid_dict()
+      # O(1) gid -> type, position index and owning rank
+      self.gidreg = GidRegistry(self.gid_dict, self.src_list_new)
       # assign gid to hosts, creates list of gids for this node in __gid_list
       # __gid_list length is number of cells assigned to this id()
       self.__gid_list = []
@@ -88,16 +179,38 @@ class NetworkOnNode ():
       self.ext_list = dict.fromkeys(self.p_unique)
       # initialize the lists in the dict
       for key in self.ext_list.keys(): self.ext_list[key] = []
+      # batched event generation per unique feed type (feed_batch)
+      self.feed_batch = {}
       # create sources and init
-      self.__create_all_src()
+      with simprofile.phase('create'): self.__create_all_src()
+      # initial voltages of all cells on this node, from per cell type templates
+      self.vinit = self.__create_vinit()
+      self.sinit = None # full-state initialization (see load_state_template)
       self.state_init()
-      # parallel network connector
-      self.__parnet_connect()
+      # connectivity table (distances, weights, delays) for the cells on this node
+      self.conn_table = {}
+      self.conn_row = {}
+      with simprofile.phase('connect'):
+        if not self.legacy_connect: self.__create_conn_table()
+        # parallel network connector
+        self.__parnet_connect()
+      if self.p.get('prune_weight', 0.) > 0. or self.p.get('prune_frac', 0.) > 0.:
+        if self.legacy_connect:
+          if self.rank == 0: print("Warning: prune_weight/prune_frac are ignored with legacy_connect")
+        else:
+          self.prune_report()
       # set to record spikes
       self.spiketimes = h.Vector()
       self.spikegids = h.Vector()
       self.__record_spikes()
 
+    # with evinput_shared and sync_evinput, every cell receives identical evoked event
+    # times, so each evoked input gets one source per rank fanned out by NetCons
+    def __set_shared_evinputs (self):
+      lshared = get_shared_keys(self.p, self.p_unique)
+      for key in lshared: self.p_unique[key]['shared'] = 1
+      return lshared
+
     # creates the immutable source list along with corresponding numbers of cells
     def __create_src_list (self):
       # base source list of tuples, name and number, in this order
@@ -160,7 +273,8 @@ class NetworkOnNode ():
       # at this time, each of the unique inputs is per cell
       for key in self.p_unique.keys():
         # create the pos_dict for all the sources
-        self.pos_dict[key] = [self.origin for i in range(self.N_cells)]
+        if key in self.shared_keys: self.pos_dict[key] = [self.origin for i in range(self.n_hosts)]
+        else: self.pos_dict[key] = [self.origin for i in range(self.N_cells)]
 
     # cell counting routine
     def __count_cells (self):
@@ -200,7 +314,16 @@ class NetworkOnNode ():
     # this happens on EACH node
     # creates self.__gid_list for THIS node
     def __gid_assign (self):
+      if self.loadbal:
+        self.__gid_assign_lpt()
+        return
       # round robin assignment of gids
+      # every rank records the owner of every gid in the registry
+      for rank in range(self.n_hosts):
+        gids = np.arange(rank, self.N_cells, self.n_hosts)
+        self.gidreg.set_owner(gids, rank)
+        for key in self.cell_feed_keys: self.gidreg.set_owner(gids + self.gid_dict[key][0], rank)
+        self.gidreg.set_owner(np.arange(rank, self.N_extinput, self.n_hosts) + self.gid_dict['extinput'].start, rank)
       for gid in range(self.rank, self.N_cells, self.n_hosts):
         # set the cell gid
         self.pc.set_gid2node(gid, self.rank)
@@ -208,10 +331,11 @@ class NetworkOnNode ():
         # now to do the cell-specific external input gids on the same proc
         # these are guaranteed to exist because all of these inputs were created
         # for each cell
-        for key in self.p_unique.keys():
+        for key in self.cell_feed_keys:
           gid_input = gid + self.gid_dict[key][0]
           self.pc.set_gid2node(gid_input, self.rank)
           self.__gid_list.append(gid_input)
+      self.__gid_assign_shared()
       # legacy handling of the external inputs
       # NOT perfectly balanced for now
       for gid_base in range(self.rank, self.N_extinput, self.n_hosts):
@@ -223,11 +347,75 @@ class NetworkOnNode ():
       # extremely important to get the gids in the right order
       self.__gid_list.sort()
 
+    # shared evoked sources: source i of each shared input lives on rank i
+    def __gid_assign_shared (self):
+      for key in self.shared_keys:
+        self.gidreg.set_owner(np.array(self.gid_dict[key]), np.arange(self.n_hosts))
+        gid_input = self.gid_dict[key][0] + self.rank
+        self.pc.set_gid2node(gid_input, self.rank)
+        self.__gid_list.append(gid_input)
+
+    # number of incoming cell-to-cell NetCons per cell of each type, from dconn_spec
+    def __count_nc_in (self):
+      dnc_in = {}
+      for type_post, lproj in dconn_spec.items():
+        dnc_in[type_post] = 0
+        for type_pre, ncfrom, lamtha, A_delay, autapses, lsyn in lproj:
+          N_pre = self.N[type_pre]
+          if type_pre == type_post and not autapses: N_pre -= 1
+          dnc_in[type_post] += N_pre * len(lsyn)
+      return dnc_in
+
+    # cost-weighted assignment of gids: every rank computes the same greedy LPT
+    # partition. unique feeds stay on the rank of the cell they target
+    def __gid_assign_lpt (self):
+      dcost = None
+      if self.floadbal: dcost = loadbal.read_profile(self.floadbal)
+      if dcost is not None:
+        # measured costs are normalized so the cheapest cell type costs 1
+        cost_min = min(dcost[type] for type in self.cellname_list)
+        dcost = dict((type, dcost[type] / cost_min) for type in self.cellname_list)
+      else:
+        dcost = loadbal.estimate_costs(self.p, self.cellname_list, self.__count_nc_in())
+      cost_unique = loadbal.cost_feed * len(self.cell_feed_keys)
+      lgid, lcost = [], []
+      for type in self.cellname_list:
+        for gid in self.gid_dict[type]:
+          lgid.append(gid)
+          lcost.append(dcost[type] + cost_unique)
+      for gid in self.gid_dict['extinput']:
+        lgid.append(gid)
+        lcost.append(loadbal.cost_feed)
+      ranks, self.load_pred = loadbal.lpt_partition(lcost, self.n_hosts)
+      self.gidreg.set_owner(lgid, ranks)
+      for key in self.cell_feed_keys:
+        self.gidreg.set_owner(np.arange(self.N_cells) + self.gid_dict[key][0], ranks[:self.N_cells])
+      for gid, rank in zip(lgid, ranks):
+        if rank != self.rank: continue
+        self.pc.set_gid2node(gid, self.rank)
+        self.__gid_list.append(gid)
+        if gid < self.N_cells:
+          for key in self.cell_feed_keys:
+            gid_input = gid + self.gid_dict[key][0]
+            self.pc.set_gid2node(gid_input, self.rank)
+            self.__gid_list.append(gid_input)
+      self.__gid_assign_shared()
+      self.__gid_list.sort()
+      if self.rank == 0:
+        print('load balance: predicted imbalance (max/mean) %.3f over %d ranks' % (loadbal.imbalance(self.load_pred), self.n_hosts))
+
+    # reports predicted vs actual load imbalance; call on all ranks after psolve
+    def loadbal_report (self):
+      lstep = self.pc.py_allgather(self.pc.step_time())
+      lwait = self.pc.py_allgather(self.pc.wait_time())
+      if self.rank == 0:
+        if self.load_pred is not None:
+          print('load balance: predicted imbalance %.3f' % loadbal.imbalance(self.load_pred))
+        print('load balance: actual imbalance %.3f (computation time %.3f-%.3f s, max wait %.3f s)' % (loadbal.imbalance(lstep), min(lstep), max(lstep), max(lwait)))
+
     # reverse lookup of gid to type
     def gid_to_type (self, gid):
-      for gidtype, gids in self.gid_dict.items():
-        if gid in gids:
-          return gidtype
+      return self.gidreg.gid_to_type(gid)
 
     """
     def checkInputOn (self, type):
@@ -254,6 +442,14 @@ class NetworkOnNode ():
           feed.set_prng(seed)
         feed.set_event_times(inc_evinput) # uses feed.seed
 
+      # batched feeds generate the times of all their cells before the feeds read them
+      for k,batch in self.feed_batch.items():
+        if seed is None:
+          batch.inc_prng(1)
+        else:
+          batch.set_prng(seed)
+        batch.set_event_times(inc_evinput)
+
       for k,lfeed in self.ext_list.items(): # dictionary of lists...
         for feed in lfeed: # of feeds
           if seed is None:
@@ -262,6 +458,36 @@ class NetworkOnNode ():
             feed.set_prng(seed)
           feed.set_event_times(inc_evinput) # uses feed.seed
 
+    # sets the feeds to trial i (0-based) directly: same seeds and evoked input offset
+    # as reset_src_event_times() gives after i trials of a sequential run
+    def set_trial (self, i, inc_evinput=0.0):
+      for feed in self.extinput_list:
+        feed.set_prng()
+        feed.inc_prng(1000 * i)
+        feed.set_event_times(inc_evinput * i)
+      for k,batch in self.feed_batch.items():
+        batch.set_prng()
+        batch.inc_prng(i)
+        batch.set_event_times(inc_evinput * i)
+      for k,lfeed in self.ext_list.items():
+        for feed in lfeed:
+          feed.set_prng()
+          feed.inc_prng(i)
+          feed.set_event_times(inc_evinput * i)
+
+    # reseeds every feed from its params and sets its event times, as in a new network
+    def init_src_event_times (self, inc_evinput=0.0):
+      for feed in self.extinput_list:
+        feed.set_prng()
+        feed.set_event_times(inc_evinput)
+      for k,batch in self.feed_batch.items():
+        batch.set_prng()
+        batch.set_event_times(inc_evinput)
+      for k,lfeed in self.ext_list.items():
+        for feed in lfeed:
+          feed.set_prng()
+          feed.set_event_times(inc_evinput)
+
     # parallel create cells AND external inputs (feeds)
     # these are spike SOURCES but cells are also targets
     # external inputs are not targets
@@ -274,8 +500,7 @@ class NetworkOnNode ():
           # get type of cell and pos via gid
           # now should be valid for ext inputs
           type = self.gid_to_type(gid)
-          type_pos_ind = gid - self.gid_dict[type][0]
-          pos = self.pos_dict[type][type_pos_ind]
+          pos = self.pos_dict[type][self.gidreg.pos_index(gid)]
           # figure out which cell type is assoc with the gid
           # create cells based on loc property
           # creates a NetCon object internally to Neuron
@@ -285,25 +510,25 @@ class NetworkOnNode ():
             # run the IClamp function here
             # create_all_IClamp() is defined in L2Pyr (etc)
             self.cells[-1].create_all_IClamp(self.p)
-            if self.p['save_vsoma']: self.cells[-1].record_volt_soma()
+            if self.p['save_vsoma']: self.cells[-1].record_volt_soma(self.rdt_vsoma)
           elif type == 'L5_pyramidal':
             self.cells.append(L5Pyr(gid, pos, self.p))
             self.pc.cell(gid, self.cells[-1].connect_to_target(None,self.p['threshold']))
             # run the IClamp function here
             self.cells[-1].create_all_IClamp(self.p)
-            if self.p['save_vsoma']: self.cells[-1].record_volt_soma()
+            if self.p['save_vsoma']: self.cells[-1].record_volt_soma(self.rdt_vsoma)
           elif type == 'L2_basket':
             self.cells.append(L2Basket(gid, pos))
             self.pc.cell(gid, self.cells[-1].connect_to_target(None,self.p['threshold']))
             # also run the IClamp for L2_basket
             self.cells[-1].create_all_IClamp(self.p)
-            if self.p['save_vsoma']: self.cells[-1].record_volt_soma()
+            if self.p['save_vsoma']: self.cells[-1].record_volt_soma(self.rdt_vsoma)
           elif type == 'L5_basket':
             self.cells.append(L5Basket(gid, pos))
             self.pc.cell(gid, self.cells[-1].connect_to_target(None,self.p['threshold']))
             # run the IClamp function here
             self.cells[-1].create_all_IClamp(self.p)
-            if self.p['save_vsoma']: self.cells[-1].record_volt_soma()
+            if self.p['save_vsoma']: self.cells[-1].record_volt_soma(self.rdt_vsoma)
           elif type == 'extinput':
             #print('type',type)
             # to find param index, take difference between REAL gid
@@ -313,11 +538,16 @@ class NetworkOnNode ():
             # the cell and artificial NetCon
             self.extinput_list.append(ParFeedAll(type, None, self.p_ext[p_ind], gid))
             self.pc.cell(gid, self.extinput_list[-1].connect_to_target(self.p['threshold']))
+          elif type in self.shared_keys:
+            # any cell type with params for this input: sync times are the same for all of them
+            cell_type = [ty for ty in self.cellname_list if ty in self.p_unique[type]][0]
+            self.ext_list[type].append(ParFeedAll(type, cell_type, self.p_unique[type], gid))
+            self.pc.cell(gid, self.ext_list[type][-1].connect_to_target(self.p['threshold']))
           elif type in self.p_unique.keys():
             gid_post = gid - self.gid_dict[type][0]
             cell_type = self.gid_to_type(gid_post)
             # create dictionary entry, append to list
-            self.ext_list[type].append(ParFeedAll(type, cell_type, self.p_unique[type], gid))
+            self.ext_list[type].append(ParFeedAll(type, cell_type, self.p_unique[type], gid, self.__get_feed_batch(type)))
             self.pc.cell(gid, self.ext_list[type][-1].connect_to_target(self.p['threshold']))
           else:
             print("None of these types in Net()")
@@ -326,6 +556,111 @@ class NetworkOnNode ():
           print("GID does not exist. See Cell()")
           exit()
 
+    # computes distance-dependent weight/delay factors between every cell on this node
+    # and every presynaptic cell, one numpy pass per (post type, pre type) projection
+    def __create_conn_table (self):
+      for type_post, lproj in dconn_spec.items():
+        lcell = [cell for cell in self.cells if cell.celltype == type_post]
+        if not lcell: continue
+        gid_post = np.array([cell.gid for cell in lcell])
+        pos_post = np.array([cell.pos for cell in lcell], dtype=float)
+        for i, cell in enumerate(lcell): self.conn_row[cell.gid] = i
+        self.conn_table[type_post] = []
+        for type_pre, ncfrom, lamtha, A_delay, autapses, lsyn in lproj:
+          gid_pre = np.array(self.gid_dict[type_pre])
+          pos_pre = np.array(self.pos_dict[type_pre], dtype=float)
+          # same arithmetic as Cell.parconnect_from_src(), broadcast over (post, pre)
+          dx = pos_post[:, 0, np.newaxis] - pos_pre[np.newaxis, :, 0]
+          dy = pos_post[:, 1, np.newaxis] - pos_pre[np.newaxis, :, 1]
+          d = np.sqrt(dx**2 + dy**2)
+          fac = np.exp(-(d**2) / (lamtha**2))
+          mask = np.ones(fac.shape, dtype=bool)
+          if not autapses: mask &= gid_post[:, np.newaxis] != gid_pre[np.newaxis, :]
+          proj = {
+            'type_pre': type_pre,
+            'ncfrom': ncfrom,
+            'syn': lsyn,
+            'gid_pre': gid_pre,
+            'gid_post': gid_post,
+            'fac': fac,
+            'weight': [self.p[key] * fac for key, name in lsyn],
+            'delay': A_delay / fac,
+            'mask': mask,
+            'lnc': [], # (NetCon, receptor index, post row, pre column), for update_params
+          }
+          self.__prune(proj)
+          self.conn_table[type_post].append(proj)
+
+    # per-receptor masks of the NetCons to create, dropping weights under the
+    # prune_weight / prune_frac thresholds (fraction of the weight at distance 0)
+    def __prune (self, proj):
+      prune_weight = self.p.get('prune_weight', 0.)
+      prune_frac = self.p.get('prune_frac', 0.)
+      proj['keep'] = []
+      for (key, name), weight in zip(proj['syn'], proj['weight']):
+        keep = proj['mask'].copy()
+        if prune_weight > 0.: keep &= np.abs(weight) >= prune_weight
+        if prune_frac > 0.: keep &= proj['fac'] >= prune_frac
+        proj['keep'].append(keep)
+
+    # number of NetCons (created, pruned) per projection summed over ranks, in dconn_spec order
+    # must be called on all ranks
+    def conn_counts (self):
+      lkey, lcount = [], []
+      for type_post, lproj in dconn_spec.items():
+        ltable = self.conn_table.get(type_post, [])
+        for iproj, (type_pre, ncfrom, lamtha, A_delay, autapses, lsyn) in enumerate(lproj):
+          lkey.append((type_pre, type_post))
+          if ltable:
+            proj = ltable[iproj]
+            nkeep = sum(int(keep.sum()) for keep in proj['keep'])
+            lcount += [nkeep, int(proj['mask'].sum()) * len(lsyn) - nkeep]
+          else:
+            lcount += [0, 0]
+      vcount = h.Vector(lcount)
+      self.pc.allreduce(vcount, 1)
+      lcount = vcount.to_python()
+      return [(key, int(lcount[2*i]), int(lcount[2*i+1])) for i, key in enumerate(lkey)]
+
+    # prints NetCons dropped per projection and an estimate of the memory saved
+    def prune_report (self):
+      lcount = self.conn_counts()
+      if self.rank != 0: return
+      print('connection pruning (prune_weight=%g, prune_frac=%g):' % (self.p.get('prune_weight', 0.), self.p.get('prune_frac', 0.)))
+      ntot, ndrop = 0, 0
+      for (type_pre, type_post), nkeep, npruned in lcount:
+        ntot += nkeep + npruned
+        ndrop += npruned
+        if nkeep + npruned > 0:
+          print('  %14s -> %-14s kept %9d, dropped %9d (%5.1f%%)' % (type_pre, type_post, nkeep, npruned, 100. * npruned / (nkeep + npruned)))
+      if ntot > 0:
+        print('  total dropped %d of %d NetCons (%.1f%%), ~%.1f MB saved' % (ndrop, ntot, 100. * ndrop / ntot, ndrop * nc_bytes / 1e6))
+
+    # instantiates the NetCons for one cell from the connectivity table
+    def __parconnect_table (self, cell):
+      if cell.celltype not in self.conn_table: return
+      i = self.conn_row[cell.gid]
+      for proj in self.conn_table[cell.celltype]:
+        lnc = getattr(cell, proj['ncfrom'])
+        lsyn = [cell.get_synapse(name) for key, name in proj['syn']]
+        lw = [weight[i] for weight in proj['weight']]
+        lkeep = [keep[i] for keep in proj['keep']]
+        delay = proj['delay'][i]
+        for j in np.flatnonzero(np.any(lkeep, axis=0)):
+          gid_src = int(proj['gid_pre'][j])
+          for k, (syn, w, keep) in enumerate(zip(lsyn, lw, lkeep)):
+            if keep[j]:
+              lnc.append(cell.parconnect_gid(gid_src, syn, w[j], delay[j], self.p['threshold']))
+              proj['lnc'].append((lnc[-1], k, i, j))
+
+    # returns the ParFeedBatch of a unique feed type when feed_batch is on (created on first use)
+    def __get_feed_batch (self, type):
+      if not self.p.get('feed_batch', 0): return None
+      if type not in self.feed_batch:
+        lcelltype = [self.gid_to_type(gid) for gid in range(self.N_cells)]
+        self.feed_batch[type] = ParFeedBatch(type, self.p_unique[type], lcelltype, self.gid_dict[type][0])
+      return self.feed_batch[type]
+
     # connections:
     # this NODE is aware of its cells as targets
     # for each syn, return list of source GIDs.
@@ -337,20 +672,86 @@ class NetworkOnNode ():
       # cells has NO extinputs anyway. also no extgausses
       for gid, cell in zip(self.__gid_list, self.cells):
         # ignore iteration over inputs, since they are NOT targets
-        if self.pc.gid_exists(gid) and self.gid_to_type(gid) is not 'extinput':
+        if self.pc.gid_exists(gid) and self.gid_to_type(gid) != 'extinput':
           # print("rank:", self.rank, "gid:", gid, cell, self.gid_to_type(gid))
           # for each gid, find all the other cells connected to it, based on gid
           # this MUST be defined in EACH class of cell in self.cells
           # parconnect receives connections from other cells
           # parreceive receives connections from external inputs
-          cell.parconnect(gid, self.gid_dict, self.pos_dict, self.p)
-          cell.parreceive(gid, self.gid_dict, self.pos_dict, self.p_ext)
-          # now do the unique inputs specific to these cells
-          # parreceive_ext receives connections from UNIQUE external inputs
-          for type in self.p_unique.keys():
-            p_type = self.p_unique[type]
-            # print('parnet_connect p_type:',p_type)
-            cell.parreceive_ext(type, gid, self.gid_dict, self.pos_dict, p_type)
+          if self.legacy_connect:
+            cell.parconnect(gid, self.gid_dict, self.pos_dict, self.p)
+          else:
+            self.__parconnect_table(cell)
+          self.__parreceive_feeds(cell)
+
+    # connects the external inputs (feeds) to one cell
+    def __parreceive_feeds (self, cell):
+      cell.parreceive(cell.gid, self.gid_dict, self.pos_dict, self.p_ext)
+      # now do the unique inputs specific to these cells
+      # parreceive_ext receives connections from UNIQUE external inputs
+      for type in self.p_unique.keys():
+        p_type = self.p_unique[type]
+        # print('parnet_connect p_type:',p_type)
+        cell.parreceive_ext(type, cell.gid, self.gid_dict, self.pos_dict, p_type)
+
+    # applies the params in p_new to this network in place: cell-to-cell NetCon weights,
+    # feed params, connections and event times, IClamps and cell biophysics; the feeds
+    # are reseeded as in a new network even when no param changed
+    # returns the changed params that need a new NetworkOnNode instead (the network is
+    # then left as it was); an empty list means the update was applied
+    # must be called on all ranks with the same p_new, before h.finitialize()
+    def update_params (self, p_new, inc_evinput=0.0):
+      lchanged = [key for key in p_new.keys() if key not in self.p or p_new[key] != self.p[key]]
+      if not lchanged:
+        self.init_src_event_times(inc_evinput)
+        return []
+      p_ext, p_unique = paramrw.create_pext(p_new, h.tstop)
+      lrebuild = self.__rebuild_keys(p_new, lchanged, p_ext, p_unique)
+      if lrebuild: return lrebuild
+      self.p = p_new
+      self.p_ext, self.p_unique = p_ext, p_unique
+      self.__set_shared_evinputs()
+      if [key for key in lchanged if key in lconn_weight_keys]: self.__update_weights()
+      self.__update_feeds(inc_evinput)
+      lbiophys = [key for key in lchanged if key.startswith(('L2Pyr_', 'L5Pyr_'))]
+      for cell in self.cells:
+        cell.create_all_IClamp(self.p)
+        if lbiophys and cell.celltype in ('L2_pyramidal', 'L5_pyramidal'): cell.set_biophys(self.p)
+      return []
+
+    # changed params that cannot be applied to the existing cells, sources and NetCons
+    def __rebuild_keys (self, p_new, lchanged, p_ext, p_unique):
+      lrebuild = [key for key in lchanged if key in ltopology_keys]
+      lrebuild += [key for key in lchanged if key.startswith(('L2Pyr_', 'L5Pyr_')) and not any(tag in key for tag in lbiophys_tags)]
+      # cell-to-cell NetCons are only kept in the connectivity table, and with
+      # prune_weight the weights decide which NetCons exist
+      if self.legacy_connect or p_new.get('prune_weight', 0.) > 0.:
+        lrebuild += [key for key in lchanged if key in lconn_weight_keys]
+      # the number of feeds and the sources of the evoked inputs must stay the same
+      if [feed['loc'] for feed in p_ext] != [feed['loc'] for feed in self.p_ext]: lrebuild.append('p_ext')
+      if sorted(p_unique.keys()) != sorted(self.p_unique.keys()): lrebuild.append('p_unique')
+      elif sorted(get_shared_keys(p_new, p_unique)) != sorted(self.shared_keys): lrebuild.append('sync_evinput')
+      return lrebuild
+
+    # rescales the cell-to-cell NetCons from the connectivity table
+    # delays only depend on distance (A_delay in dconn_spec), so they do not change
+    def __update_weights (self):
+      for ltable in self.conn_table.values():
+        for proj in ltable:
+          proj['weight'] = [self.p[key] * proj['fac'] for key, name in proj['syn']]
+          for nc, k, i, j in proj['lnc']: nc.weight[0] = proj['weight'][k][i, j]
+
+    # gives the feeds their new params, reseeds them as in a new network and
+    # reconnects them to the cells on this node (feed weights/delays are set by the cells)
+    def __update_feeds (self, inc_evinput=0.0):
+      for feed in self.extinput_list: feed.p_ext = self.p_ext[feed.gid - self.gid_dict['extinput'][0]]
+      for type, batch in self.feed_batch.items(): batch.p_ext = self.p_unique[type]
+      for type, lfeed in self.ext_list.items():
+        for feed in lfeed: feed.p_ext = self.p_unique[type]
+      self.init_src_event_times(inc_evinput)
+      for cell in self.cells:
+        for key in ['ncfrom_extinput', 'ncfrom_extgauss', 'ncfrom_extpois', 'ncfrom_ev']: setattr(cell, key, [])
+        self.__parreceive_feeds(cell)
 
     # setup spike recording for this node
     def __record_spikes (self):
@@ -361,15 +762,44 @@ class NetworkOnNode ():
         if self.pc.gid_exists(gid):
           self.pc.spike_record(gid, self.spiketimes, self.spikegids)
 
+    # all feeds (VecStim sources) on this node
+    def get_feeds (self):
+      return self.extinput_list + [feed for key in sorted(self.ext_list.keys()) for feed in self.ext_list[key]]
+
+    # vectors recorded by the cells on this node, in a fixed order; vsoma: with the
+    # somatic voltages
+    def get_rec_vectors (self, vsoma=True):
+      lvec = []
+      for cell in self.cells:
+        if vsoma and hasattr(cell, 'vsoma'): lvec.append(cell.vsoma)
+        if hasattr(cell, 'dict_currents'): lvec += [cell.dict_currents[key] for key in sorted(cell.dict_currents.keys())]
+        if hasattr(cell, 'dpl_rec'): lvec += cell.dpl_rec
+      return lvec
+
+    # recording interval of each vector of get_rec_vectors() (ms, 0: every step)
+    def get_rec_intervals (self):
+      lrdt = []
+      for cell in self.cells:
+        if hasattr(cell, 'vsoma'): lrdt.append(self.rdt_vsoma)
+        if hasattr(cell, 'dict_currents'): lrdt += [self.rdt_rec] * len(cell.dict_currents)
+        if hasattr(cell, 'dpl_rec'): lrdt += [self.rdt_rec] * len(cell.dpl_rec)
+      return lrdt
+
+    # gids, cell types and somatic voltage vectors of the cells on this node that record them
     def get_vsoma (self):
-      dsoma = {}
-      for cell in self.cells: dsoma[cell.gid] = (cell.celltype, np.array(cell.vsoma.to_python()))
-      return dsoma
+      lcell = [cell for cell in self.cells if hasattr(cell, 'vsoma')]
+      return [cell.gid for cell in lcell], [cell.celltype for cell in lcell], [cell.vsoma for cell in lcell]
 
     # aggregate recording all the somatic voltages for pyr
-    def aggregate_currents (self):
+    # n: number of recorded time points. the cells are added to the sums of the earlier
+    # trials, as in the reference outputs of tests/test_compare_hnn.py; reset: start from
+    # zero (the windows of streaming mode in run.py)
+    def aggregate_currents (self, n, reset=False):
       """ this method must be run post-integration
       """
+      for vec in self.current.values():
+        if reset: vec.resize(0)
+        vec.resize(n) # new points are zero
       # this is quite ugly
       for cell in self.cells:
         # check for celltype
@@ -386,6 +816,48 @@ class NetworkOnNode ():
             # in parallel, each node has its own Net()
             self.current['L2Pyr_soma'].add(I_soma)
 
+    # runs this node on nthread threads. the dipoles are then summed per cell (see
+    # Cell.dipole_cellsum) and added up by aggregate_dipoles after the run. multisplit
+    # also splits each pyramidal cell at soma(0) so its basal and apical pieces can go to
+    # different threads
+    def setup_threads (self, nthread, multisplit=False):
+      self.pc.nthread(nthread)
+      self.nthread = nthread
+      if nthread < 2: return
+      for cell in self.cells:
+        if hasattr(cell, 'dipole_pp'): cell.dipole_cellsum(multisplit, self.rdt_rec)
+      # events between threads need a delay of at least two steps (the extgauss NetCons
+      # of the L2 baskets get their weight, 0 by default, as delay in L2_basket.py)
+      for nc in h.List('NetCon'):
+        if nc.delay < 2. * h.dt: nc.delay = 2. * h.dt
+      self.multisplit = multisplit
+      if multisplit:
+        for cell in self.cells:
+          if hasattr(cell, 'dipole_pp'): self.pc.multisplit(cell.soma(0), cell.gid)
+        self.pc.multisplit()
+
+    # empties the per cell current and dipole recordings (streaming mode in run.py), and the
+    # somatic voltages if vsoma
+    def clear_recordings (self, vsoma=False):
+      for cell in self.cells:
+        if vsoma and hasattr(cell, 'vsoma'): cell.vsoma.resize(0)
+        if hasattr(cell, 'dict_currents'):
+          for vec in cell.dict_currents.values(): vec.resize(0)
+        for vec in getattr(cell, 'dpl_rec', []): vec.resize(0)
+
+    # with threads, sets the L2 and L5 dipole recordings to the sums of the per cell dipoles
+    # (setup_threads); n: number of recorded time points
+    def aggregate_dipoles (self, dp_rec_L2, dp_rec_L5, n):
+      if self.nthread < 2: return
+      for vec in [dp_rec_L2, dp_rec_L5]:
+        vec.resize(n)
+        vec.fill(0.)
+      for cell in self.cells:
+        if not hasattr(cell, 'dpl_rec'): continue
+        for vec in cell.dpl_rec:
+          if cell.celltype.startswith('L2'): dp_rec_L2.add(vec)
+          elif cell.celltype.startswith('L5'): dp_rec_L5.add(vec)
+
     # recording debug function
     def rec_debug (self, rank_exec, gid):
       # only execute on this rank, make sure called properly
@@ -398,28 +870,46 @@ class NetworkOnNode ():
           v.record(self.cells[n].soma(0.5)._ref_v)
           return v
 
-    # initializes the state closer to baseline
-    def state_init (self):
+    # voltages of every segment on this node, from one template per cell type
+    def __create_vinit (self):
+      lref, lval, dtmpl = [], [], {}
+      for cell in self.cells:
+        if cell.celltype not in dtmpl: dtmpl[cell.celltype] = statetemplate.vinit_values(cell)
+        lref += [ref for name, ref in statetemplate.get_refs(cell, False)]
+        lval.append(dtmpl[cell.celltype])
+      if lval: lval = np.concatenate(lval)
+      return statetemplate.StateSetter(lref, lval)
+
+    # reads full-state templates (see statetemplate.py), applied by state_restore()
+    # cell types whose template does not match their states are left out
+    def load_state_template (self, fname):
+      dtmpl = statetemplate.read(fname)
+      if dtmpl is None: return
+      lref, lval, lskip = [], [], []
       for cell in self.cells:
-        seclist = h.SectionList()
-        seclist.wholetree(sec=cell.soma)
-        for sect in seclist:
-          for seg in sect:
-            if cell.celltype == 'L2_pyramidal':
-              seg.v = -71.46
-            elif cell.celltype == 'L5_pyramidal':
-              if sect.name() == 'L5Pyr_apical_1':
-                seg.v = -71.32
-              elif sect.name() == 'L5Pyr_apical_2':
-                seg.v = -69.08
-              elif sect.name() == 'L5Pyr_apical_tuft':
-                seg.v = -67.30
-              else:
-                seg.v = -72.
-            elif cell.celltype == 'L2_basket':
-              seg.v = -64.9737
-            elif cell.celltype == 'L5_basket':
-              seg.v = -64.9737
+        if cell.celltype not in dtmpl:
+          if cell.celltype not in lskip: lskip.append(cell.celltype)
+          continue
+        lname, vals = dtmpl[cell.celltype]
+        lcellref = statetemplate.get_refs(cell)
+        if [name for name, ref in lcellref] != lname:
+          if cell.celltype not in lskip: lskip.append(cell.celltype)
+          continue
+        lref += [ref for name, ref in lcellref]
+        lval.append(vals)
+      for celltype in lskip: print("Warning: no matching state template for %s in %s" % (celltype, fname))
+      if lval: self.sinit = statetemplate.StateSetter(lref, np.concatenate(lval))
+
+    # initializes the voltages closer to baseline (before h.finitialize())
+    def state_init (self):
+      self.vinit.apply()
+
+    # sets the full states from the loaded templates; call after h.finitialize(),
+    # which computes the gating states from the voltages
+    def state_restore (self):
+      if self.sinit is None: return
+      self.sinit.apply()
+      if h.cvode.active(): h.cvode.re_init()
 
     # move cells 3d positions to positions used for wiring
     def movecellstopos (self):
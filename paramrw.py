@@ -452,6 +452,29 @@ class ExpParams():
 
         return key_dict
 
+# decimation factor of the saved recordings: record_dt as a whole number of dt steps
+# (1: every step)
+def recfactor (d):
+  if type(d)==str: d = quickreadprm(d)
+  if 'record_dt' not in d or 'dt' not in d: return 1
+  dt, rdt = float(d['dt']), float(d['record_dt'])
+  if rdt <= dt: return 1
+  return int(round(rdt / dt))
+
+# sample interval (ms) of the saved recordings
+def recdt (d):
+  if type(d)==str: d = quickreadprm(d)
+  return recfactor(d) * float(d['dt'])
+
+# intervals (ms, 0: every step) at which NEURON records the somatic voltages and the
+# other vectors (time, dipoles, currents). with record_aa the other vectors are recorded
+# every step and decimated with a low-pass filter after the reduction (see decimate.py)
+def recintervals (d):
+  if recfactor(d) == 1: return 0.0, 0.0
+  rdt = recdt(d)
+  if 'record_aa' not in d or int(d['record_aa']): return rdt, 0.0
+  return rdt, rdt
+
 # reads params from a generated txt file and returns gid dict and p dict 
 def read (fparam):
     lines = fio.clean_lines(fparam)
@@ -488,6 +511,8 @@ def write(fparam, p, gid_list):
   # specifically, lambda sorting in place?
   # p_sorted = [item for item in p.items()]
   # p_sorted.sort(key=lambda x: x[0])
+  # gid_list may also be a GidRegistry
+  if hasattr(gid_list, 'gid_dict'): gid_list = gid_list.gid_dict()
   # open the file for writing
   with open(fparam, 'w') as f:
     pstring = '%26s: '
@@ -181,7 +181,32 @@ def get_params_default (nprox = 2, ndist = 1):
         'T_pois': -1,
         'dt': 0.025,
         'celsius': 37.0,
-        'threshold': 0.0 # firing threshold
+
+        # interval (ms) of the saved recordings, a multiple of dt (0 records every step);
+        # with record_aa the dipoles and currents are low-pass filtered before they are
+        # decimated, otherwise they are sampled (somatic voltages and LFP are sampled)
+        'record_dt': 0.,
+        'record_aa': 1,
+
+        # variable step integration with CVODE (0 fixed step with dt); recordings are
+        # interpolated onto the dt grid after the run. opt-in only: the network's events
+        # make it much slower than fixed steps (see bench_cvode.py)
+        'cvode': 0,
+        'cvode_atol': 1e-3, # absolute tolerance
+        'cvode_rtol': 0., # relative tolerance
+        'threshold': 0.0, # firing threshold
+
+        # cell-to-cell connection pruning (0 disables)
+        # NetCons with weight below either threshold are not created
+        'prune_weight': 0., # absolute weight
+        'prune_frac': 0., # fraction of the projection's peak weight (weight at distance 0)
+
+        # 1 generates extpois/extgauss/evoked feed times for all cells in one vectorized call
+        # per feed type (one prng stream per type); 0 keeps the per-gid prng streams
+        'feed_batch': 0,
+        # 1 uses one source per rank for each evoked input when sync_evinput is on
+        # (instead of one per cell); the dipole and cell spikes are unchanged
+        'evinput_shared': 0,
     }
 
     # grab cell-specific params and update p accordingly
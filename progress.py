@@ -0,0 +1,132 @@
+# progress.py - machine-readable simulation progress (run.py progress argument)
+#
+# rank 0 of each simulation (of each trial group) writes one JSON object per line to
+# the progress destination:
+#   a file name: appended to, e.g. a named pipe or a file the reader follows
+#   fd:N: an open file descriptor inherited from the parent process
+#   tcp:PORT: a socket connection to a local listener
+# records (all have 'event', 'group' and 'wall', the s since the stream was opened):
+#   {"event": "start", "ntrial": 2, "tstop": 170.0, "nhost": 4}
+#   {"event": "progress", "trial": 0, "t": 20.0, "rate": 85.3, "eta": 3.75,
+#    "step_time": [...], "wait_time": [...]}
+#     rate: simulated ms per wall s of the current trial; eta: s left for all trials
+#     step_time, wait_time: s each rank spent integrating and waiting for spike
+#     exchange in the last window (ParallelContext step_time and wait_time)
+#   {"event": "trial", "trial": 0, "twall": 1.99}: trial done
+#   {"event": "done"}
+#
+# reading a progress file: for d in progress.follow(fname, proc): ...
+
+import os
+import json
+import socket
+import time
+from neuron import h
+
+dtwin = 10. # ms of simulated time between progress records
+
+def open_dest (dest):
+  if dest.startswith('fd:'): return os.fdopen(int(dest[3:]), 'w', 1)
+  if dest.startswith('tcp:'):
+    sock = socket.create_connection(('127.0.0.1', int(dest[4:])))
+    return sock.makefile('w', 1)
+  return open(dest, 'a', 1)
+
+class ProgressStream ():
+  # dest: destination (see above), only opened on rank 0; ntrial: trials this rank runs,
+  # for the eta; group: trial group of this rank
+  def __init__ (self, dest, pc, ntrial=1, tstop=0., group=0):
+    self.pc = pc
+    self.group = group
+    self.fp = None
+    if int(pc.id()) == 0:
+      try:
+        self.fp = open_dest(dest)
+      except (OSError, ValueError):
+        print("Warning: could not open progress destination %s" % dest)
+    self.t0 = time.time()
+    self.ntrial = ntrial
+    self.tstop = tstop
+    self.trial = 0
+
+  def emit (self, event, **kw):
+    if self.fp is None: return
+    d = {'event': event, 'group': self.group, 'wall': round(time.time() - self.t0, 4)}
+    d.update(kw)
+    try:
+      self.fp.write(json.dumps(d) + '\n')
+    except OSError: # reader went away
+      self.fp = None
+
+  def start (self):
+    self.emit('start', ntrial=self.ntrial, tstop=self.tstop, nhost=int(self.pc.nhost()))
+
+  # call on all ranks after h.finitialize (and any restored state) of trial i
+  def start_trial (self, i):
+    self.trial = i
+    self.tstop = h.tstop
+    self.tw0, self.tsim0 = time.time(), h.t
+    self.step0, self.wait0 = self.pc.step_time(), self.pc.wait_time()
+
+  # call on all ranks after each integration window; gathers the per rank times
+  def tick (self):
+    step, wait = self.pc.step_time(), self.pc.wait_time()
+    lst = self.pc.py_gather((step - self.step0, wait - self.wait0), 0)
+    self.step0, self.wait0 = step, wait
+    if lst is None or self.fp is None: return
+    dtw = time.time() - self.tw0
+    rate = (h.t - self.tsim0) / dtw if dtw > 0. else 0.
+    left = self.tstop - h.t + (self.ntrial - self.trial - 1) * self.tstop
+    eta = left / rate if rate > 0. else None
+    self.emit('progress', trial=self.trial, t=round(h.t, 4), rate=round(rate, 3), eta=None if eta is None else round(eta, 3),
+              step_time=[round(x[0], 4) for x in lst], wait_time=[round(x[1], 4) for x in lst])
+
+  def end_trial (self):
+    self.emit('trial', trial=self.trial, twall=round(time.time() - self.tw0, 4))
+
+  def close (self):
+    self.emit('done')
+    if self.fp is not None: self.fp.close()
+    self.fp = None
+
+# pc.psolve to tstop in windows of dtwin ms, calling stream.tick() after each
+def psolve (pc, tstop, stream):
+  while h.t < tstop:
+    pc.psolve(min(h.t + dtwin, tstop))
+    stream.tick()
+
+# yields the records of a progress file as they are written, until the 'done' record
+# or, if proc (a Popen) is given, until proc exits
+def follow (fname, proc=None, poll=0.2):
+  while not os.path.exists(fname):
+    if proc is not None and proc.poll() is not None: return
+    time.sleep(poll)
+  with open(fname, 'r') as fp:
+    buf = ''
+    while True:
+      line = fp.readline()
+      if not line:
+        if proc is not None and proc.poll() is not None: return
+        time.sleep(poll)
+        continue
+      buf += line
+      if not buf.endswith('\n'): continue # partial line
+      try:
+        d = json.loads(buf)
+      except ValueError:
+        d = None
+      buf = ''
+      if d is None: continue
+      yield d
+      if d['event'] == 'done': return
+
+# one line summary of a progress record, e.g. for a status display
+def describe (d):
+  if d['event'] == 'progress':
+    s = 'Trial %d: simulation time %.1f ms, %.1f ms/s' % (d['trial'] + 1, d['t'], d['rate'])
+    if d.get('eta') is not None: s += ', %.0f s left' % d['eta']
+    if d['wait_time'] and max(d['wait_time']) > 0.:
+      s += ', max wait %.2f s (rank %d)' % (max(d['wait_time']), d['wait_time'].index(max(d['wait_time'])))
+    return s
+  if d['event'] == 'trial': return 'Trial %d done in %.2f s' % (d['trial'] + 1, d['twall'])
+  return d['event']
@@ -60,7 +60,7 @@ def pspec_dpl(f_spec, f_dpl, dfig, p_dict, key_types, xlim=None, ylim=None, f_pa
         spec.plot_pgram(f.ax['pgram'])
 
     except KeyError:
-        pgram = specfn.Welch(dpl.t, dpl.dpl['agg'], p_dict['dt'])
+        pgram = specfn.Welch(dpl.t, dpl.dpl['agg'], paramrw.recdt(p_dict))
         pgram.plot_to_ax(f.ax['pgram'], spec.spec['agg']['f'][-1])
 
     # plot and create an xlim
@@ -0,0 +1,32 @@
+# recstream.py - on-disk store for streaming recording (run.py streamwin)
+#
+# in streaming mode the run advances in windows of streamwin ms. after each window the
+# time, the L2/L5 dipoles and the summed L2/L5 somatic currents recorded in it are
+# reduced across ranks, rank 0 appends them to a raw float64 file and all ranks empty
+# their recording vectors, so the recordings no longer grow with tstop. after the run
+# the store is memory-mapped for the post-processing and output files
+
+import os
+import numpy as np
+
+# columns of a row of the store
+lcol = ['t', 'L2', 'L5', 'L2Pyr_soma', 'L5Pyr_soma']
+
+class RecStore ():
+  # fname: the raw file, replaced by each run
+  def __init__ (self, fname, ncol=len(lcol)):
+    self.fname = fname
+    self.ncol = ncol
+    if os.path.isfile(fname): os.remove(fname)
+    self.nrow = 0
+
+  # appends the rows of x (n x ncol)
+  def append (self, x):
+    x = np.ascontiguousarray(x, dtype='float64').reshape(-1, self.ncol)
+    with open(self.fname, 'ab') as fp: fp.write(x.tobytes())
+    self.nrow += x.shape[0]
+
+  # everything appended, as a read-only nrow x ncol memory map
+  def read (self):
+    if self.nrow == 0: return np.zeros((0, self.ncol))
+    return np.memmap(self.fname, dtype='float64', mode='r', shape=(self.nrow, self.ncol))
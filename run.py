@@ -15,19 +15,30 @@ from neuron import h
 h.load_file("stdrun.hoc")
 # Cells are defined in other files
 import network
+import ckpt
+import earlyabort
+import progress
+import simprofile
+import simbundle
+import recstream
+import decimate
+import vsomastore
+import simserver
+import sweep
 import fileio as fio
+import spikefn
 import paramrw as paramrw
 from paramrw import usingOngoingInputs
 import plotfn as plotfn
 import specfn as specfn
-import pickle
-from dipolefn import Dipole
+from dipolefn import Dipole, write_dpl
 from conf import readconf
 from L5_pyramidal import L5Pyr
 from L2_pyramidal import L2Pyr
 from L2_basket import L2Basket
 from L5_basket import L5Basket
 from lfp import LFPElectrode
+from cell import record as recordvec
 from morphology import shapeplot, getshapecoords
 import traceback
 
@@ -38,9 +49,21 @@ dproj = dconf['datdir'] # fio.return_data_dir(dconf['datdir'])
 debug = dconf['debug']
 pc = h.ParallelContext()
 pcID = int(pc.id())
+writer = fio.AsyncWriter(lambda dt: simprofile.add('write', dt)) # output files are written in the background (see savedat)
 f_psim = ''
 ntrial = 1
 simlength = 0.0
+forkat = 0.0 # time (ms) of a shared checkpoint, e.g. the start of an optimization chunk
+streamwin = dconf['streamwin'] # > 0: ms between flushes of the recordings to disk (see recstream.py)
+vspool = None # streamed somatic voltages of this rank (see vsomastore.ShardSpool)
+progressf = '' # destination of the JSON lines progress stream (see progress.py)
+abortf = '' # optimization target file: stop runs that can not beat its error (see earlyabort.py)
+serverport = 0 # > 0: run as a simulation server on this port (see simserver.py)
+trialgroups = dconf['trialgroups'] # > 1: run the trials in parallel on this many groups of ranks
+sweepcores = 0 # > 0: run all simulations of the param file on groups of this many ranks (see sweep.py)
+nthread = dconf['nthread'] # threads per rank
+cacheeff = dconf['cacheeff'] # 1: cache efficient memory layout
+multisplit = dconf['multisplit'] # 1: split pyramidal cells when threads outnumber them, 2: always
 testLFP = dconf['testlfp']; 
 testlaminarLFP = dconf['testlaminarlfp']
 lelec = [] # list of LFP electrodes
@@ -59,29 +82,48 @@ for i in range(len(sys.argv)):
   elif sys.argv[i] == 'simlength' and i+1<len(sys.argv):
     simlength = float(sys.argv[i+1])
     if pcID==0 and debug: print('simlength:',simlength)
+  elif sys.argv[i] == 'forkat' and i+1<len(sys.argv):
+    forkat = float(sys.argv[i+1])
+    if pcID==0 and debug: print('forkat:',forkat)
+  elif sys.argv[i] == 'streamwin' and i+1<len(sys.argv):
+    streamwin = float(sys.argv[i+1])
+    if pcID==0 and debug: print('streamwin:',streamwin)
+  elif sys.argv[i] == 'progress' and i+1<len(sys.argv):
+    progressf = sys.argv[i+1]
+    if pcID==0 and debug: print('progressf:',progressf)
+  elif sys.argv[i] == 'abort' and i+1<len(sys.argv):
+    abortf = sys.argv[i+1]
+    if pcID==0 and debug: print('abortf:',abortf)
+  elif sys.argv[i] == 'trialgroups' and i+1<len(sys.argv):
+    trialgroups = int(sys.argv[i+1])
+    if pcID==0 and debug: print('trialgroups:',trialgroups)
+  elif sys.argv[i] == 'nthread' and i+1<len(sys.argv):
+    nthread = max(1, int(sys.argv[i+1]))
+    if pcID==0 and debug: print('nthread:',nthread)
+  elif sys.argv[i] == 'cacheeff':
+    cacheeff = 1
+  elif sys.argv[i] == 'multisplit':
+    multisplit = 2
+    if i+1<len(sys.argv) and sys.argv[i+1].isdigit(): multisplit = int(sys.argv[i+1])
+  elif sys.argv[i] == 'sweep':
+    sweepcores = 1
+    if i+1<len(sys.argv) and sys.argv[i+1].isdigit(): sweepcores = max(1, int(sys.argv[i+1]))
+    if pcID==0 and debug: print('sweepcores:',sweepcores)
+  elif sys.argv[i] == 'server':
+    serverport = simserver.defport
+    if i+1<len(sys.argv) and sys.argv[i+1].isdigit(): serverport = int(sys.argv[i+1])
 
 if not foundprm:
   f_psim = os.path.join('param','default.param')
   if pcID==0 and debug: print(f_psim)
 
-simstr = f_psim.split(os.path.sep)[-1].split('.param')[0]
-datdir = os.path.join(dproj,simstr)
-
-# spike write function
+# spike write function: gathers the spikes of all nodes on rank 0 (in node order),
+# which writes them in one go in the [sim] spkfmt format(s)
 def spikes_write (net, filename_spikes):
-  f = open(filename_spikes,'w')
-  f.close() # first make sure writes to an empty file
-  for rank in range(int(pc.nhost())):
-    # guarantees node order and no competition
-    pc.barrier()
-    if rank == int(pc.id()):
-      # net.spiketimes and net.spikegids are type h.Vector()
-      L = int(net.spikegids.size())
-      with open(filename_spikes, 'a') as file_spikes:
-        for i in range(L):
-          file_spikes.write('%3.2f\t%d\n' % (net.spiketimes.x[i], net.spikegids.x[i]))
-  # let all nodes iterate through loop in which only one rank writes
-  pc.barrier()
+  # net.spiketimes and net.spikegids are type h.Vector()
+  spk = np.column_stack((net.spiketimes.to_python(), net.spikegids.to_python())).reshape(-1, 2)
+  with simprofile.phase('reduce'): lspk = pc.py_gather(spk, 0)
+  if int(pc.id()) == 0: writer.submit(spikefn.write_spikes_indexed, filename_spikes, np.concatenate(lspk), dconf['spkfmt'])
 
 # copies param file into root dsim directory
 def copy_paramfile (dsim, f_psim, str_date):
@@ -96,74 +138,71 @@ def prsimtime ():
   sys.stdout.write('\rSimulation time: {0} ms...'.format(round(h.t,2)))
   sys.stdout.flush()
 
-# save somatic voltage of all cells to pkl object
-def save_vsoma ():
-  for host in range(int(pc.nhost())):
-    if host == pcID:
-      dsoma = net.get_vsoma()
-      messageid = pc.pack(dsoma) # create a message ID and store this value
-      pc.post(host,messageid) # post the message
-  if pcID==0:
-    dsomaout = {}
-    for host in range(int(pc.nhost())):
-      pc.take(host)
-      dsoma_node = pc.upkpyobj()
-      for k,v in dsoma_node.items(): dsomaout[k] = v
-    dsomaout['vtime'] = t_vec.to_python()
-    # print('dsomaout.keys():',dsomaout.keys(),'file:',doutf['file_vsoma'])
-    pickle.dump(dsomaout,open(doutf['file_vsoma'],'wb'))
-
-#
-def savedat (p, rank, t_vec, dp_rec_L2, dp_rec_L5, net):
+# save somatic voltages: every rank writes the shard of its cells and rank 0 the index
+# (see vsomastore.py); t: recorded times (rank 0)
+def save_vsoma (t):
+  global vspool
+  fname = doutf['file_vsoma']
+  if vspool is not None: # streamed windows, already on disk
+    writer.submit(vspool.finish)
+    vspool = None
+  else:
+    gids, celltypes, lvec = net.get_vsoma()
+    if lvec: x = np.array([vec.as_numpy() for vec in lvec], dtype=dconf['vsomafmt']) # a copy: the vectors record the next trial
+    else: # no cells on this rank
+      nt = int(round(h.t / net.rdt_vsoma)) + 1 if net.rdt_vsoma > 0. else int(t_vec.size())
+      x = np.zeros((0, nt), dtype=dconf['vsomafmt'])
+    writer.submit(vsomastore.write_shard, fname, pcID, gids, celltypes, x)
+  if pcID == 0: writer.submit(vsomastore.write_index, fname, int(pc.nhost()), np.array(t), dconf['vsomafmt'])
+
+# writes the outputs of a run; the dipole is post-processed in memory and all files are
+# written by the background writer. t, L2, L5 (dipoles), IL2, IL5 (somatic currents) are
+# the reduced recordings on rank 0. returns the normalized Dipole on rank 0 (None elsewhere)
+def savedat (p, rank, t, L2, L5, IL2, IL5, net):
   global doutf
+  dpl = None
   # write time and calculated dipole to data file only if on the first proc
   # only execute this statement on one proc
   if rank == 0:
     # write params to the file
-    paramrw.write(doutf['file_param'], p, net.gid_dict)
+    writer.submit(paramrw.write, doutf['file_param'], dict(p), net.gidreg)
+    writer.submit(net.gidreg.save, doutf['file_gidreg'])
     # write the raw dipole
-    with open(doutf['file_dpl'], 'w') as f:
-      for k in range(int(t_vec.size())):
-        f.write("%03.3f\t" % t_vec.x[k])
-        f.write("%9.8f\t" % (dp_rec_L2.x[k] + dp_rec_L5.x[k]))
-        f.write("%9.8f\t" % dp_rec_L2.x[k])
-        f.write("%9.8f\n" % dp_rec_L5.x[k])
+    rawdpl = np.column_stack((t, L2 + L5, L2, L5))
+    writer.submit(write_dpl, doutf['file_dpl'], rawdpl, dconf['outfmt'])
     # renormalize the dipole and save
-    dpl = Dipole(doutf['file_dpl']) # fix to allow init from data rather than file
-    dpl.baseline_renormalize(doutf['file_param'])
+    dpl = Dipole(rawdpl)
+    dpl.baseline_renormalize(p)
     dpl.convert_fAm_to_nAm()
-    dconf['dipole_scalefctr'] = dpl.scale(paramrw.find_param(doutf['file_param'],'dipole_scalefctr'))
-    dpl.smooth(paramrw.find_param(doutf['file_param'],'dipole_smooth_win')/h.dt)
-    dpl.write(doutf['file_dpl_norm'])
+    dconf['dipole_scalefctr'] = dpl.scale(p['dipole_scalefctr'])
+    dpl.smooth_ms(p['dipole_smooth_win']) # at the sample interval of the recordings
+    writer.submit(dpl.write, doutf['file_dpl_norm'], dconf['outfmt'])
     # write the somatic current to the file
     # for now does not write the total but just L2 somatic and L5 somatic
-    with open(doutf['file_current'], 'w') as fc:
-      for t, i_L2, i_L5 in zip(t_vec.x, net.current['L2Pyr_soma'].x, net.current['L5Pyr_soma'].x):
-        fc.write("%03.3f\t" % t)
-        # fc.write("%5.4f\t" % (i_L2 + i_L5))
-        fc.write("%5.4f\t" % i_L2)
-        fc.write("%5.4f\n" % i_L5)
+    current = np.column_stack((t, IL2, IL5))
+    writer.submit(writecurrent, doutf['file_current'], current)
   # write output spikes
-  file_spikes_tmp = fio.file_spike_tmp(dproj)
-  spikes_write(net, file_spikes_tmp)
-  # move the spike file to the spike dir
-  if rank == 0: shutil.move(file_spikes_tmp, doutf['file_spikes'])
-  if p['save_vsoma']: save_vsoma()
+  spikes_write(net, doutf['file_spikes'])
+  if p['save_vsoma']: save_vsoma(t)
   for i,elec in enumerate(lelec):
     elec.lfpout(fn=doutf['file_lfp'].split('.txt')[0]+'_'+str(i)+'.txt',tvec = t_vec)
+  return dpl
 
-#
-def runanalysis (prm, fparam, fdpl, fspec):
+# somatic currents (columns t, L2, L5) in the format of the current files
+def writecurrent (fn, current):
+  fio.write_table(fn, current, ['%03.3f', '%5.4f', '%5.4f'], dconf['outfmt'])
+
+# spectral analysis of the normalized Dipole dpl in memory; the results are saved to fspec
+def runanalysis (prm, dpl, fspec):
   if pcID==0: print("Running spectral analysis...",)
-  spec_opts = {'type': 'dpl_laminar',
-               'f_max': prm['f_max_spec'],
-               'save_data': 0,
-               'runtype': 'parallel',
-             }
   t_start_analysis = time.time()
-  specfn.analysis_simp(spec_opts, fparam, fdpl, fspec) # run the spectral analysis
+  dspec = specfn.spec_dpl(dpl, prm, prm['f_max_spec']) # run the spectral analysis
+  writer.submit(savez, fspec, dspec)
   if pcID==0 and debug: print("time: %4.4f s" % (time.time() - t_start_analysis))
 
+def savez (fn, darr):
+  np.savez_compressed(fn, **darr)
+
 #
 def savefigs (ddir, prm, p_exp):
   print("Saving figures...",)
@@ -199,10 +238,11 @@ def getfname (ddir,key,trial=0,ntrial=1):
                'figspec': ('spec','.png'),
                'figspk': ('spk','.png'),
                'param': ('param','.txt'),
-               'vsoma': ('vsoma','.pkl'),
-               'lfp': ('lfp', '.txt')
+               'vsoma': ('vsoma','.json'),
+               'lfp': ('lfp', '.txt'),
+               'gidreg': ('gidreg', '.npz')
              }
-  if ntrial == 1 or key == 'param': # param file currently identical for all trials
+  if ntrial == 1 or key in ['param', 'gidreg']: # param file and gids currently identical for all trials
     return os.path.join(datdir,datatypes[key][0]+datatypes[key][1])
   else:
     return os.path.join(datdir,datatypes[key][0] + '_' + str(trial) + datatypes[key][1])
@@ -221,43 +261,33 @@ def setoutfiles (ddir,trial=0,ntrial=1):
   doutf['file_dpl_norm'] = getfname(ddir,'normdpl',trial,ntrial)
   doutf['file_vsoma'] = getfname(ddir,'vsoma',trial,ntrial)
   doutf['file_lfp'] = getfname(ddir,'lfp',trial,ntrial)
+  doutf['file_gidreg'] = getfname(ddir,'gidreg',trial,ntrial)
   #if pcID==0: print('doutf:',doutf)
   return doutf
 
-p_exp = paramrw.ExpParams(f_psim, debug=debug) # creates p_exp.sim_prefix and other param structures
-ddir = setupsimdir(f_psim,p_exp,pcID) # one directory for all experiments
-# create rotating data files
-doutf = setoutfiles(ddir)
-# core iterator through experimental groups
-if len(p_exp.expmt_groups) > 0:
-  expmt_group = p_exp.expmt_groups[0]
-else:
-  expmt_group = None
-simparams = p = p_exp.return_pdict(expmt_group, 0) # return the param dict for this simulation
-
-pc.barrier() # get all nodes to this place before continuing
-pc.gid_clear()
-
-# global variables, should be node-independent
-h("dp_total_L2 = 0."); h("dp_total_L5 = 0.")
-
-# Set tstop before instantiating any classes
-if simlength > 0.0:
-  h.tstop = simlength
-else:
-  h.tstop = p['tstop'] # simulation duration
-
-h.dt = p['dt'] # simulation time-step
-h.celsius = p['celsius'] # 37.0 # p['celsius'] # set temperature
-# spike file needs to be known by all nodes
-file_spikes_tmp = fio.file_spike_tmp(dproj)  
-net = network.NetworkOnNode(p) # create node-specific network
+# reads the param file fparam: param dicts and output directories
+def loadparams (fparam):
+  global f_psim, simstr, datdir, p_exp, ddir, doutf, expmt_group, simparams, p
+  f_psim = fparam
+  simstr = f_psim.split(os.path.sep)[-1].split('.param')[0]
+  datdir = os.path.join(dproj,simstr)
+  with simprofile.phase('parse'): p_exp = paramrw.ExpParams(f_psim, debug=debug) # creates p_exp.sim_prefix and other param structures
+  ddir = setupsimdir(f_psim,p_exp,pcID) # one directory for all experiments
+  # create rotating data files
+  doutf = setoutfiles(ddir)
+  # core iterator through experimental groups
+  if len(p_exp.expmt_groups) > 0:
+    expmt_group = p_exp.expmt_groups[0]
+  else:
+    expmt_group = None
+  simparams = p = p_exp.return_pdict(expmt_group, 0) # return the param dict for this simulation
 
-t_vec = h.Vector(); t_vec.record(h._ref_t) # time recording
-dp_rec_L2 = h.Vector(); dp_rec_L2.record(h._ref_dp_total_L2) # L2 dipole recording
-dp_rec_L5 = h.Vector(); dp_rec_L5.record(h._ref_dp_total_L5) # L5 dipole recording  
+loadparams(f_psim)
 
-net.movecellstopos() # position cells in 2D grid
+# simulation duration
+def gettstop ():
+  if simlength > 0.0: return simlength
+  return p['tstop']
 
 def expandbbox (boxA, boxB):
   return [(min(boxA[i][0],boxB[i][0]),max(boxA[i][1],boxB[i][1]))  for i in range(3)]
@@ -290,26 +320,91 @@ def arrangelayers ():
     """
   # for ty in ['L2_basket', 'L2_pyramidal', 'L5_basket', 'L5_pyramidal']: print(ty, dbbox[ty])
 
-arrangelayers() # arrange cells in layers - for visualization purposes
+# creates the network and the recordings for the params in p, on all nodes
+def buildnet ():
+  global net, t_vec, dp_rec_L2, dp_rec_L5
+  pc.barrier() # get all nodes to this place before continuing
+  pc.gid_clear()
 
-pc.barrier()
+  # global variables, should be node-independent
+  h("dp_total_L2 = 0."); h("dp_total_L5 = 0.")
+
+  # Set tstop before instantiating any classes
+  h.tstop = gettstop()
+
+  h.dt = p['dt'] # simulation time-step
+  h.celsius = p['celsius'] # 37.0 # p['celsius'] # set temperature
+  net = network.NetworkOnNode(p, loadbal=dconf['loadbal'], floadbal=dconf['loadbalf']) # create node-specific network
+  if dconf['stateinit']: net.load_state_template(dconf['stateinit'])
+
+  # every step, or every record_dt without record_aa (see paramrw.recintervals)
+  t_vec = h.Vector(); recordvec(t_vec, h._ref_t, net.rdt_rec) # time recording
+  dp_rec_L2 = h.Vector(); recordvec(dp_rec_L2, h._ref_dp_total_L2, net.rdt_rec) # L2 dipole recording
+  dp_rec_L5 = h.Vector(); recordvec(dp_rec_L5, h._ref_dp_total_L5, net.rdt_rec) # L5 dipole recording  
+
+  net.movecellstopos() # position cells in 2D grid
+  with simprofile.phase('arrangelayers'): arrangelayers() # arrange cells in layers - for visualization purposes
+  setupthreads()
+
+  pc.barrier()
+
+# threads per rank (nthread), optionally with the pyramidal cells split at the soma across
+# them (multisplit); not with LFP electrodes, whose callbacks are not thread safe
+def setupthreads ():
+  global nthread
+  if nthread > 1 and (testLFP or testlaminarLFP):
+    if pcID == 0: print("Warning: nthread is not used when recording LFP")
+    nthread = 1
+  npyr = len([cell for cell in net.cells if hasattr(cell, 'dipole_pp')])
+  split = nthread > 1 and (multisplit > 1 or (multisplit == 1 and nthread > npyr))
+  net.setup_threads(nthread, split)
+  if net.nthread > 1: # the cells sum their own dipoles, dp_total_L2/L5 stay unused
+    for vec in [dp_rec_L2, dp_rec_L5]: vec.play_remove()
+
+# trial-parallel and sweep modes: the ranks are split into trialgroups subworlds that each
+# build the whole network and run complete trials, handed out through the bulletin board
+# (see runtrials_par and runsweep). the subworlds must exist before any gid is created
+trialgroup = 0 # subworld of this rank
+worldseed = None # seed of the random seeds, the same on all subworlds (see initrands)
+nhost_world = int(pc.nhost_world())
+if sweepcores > 0 and serverport == 0:
+  if nhost_world % sweepcores:
+    if pcID == 0: print("Warning: %d ranks are not a multiple of %d ranks per simulation, using 1" % (nhost_world, sweepcores))
+    sweepcores = 1
+  trialgroups = nhost_world // sweepcores
+if (trialgroups > 1 and ntrial > 1 or sweepcores > 0) and serverport == 0:
+  if nhost_world % trialgroups == 0:
+    r = h.Vector(1, np.random.RandomState().randint(1e9))
+    if sweepcores > 0 and pcID == 0: r.x[0] = sweep.world_seed(ddir, int(r.x[0])) # same seeds on resume
+    pc.broadcast(r, 0)
+    worldseed = int(r.x[0])
+    pc.barrier()
+    pc.subworlds(nhost_world // trialgroups)
+    pcID = int(pc.id())
+    trialgroup = int(pc.id_world()) // int(pc.nhost())
+  else:
+    if pcID == 0: print("Warning: can not split %d ranks into %d trial groups, running the trials sequentially" % (nhost_world, trialgroups))
+    trialgroups = 0
+else:
+  trialgroups = 0
+
+buildnet()
 
 # save spikes from the individual trials in a single file
 def catspks ():
   lf = [os.path.join(datdir,'spk_'+str(i)+'.txt') for i in range(ntrial)]
   if debug: print('catspk lf:',lf)
-  lspk = [[],[]]
+  lspk = []
   for f in lf:
-    xarr = np.loadtxt(f)
-    for i in range(2):
-      lspk[i].extend(xarr[:,i])
+    xarr = spikefn.read_spikes(f)
+    lspk.append(xarr)
     if debug: print('xarr.shape:',xarr.shape)
-  lspk = np.array(lspk).T
+  ltrial = lspk
+  lspk = np.concatenate(lspk)
   # lspk.sort(axis=1) # not multidim sort - can fix if want spikes across trials in temporal order
   fout = os.path.join(datdir,'spk.txt')
-  with open(fout, 'w') as fspkout:
-    for i in range(lspk.shape[0]):
-      fspkout.write('%3.2f\t%d\n' % (lspk[i,0], lspk[i,1]))
+  spikefn.write_spikes(fout, lspk, dconf['spkfmt'])
+  if dconf['spkfmt'] != 'txt': spikefn.SpikeIndex.from_trials(ltrial).save(fout) # per trial and gid
   if debug: print('lspk.shape:',lspk.shape)
   return lspk
 
@@ -318,17 +413,12 @@ def catdpl ():
   ldpl = []
   for pre in ['dpl','rawdpl']:
     lf = [os.path.join(datdir,pre+'_'+str(i)+'.txt') for i in range(ntrial)]
-    dpl_dat = np.array([np.loadtxt(f) for f in lf])
+    dpl_dat = np.array([fio.read_table(f) for f in lf])
     try:
       dpl = np.mean(dpl_dat,axis=0)
     except ValueError:
       print("ERROR: could not caluclate mean. Inconsistent trial lengths?")
-    with open(os.path.join(datdir,pre+'.txt'), 'w') as fp:
-      for i in range(dpl.shape[0]):
-        fp.write("%03.3f\t" % dpl[i,0])
-        fp.write("%9.8f\t" % dpl[i,1])
-        fp.write("%9.8f\t" % dpl[i,2])
-        fp.write("%9.8f\n" % dpl[i,3])
+    write_dpl(os.path.join(datdir,pre+'.txt'), dpl, dconf['outfmt'])
     ldpl.append(dpl)
   return ldpl
 
@@ -359,23 +449,80 @@ def cattrialoutput ():
 # evinputinc is an increment (in milliseconds) that gets added to the evoked inputs on each
 # successive trial. the default value is 0.0.
 def runtrials (ntrial, inc_evinput=0.0):
-  global doutf
+  global doutf, curtrial
   if pcID==0: print('Running', ntrial, 'trials.')
   for i in range(ntrial):
     if pcID==0: print(os.linesep+'Running trial',i+1,'...')
     doutf = setoutfiles(ddir,i,ntrial)
+    curtrial = i
     # initrands(ntrial+(i+1)**ntrial) # reinit for each trial
     net.state_init() # initialize voltages
     runsim() # run the simulation
     net.reset_src_event_times(inc_evinput = inc_evinput * (i + 1)) # adjusts the rng seeds and then the feed/event input times
+  writer.join() # trial outputs are on disk
   doutf = setoutfiles(ddir,0,1) # reset output files based on sim name
   if pcID==0: cattrialoutput() # get/save the averages
 
+# runs one (expmt_group, sim index, trial) combination of a sweep on this trial group,
+# applying its params to the existing network when possible; the bulletin board task of runsweep
+def runsweep_task (expmt_group, i, trial):
+  global p, simparams, doutf, curtrial
+  p = simparams = p_exp.return_pdict(expmt_group, i)
+  prng_base = np.random.RandomState(worldseed + i) # same seeds for all trials of a sim
+  for param in p_exp.prng_seed_list: p[param] = prng_base.randint(1e9)
+  if gettstop() != h.tstop: lrebuild = ['tstop']
+  else: lrebuild = net.update_params(p)
+  if lrebuild: buildnet()
+  h.celsius = p['celsius']
+  setupcheckpoint()
+  if pcID==0: print(os.linesep+'Running',expmt_group,'sim',i,'trial',trial,'on trial group',trialgroup,'...')
+  doutf = sweep.outfiles(ddir, expmt_group, i, trial)
+  curtrial = trial
+  net.set_trial(trial, p['inc_evinput'])
+  net.state_init() # initialize voltages
+  runsim() # run the simulation
+  writer.join() # outputs are on disk before the combination is marked done
+  return (expmt_group, i, trial)
+
+# runs every combination of the param file that is not listed as done yet (see sweep.py)
+def runsweep ():
+  pc.runworker() # returns on world rank 0 only
+  ddir.create_dirs()
+  sdone = sweep.read_done(ddir)
+  lcomb = [comb for comb in sweep.combinations(p_exp, ntrial if ntrial > 1 else 0) if comb not in sdone]
+  print('Running', len(lcomb), 'simulations (%d done before) on' % len(sdone), trialgroups, 'groups of', int(pc.nhost()), 'ranks.')
+  for comb in lcomb: pc.submit(runsweep_task, *comb)
+  while pc.working():
+    sweep.mark_done(ddir, tuple(pc.pyret()))
+
+# runs trial i (0-based) on this trial group; the bulletin board task of runtrials_par
+def runtrial (i, inc_evinput=0.0):
+  global doutf, curtrial
+  if pcID==0: print(os.linesep+'Running trial',i+1,'on trial group',trialgroup,'...')
+  doutf = setoutfiles(ddir,i,ntrial)
+  curtrial = i
+  net.set_trial(i, inc_evinput) # same feed seeds and event times as trial i of runtrials
+  net.state_init() # initialize voltages
+  runsim() # run the simulation
+  writer.join() # outputs are on disk before the master gathers them
+  return i
+
+# runtrials on trial groups: world rank 0 submits the trials and each group runs the next
+# one when it is free; all other ranks stay in pc.runworker() until pc.done()
+def runtrials_par (ntrial, inc_evinput=0.0):
+  global doutf
+  pc.runworker() # returns on world rank 0 only
+  print('Running', ntrial, 'trials on', trialgroups, 'trial groups of', int(pc.nhost()), 'ranks.')
+  for i in range(ntrial): pc.submit(runtrial, i, inc_evinput)
+  while pc.working(): pass
+  doutf = setoutfiles(ddir,0,1) # reset output files based on sim name
+  cattrialoutput() # get/save the averages
+
 def initrands (s=0): # fix to use s
   # if there are N_trials, then randomize the seed
   # establishes random seed for the seed seeder (yeah.)
   # this creates a prng_tmp on each, but only the value from 0 will be used
-  prng_tmp = np.random.RandomState()
+  prng_tmp = np.random.RandomState(worldseed) # worldseed: same seeds on all trial groups
   if pcID == 0:
     r = h.Vector(1, s) # initialize vector to 1 element, with a 0
     if ntrial == 1:
@@ -398,17 +545,125 @@ def initrands (s=0): # fix to use s
 
 initrands(0) # init once
 
+# the LFP is sampled at the recording interval (see paramrw.recfactor)
 def setupLFPelectrodes ():
   lelec = []
+  nstep = paramrw.recfactor(p)
   if testlaminarLFP:
-    for y in np.linspace(1466.0,-72.0,16): lelec.append(LFPElectrode([370.0, y, 450.0], pc = pc))
+    for y in np.linspace(1466.0,-72.0,16): lelec.append(LFPElectrode([370.0, y, 450.0], pc = pc, nstep = nstep))
   elif testLFP:
-    lelec.append(LFPElectrode([370.0, 1050.0, 450.0], pc = pc))
-    lelec.append(LFPElectrode([370.0, 208.0, 450.0], pc = pc))
+    lelec.append(LFPElectrode([370.0, 1050.0, 450.0], pc = pc, nstep = nstep))
+    lelec.append(LFPElectrode([370.0, 208.0, 450.0], pc = pc, nstep = nstep))
   return lelec
 
 lelec = setupLFPelectrodes()
+
+# optional cached state (see ckpt.py) at t = forkat (a fork shared by the runs of an
+# optimization step) or at t = burnin ms; not with LFP electrodes, whose recordings
+# are not part of the cached state
+def setupcheckpoint ():
+  global checkpoint
+  checkpoint = None
+  if forkat <= 0.0 and dconf['burnin'] <= 0.0: return
+  lrec = [t_vec, dp_rec_L2, dp_rec_L5] + net.get_rec_vectors()
+  lrdt = [net.rdt_rec] * 3 + net.get_rec_intervals()
+  if lelec:
+    if pcID == 0: print("Warning: forkat/burnin are ignored when recording LFP")
+  elif forkat > 0.0:
+    if forkat < h.tstop: checkpoint = ckpt.Checkpoint(net, lrec, forkat, os.path.join(dproj, 'fork'), dconf['stateinit'], 'fork', lrdt)
+  elif dconf['burnin'] < h.tstop:
+    checkpoint = ckpt.Checkpoint(net, lrec, dconf['burnin'], os.path.join(dproj, 'burnin'), dconf['stateinit'], 'burn-in', lrdt)
+
+setupcheckpoint()
+
+# optional progress stream (see progress.py); in trial-parallel mode each trial group
+# reports the progress of its share of the trials
+stream = None
+if progressf:
+  stream = progress.ProgressStream(progressf, pc, int(np.ceil(ntrial / max(1, trialgroups))) if sweepcores == 0 else 1, h.tstop, trialgroup)
+curtrial = 0 # trial being run, for the progress stream
   
+# variable step integration (cvode param): CVODE with the global time step, since the
+# dipole mechanisms sum over all cells at one time. recordings are made at the solver
+# steps and interpolated onto the dt grid after the run (regrid). returns True if active.
+# the many feed and synaptic events of the network restart the solver at each event, so
+# this is slower than fixed steps (about 8-11x on default.param, see bench_cvode.py)
+def setupcvode ():
+  usecvode = p.get('cvode', 0) > 0
+  if usecvode and lelec:
+    if pcID == 0: print("Warning: cvode is not used when recording LFP")
+    usecvode = False
+  h.cvode.active(int(usecvode))
+  if usecvode:
+    if pcID == 0: print("Warning: cvode is usually several times slower than fixed step runs")
+    h.cvode.atol(p['cvode_atol'])
+    h.cvode.rtol(p['cvode_rtol'])
+  h.dt = p['dt'] # cvode changes h.dt
+  # cache efficient layout (cell data contiguous in memory); required with multisplit
+  h.cvode.cache_efficient(int(cacheeff > 0 or net.multisplit))
+  return usecvode
+
+# interpolates the recordings made at the variable solver steps onto the regular dt grid;
+# the ones sampled every record_dt (see paramrw.recintervals) are on their grid already
+def regrid ():
+  h.dt = p['dt'] # cvode changes h.dt
+  if net.rdt_rec > 0.: return
+  t = t_vec.as_numpy().copy()
+  tgrid = p['dt'] * np.arange(int(round(t[-1] / p['dt'])) + 1)
+  lvec = net.get_rec_vectors(vsoma=net.rdt_vsoma == 0.)
+  if net.nthread < 2: lvec = [dp_rec_L2, dp_rec_L5] + lvec # with threads only the per cell dipoles are recorded
+  for vec in lvec:
+    vec.from_python(np.interp(tgrid, t, vec.as_numpy()))
+  t_vec.from_python(tgrid)
+
+# streaming mode (streamwin > 0, see recstream.py): not with early abort, cvode or LFP,
+# which need the whole recordings
+def usestreaming (errbound, usecvode):
+  if streamwin <= 0.0: return False
+  if errbound is not None or usecvode or lelec:
+    if pcID == 0: print("Warning: streamwin is not used with early abort, cvode or LFP recording")
+    return False
+  return True
+
+# pc.psolve to tstop in windows of streamwin ms, flushing the recordings after each;
+# returns the store of the flushed recordings (data on rank 0)
+def psolve_streaming (tstop):
+  global vspool
+  recstore = recstream.RecStore(os.path.join(datdir, '.recstream_%d.f64' % trialgroup))
+  dec = decimator()
+  if p['save_vsoma']:
+    gids, celltypes, lvec = net.get_vsoma()
+    vspool = vsomastore.ShardSpool(doutf['file_vsoma'], pcID, gids, celltypes, dconf['vsomafmt'])
+  while h.t < tstop:
+    pc.psolve(min(h.t + streamwin, tstop))
+    with simprofile.phase('stream'): flushrec(recstore, dec)
+    if stream is not None: stream.tick()
+  if dec is not None and pcID == 0: recstore.append(dec.finish())
+  return recstore
+
+# anti-aliased decimation of the reduced recordings (record_dt with record_aa, see
+# decimate.py), None if they are recorded at the recording interval already
+def decimator ():
+  q = paramrw.recfactor(p)
+  if q == 1 or net.rdt_rec > 0.: return None
+  return decimate.Decimator(q)
+
+# reduces the recordings of the last window across ranks, appends them to recstore on
+# rank 0 (through dec, if decimating) and empties the recording vectors; the somatic
+# voltages are appended to the rank's own spool
+def flushrec (recstore, dec=None):
+  n = int(t_vec.size())
+  net.aggregate_dipoles(dp_rec_L2, dp_rec_L5, n) # per cell dipoles, with threads
+  net.aggregate_currents(n, reset=True) # sums of this window only
+  vec = h.Vector(np.concatenate((dp_rec_L2.as_numpy(), dp_rec_L5.as_numpy(), net.current['L2Pyr_soma'].as_numpy(), net.current['L5Pyr_soma'].as_numpy())))
+  pc.allreduce(vec, 1) # one reduction for all four
+  if pcID == 0:
+    x = np.column_stack([t_vec.as_numpy()] + np.split(vec.as_numpy(), 4))
+    recstore.append(x if dec is None else dec.push(x))
+  if vspool is not None: vspool.append(net.get_vsoma()[2])
+  for rec in [t_vec, dp_rec_L2, dp_rec_L5]: rec.resize(0)
+  net.clear_recordings(vsoma=vspool is not None)
+
 # All units for time: ms
 def runsim ():
   t0 = time.time() # clock start time
@@ -419,41 +674,167 @@ def runsim ():
     elec.setup()
     elec.LFPinit()
 
-  h.finitialize() # initialize cells to -65 mV, after all the NetCon delays have been specified
-  if pcID == 0: 
-    for tt in range(0,int(h.tstop),printdt): h.cvode.event(tt, prsimtime) # print time callbacks
+  usecvode = setupcvode()
+  with simprofile.phase('finitialize'):
+    h.finitialize() # initialize cells to -65 mV, after all the NetCon delays have been specified
+    net.state_restore() # full initial states, if templates were loaded
+  if checkpoint is not None:
+    with simprofile.phase('checkpoint'): checkpoint.run() # restores or integrates (and caches) the state at the checkpoint
+  if pcID == 0 and stream is None:
+    for tt in range(int(np.ceil(h.t)),int(h.tstop),printdt): h.cvode.event(tt, prsimtime) # print time callbacks
   
   h.fcurrent()  
   h.frecord_init() # set state variables if they have been changed since h.finitialize
-  pc.psolve(h.tstop) # actual simulation - run the solver
+  errbound = None
+  # marker of an earlier aborted run, also when this one is not to be aborted
+  if pcID == 0 and os.path.isfile(os.path.join(datdir, earlyabort.fabort)): os.remove(os.path.join(datdir, earlyabort.fabort))
+  if abortf:
+    if ntrial > 1:
+      if pcID == 0: print("Warning: early abort is only done for single trials")
+    elif nthread > 1: # the dipole is only summed up after the run (see setupthreads)
+      if pcID == 0: print("Warning: early abort is not done with nthread > 1")
+    elif usecvode: # the ranks record at their own solver steps, only regridded after the run
+      if pcID == 0: print("Warning: early abort is not done with cvode")
+    else: errbound = earlyabort.ErrorBound(abortf, p, paramrw.recdt(p)) # weights at the recording interval
+  streaming = usestreaming(errbound, usecvode)
+  if streaming and checkpoint is not None: checkpoint.finish() # recordings up to the checkpoint go in the first window
+  if stream is not None: stream.start_trial(curtrial)
+  tpsolve = time.time()
+  if errbound is not None:
+    err = errbound.psolve(pc, h.tstop, t_vec, dp_rec_L2, dp_rec_L5, stream) # stops once the error can not beat the best
+    simprofile.add('psolve', time.time() - tpsolve)
+    if err is not None:
+      if pcID == 0:
+        print("Simulation stopped at %g ms: error is at least %g" % (h.t, err))
+        removeoutputs() # of an earlier run, not to be taken for this one's
+        with open(os.path.join(datdir, earlyabort.fabort), 'w') as fp: fp.write('%g %g\n' % (err, h.t))
+      if stream is not None: stream.end_trial()
+      pc.barrier()
+      return
+  elif streaming: recstore = psolve_streaming(h.tstop) # in windows, flushing the recordings
+  elif stream is not None: progress.psolve(pc, h.tstop, stream) # in windows, with progress records
+  else: pc.psolve(h.tstop) # actual simulation - run the solver
+  if errbound is None: simprofile.add('psolve', time.time() - tpsolve)
   pc.barrier()
+  if stream is not None: stream.end_trial()
+  if dconf['loadbal']: net.loadbal_report()
 
-  # these calls aggregate data across procs/nodes
-  pc.allreduce(dp_rec_L2, 1); 
-  pc.allreduce(dp_rec_L5, 1) # combine dp_rec on every node, 1=add contributions together  
-  for elec in lelec: elec.lfp_final()
-  net.aggregate_currents() # aggregate the currents independently on each proc
-  # combine net.current{} variables on each proc
-  pc.allreduce(net.current['L5Pyr_soma'], 1); pc.allreduce(net.current['L2Pyr_soma'], 1)
+  if streaming:
+    # the reduced recordings of all windows, memory-mapped on rank 0
+    t = L2 = L5 = IL2 = IL5 = None
+    if pcID == 0: t, L2, L5, IL2, IL5 = recstore.read().T
+  else:
+    if checkpoint is not None: checkpoint.finish() # recordings up to the checkpoint go in front
+    if usecvode: regrid() # recordings at the solver steps to the dt grid
+    net.aggregate_dipoles(dp_rec_L2, dp_rec_L5, int(t_vec.size())) # per cell dipoles, with threads
+
+    # these calls aggregate data across procs/nodes
+    treduce = time.time()
+    pc.allreduce(dp_rec_L2, 1); 
+    pc.allreduce(dp_rec_L5, 1) # combine dp_rec on every node, 1=add contributions together  
+    for elec in lelec: elec.lfp_final()
+    net.aggregate_currents(int(t_vec.size())) # aggregate the currents independently on each proc
+    # combine net.current{} variables on each proc
+    pc.allreduce(net.current['L5Pyr_soma'], 1); pc.allreduce(net.current['L2Pyr_soma'], 1)
+    simprofile.add('reduce', time.time() - treduce)
+    # the recordings as arrays (views of the vectors, no copies)
+    t, L2, L5 = t_vec.as_numpy(), dp_rec_L2.as_numpy(), dp_rec_L5.as_numpy()
+    IL2, IL5 = net.current['L2Pyr_soma'].as_numpy(), net.current['L5Pyr_soma'].as_numpy()
+    dec = decimator()
+    if dec is not None and pcID == 0: # to the recording interval, on rank 0
+      with simprofile.phase('decimate'):
+        x = np.column_stack((t, L2, L5, IL2, IL5))
+        t, L2, L5, IL2, IL5 = np.concatenate((dec.push(x), dec.finish())).T
 
   pc.barrier()
 
   # write time and calculated dipole to data file only if on the first proc
   # only execute this statement on one proc
-  savedat(p, pcID, t_vec, dp_rec_L2, dp_rec_L5, net)
+  dpl = savedat(p, pcID, t, L2, L5, IL2, IL5, net)
 
   for elec in lelec: print('end; t_vec.size()',t_vec.size(),'elec.lfp_t.size()',elec.lfp_t.size())
 
   if pcID == 0:
     if debug: print("Simulation run time: %4.4f s" % (time.time()-t0))
     if debug: print("Simulation directory is: %s" % ddir.dsim)
-    if paramrw.find_param(doutf['file_param'],'save_spec_data') or usingOngoingInputs(doutf['file_param']):
-      runanalysis(p, doutf['file_param'], doutf['file_dpl_norm'], doutf['file_spec']) # run spectral analysis
-    if paramrw.find_param(doutf['file_param'],'save_figs'):
-      savefigs(ddir,p,p_exp) # save output figures
+    if p['save_spec_data'] or usingOngoingInputs(p):
+      with simprofile.phase('analysis'): runanalysis(p, dpl, doutf['file_spec']) # run spectral analysis
+    if p['save_figs'] and sweepcores == 0: # figures of single runs only
+      writer.join() # figures are made from the output files
+      with simprofile.phase('figures'): savefigs(ddir,p,p_exp) # save output figures
 
+  saveprofile()
   pc.barrier() # make sure all done in case multiple trials
 
+# removes the output tables of the current trial (doutf) left by an earlier run in datdir
+def removeoutputs ():
+  for key in ['file_dpl', 'file_dpl_norm', 'file_current', 'file_spikes']: fio.remove_table(doutf[key])
+  spikefn.SpikeIndex.remove(doutf['file_spikes'])
+  if os.path.isfile(doutf['file_spec']): os.remove(doutf['file_spec'])
+
+# phase times of all ranks to profile.json in the sim directory (see simprofile.py), one
+# file per trial group; cumulative over the runs of this process
+def saveprofile ():
+  lsnap = pc.py_gather(simprofile.snapshot(pc), 0)
+  if pcID == 0:
+    fprof = os.path.join(datdir, 'profile.json' if trialgroups < 2 else 'profile_%d.json' % trialgroup)
+    writer.submit(writeprofile, fprof, lsnap)
+
+# rank 0 phase times are taken again when written, to include the earlier background writes
+def writeprofile (fprof, lsnap):
+  lsnap[0]['phases'] = simprofile.phases()
+  simprofile.write(fprof, lsnap)
+
+# runs the param file fparam on the existing network, applying the params in place
+# when possible (NetworkOnNode.update_params); returns True if the network was rebuilt
+def runparams (fparam):
+  simprofile.reset()
+  loadparams(fparam)
+  initrands(0)
+  if gettstop() != h.tstop: lrebuild = ['tstop']
+  else: lrebuild = net.update_params(p)
+  if lrebuild:
+    if pcID == 0 and debug: print('rebuilding network for', lrebuild)
+    buildnet()
+  h.celsius = p['celsius']
+  setupcheckpoint()
+  if stream is not None: stream.ntrial = ntrial
+  if ntrial > 1: runtrials(ntrial,p['inc_evinput'])
+  else: runsim()
+  writer.join() # outputs are on disk before the reply
+  if pcID == 0: simbundle.write(datdir, ntrial, p) # index of the output tables
+  return len(lrebuild) > 0
+
+# server mode: the ranks keep the network and run the param files sent by clients
+# to rank 0 (see simserver.py), until a quit request
+def serve (port):
+  global ntrial, simlength, forkat, abortf
+  srv = None
+  if pcID == 0:
+    srv = simserver.SimServer(port)
+    print('simulation server listening on port %d' % port)
+  while True:
+    req = None
+    if pcID == 0:
+      req = srv.next_request()
+      # rejected on rank 0 so that the other ranks only see valid requests
+      while not simserver.valid_request(req):
+        srv.reply({'status': 'error', 'error': 'invalid request: %s' % str(req)})
+        req = srv.next_request()
+    req = pc.py_broadcast(req, 0)
+    if req['cmd'] == 'quit':
+      if pcID == 0:
+        srv.reply({'status': 'ok'})
+        srv.close()
+      break
+    t0 = time.time()
+    ntrial = max(1, int(req.get('ntrial', 1)))
+    simlength = float(req.get('simlength', 0.0))
+    forkat = float(req.get('forkat', 0.0))
+    abortf = str(req.get('abortf', ''))
+    rebuilt = runparams(req['paramf'])
+    if pcID == 0: srv.reply({'status': 'ok', 'datdir': datdir, 'rebuilt': rebuilt, 'twall': time.time() - t0})
+
 def excepthook(exc_type, exc_value, exc_tb):
   traceback.print_exception(exc_type, exc_value, exc_tb, file=sys.stdout, chain=False)
   traceback.print_exception(exc_type, exc_value, exc_tb, file=sys.stderr, chain=False)
@@ -463,9 +844,21 @@ def excepthook(exc_type, exc_value, exc_tb):
 
 if __name__ == "__main__":
   sys.excepthook = excepthook
-  if dconf['dorun']:
-    if ntrial > 1: runtrials(ntrial,p['inc_evinput'])
+  if serverport > 0:
+    serve(serverport)
+    pc.runworker()
+    pc.done()
+  elif sweepcores > 0:
+    runsweep()
+    pc.done()
+  elif dconf['dorun']:
+    if stream is not None: stream.start()
+    if trialgroups > 1: runtrials_par(ntrial,p['inc_evinput'])
+    elif ntrial > 1: runtrials(ntrial,p['inc_evinput'])
     else: runsim()
+    writer.join()
+    if pcID == 0: simbundle.write(datdir, ntrial, p) # index of the output tables
+    if stream is not None: stream.close()
     pc.runworker()
     pc.done()
   if dconf['doquit']: h.quit()
@@ -0,0 +1,87 @@
+# simbundle.py - index of the output tables of a simulation (bundle.json in its data directory)
+#
+# with [sim] outfmt and spkfmt npy, each output table is a binary .npy array next to its
+# text file name (see fileio.write_table). bundle.json lists the tables of all trials
+# with their columns, so a reader gets every trial as a memory-mapped array:
+#   {"ntrial": 2, "tstop": 170.0, "dt": 0.025, "record_dt": 0.025, "param": "param.txt",
+#    "tables": {"dpl": {"columns": ["t", "agg", "L2", "L5"], "files": ["dpl_0.txt", "dpl_1.txt"],
+#                       "avg": "dpl.txt"}, ...}}
+# (file names are the text names; the .npy versions are read when present). the tables
+# are sampled every record_dt ms
+#
+# reading:
+#   b = simbundle.SimBundle(datdir)
+#   b.trial('dpl', 0)   # n x 4 array: t, agg, L2, L5
+#   b.trials('rawdpl')  # ntrial x n x 4
+#   b.avg('dpl')        # trial average (the only trial of single trial runs)
+#   b.spikes()          # spikes of all trials, n x 3: trial, t, gid
+
+import os
+import json
+import numpy as np
+import fileio as fio
+import paramrw
+
+fbundle = 'bundle.json'
+
+# output tables by file name prefix (see run.getfname) and their columns
+dtables = {
+  'rawdpl': ['t', 'agg', 'L2', 'L5'],
+  'dpl': ['t', 'agg', 'L2', 'L5'],
+  'i': ['t', 'L2Pyr_soma', 'L5Pyr_soma'],
+  'spk': ['t', 'gid'],
+}
+
+def trialfile (name, trial, ntrial):
+  if ntrial == 1: return name + '.txt'
+  return '%s_%d.txt' % (name, trial)
+
+# writes the index of the tables of a finished simulation in datdir; p: its param dict
+def write (datdir, ntrial, p):
+  dtab = {}
+  for name, columns in dtables.items():
+    lf = [trialfile(name, i, ntrial) for i in range(ntrial)]
+    if not all(fio.table_exists(os.path.join(datdir, f)) for f in lf): continue
+    dtab[name] = {'columns': columns, 'files': lf}
+    if ntrial > 1 and fio.table_exists(os.path.join(datdir, name + '.txt')): dtab[name]['avg'] = name + '.txt'
+  with open(os.path.join(datdir, fbundle), 'w') as fp:
+    json.dump({'ntrial': ntrial, 'tstop': p['tstop'], 'dt': p['dt'], 'record_dt': paramrw.recdt(p), 'param': 'param.txt', 'tables': dtab}, fp, indent=1)
+
+def exists (datdir):
+  return os.path.isfile(os.path.join(datdir, fbundle))
+
+class SimBundle ():
+  def __init__ (self, datdir):
+    self.datdir = datdir
+    with open(os.path.join(datdir, fbundle), 'r') as fp: self.meta = json.load(fp)
+    self.ntrial = self.meta['ntrial']
+
+  def tables (self):
+    return list(self.meta['tables'].keys())
+
+  def columns (self, name):
+    return self.meta['tables'][name]['columns']
+
+  def __read (self, fname):
+    return fio.read_table(os.path.join(self.datdir, fname), mmap=True)
+
+  # table name of trial i
+  def trial (self, name, i):
+    return self.__read(self.meta['tables'][name]['files'][i])
+
+  # table name of all trials stacked (tables of the same length, e.g. dipoles)
+  def trials (self, name):
+    return np.array([self.trial(name, i) for i in range(self.ntrial)])
+
+  def avg (self, name):
+    dtab = self.meta['tables'][name]
+    if 'avg' in dtab: return self.__read(dtab['avg'])
+    return self.trial(name, 0)
+
+  def spikes (self):
+    lspk = []
+    for i in range(self.ntrial):
+      spk = np.asarray(self.trial('spk', i)).reshape(-1, 2)
+      lspk.append(np.column_stack((np.full(len(spk), i), spk)))
+    if not lspk: return np.zeros((0, 3))
+    return np.concatenate(lspk)
@@ -0,0 +1,113 @@
+# simcompare.py - run a reference simulation and one with parameter overrides, compare dipoles
+#
+# usage: python simcompare.py param/default.param prune_frac=1e-3 [ncore=4] [ntrial=1]
+#
+# each run uses its own copy of the param file (<name>_ref.param, <name>_cmp.param),
+# so the outputs land in separate directories under the data directory
+
+import os
+import sys
+import shlex
+import shutil
+import tempfile
+import time
+import numpy as np
+from subprocess import Popen, PIPE
+from conf import dconf
+import fileio as fio
+
+# writes a copy of param file fin to fout, with the values in doverride replaced or appended
+def write_param (fin, fout, doverride):
+  dleft = dict(doverride)
+  lout = []
+  with open(fin, 'r') as fp:
+    for line in fp.readlines():
+      sp = line.split(':')
+      key = sp[0].strip()
+      if len(sp) > 1 and key in dleft:
+        lout.append('%s: %s\n' % (key, str(dleft.pop(key))))
+      else:
+        lout.append(line if line.endswith('\n') else line + '\n')
+  for key, val in dleft.items(): lout.append('%s: %s\n' % (key, str(val)))
+  with open(fout, 'w') as fp: fp.writelines(lout)
+
+# output directory of a param file (see run.py)
+def getdatdir (paramf):
+  return os.path.join(dconf['datdir'], paramf.split(os.path.sep)[-1].split('.param')[0])
+
+# runs a simulation of paramf and returns the wall time in s and its output; raises
+# RuntimeError on failure. extra: more run.py arguments (e.g. 'trialgroups 4')
+def runsim (paramf, ncore=1, ntrial=1, extra=''):
+  if ncore > 1:
+    cmd = 'mpiexec -np ' + str(ncore) + ' nrniv -python -mpi -nobanner ' + dconf['simf'] + ' ' + paramf + ' ntrial ' + str(ntrial)
+  else:
+    cmd = 'nrniv -python -nobanner ' + dconf['simf'] + ' ' + paramf + ' ntrial ' + str(ntrial)
+  if extra: cmd += ' ' + extra
+  cmdargs = shlex.split(cmd, posix="win" not in sys.platform)
+  t0 = time.time()
+  proc = Popen(cmdargs, stdout=PIPE, stderr=PIPE, cwd=os.getcwd(), universal_newlines=True)
+  out, err = proc.communicate()
+  if proc.returncode != 0:
+    print(err)
+    raise RuntimeError('simulation of %s failed with return code %d' % (paramf, proc.returncode))
+  return time.time() - t0, out
+
+# loads the (trial-averaged) normalized dipole of a finished simulation: t, agg, L2, L5
+def readdpl (paramf):
+  return fio.read_table(os.path.join(getdatdir(paramf), 'dpl.txt'))
+
+# error of dpl against reference dpl_ref (aggregate dipole), on the common time range
+def dplerr (dpl_ref, dpl):
+  sz = min(dpl_ref.shape[0], dpl.shape[0])
+  diff = dpl[:sz, 1] - dpl_ref[:sz, 1]
+  rmse = np.sqrt((diff ** 2).mean())
+  rms_ref = np.sqrt((dpl_ref[:sz, 1] ** 2).mean())
+  if rms_ref > 0.: relerr = rmse / rms_ref
+  else: relerr = np.nan
+  return {'rmse': rmse, 'relerr': relerr, 'maxerr': np.abs(diff).max()}
+
+# runs fparam as is (reference) and with doverride, returns dict of errors and run times
+def compare (fparam, doverride, ncore=1, ntrial=1, dref=None):
+  tmpdir = tempfile.mkdtemp()
+  name = fparam.split(os.path.sep)[-1].split('.param')[0]
+  fref = os.path.join(tmpdir, name + '_ref.param')
+  fcmp = os.path.join(tmpdir, name + '_cmp.param')
+  try:
+    # run.py writes to the directory named after the param file, which must match sim_prefix
+    write_param(fparam, fref, dict(dref or {}, sim_prefix=name + '_ref'))
+    write_param(fparam, fcmp, dict(doverride, sim_prefix=name + '_cmp'))
+    tref, out_ref = runsim(fref, ncore, ntrial)
+    tcmp, out_cmp = runsim(fcmp, ncore, ntrial)
+    derr = dplerr(readdpl(fref), readdpl(fcmp))
+  finally:
+    shutil.rmtree(tmpdir, ignore_errors=True)
+  derr['tref'] = tref
+  derr['tcmp'] = tcmp
+  derr['out_cmp'] = out_cmp
+  return derr
+
+# parses key=value arguments into numbers where possible
+def parseoverrides (largs):
+  d = {}
+  for arg in largs:
+    key, val = arg.split('=', 1)
+    try:
+      d[key] = float(val)
+    except ValueError:
+      d[key] = val
+  return d
+
+if __name__ == '__main__':
+  fparam = os.path.join('param', 'default.param')
+  ncore, ntrial, largs = 1, 1, []
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): fparam = arg
+    elif arg.startswith('ncore='): ncore = int(arg.split('=')[1])
+    elif arg.startswith('ntrial='): ntrial = int(arg.split('=')[1])
+    elif '=' in arg: largs.append(arg)
+  doverride = parseoverrides(largs)
+  derr = compare(fparam, doverride, ncore, ntrial)
+  print(derr['out_cmp'])
+  print('overrides:', doverride)
+  print('reference run: %.2f s, compared run: %.2f s' % (derr['tref'], derr['tcmp']))
+  print('dipole RMSE: %.6f nAm (%.3f%% of reference RMS), max abs error: %.6f nAm' % (derr['rmse'], 100. * derr['relerr'], derr['maxerr']))
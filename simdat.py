@@ -10,6 +10,7 @@ from math import ceil
 from conf import dconf
 import conf
 import spikefn
+import fileio as fio
 from paramrw import usingOngoingInputs, usingEvokedInputs, usingPoissonInputs, usingTonicInputs, find_param, quickgetprm, countEvokedInputs, ExpParams
 from scipy import signal
 from gutils import getscreengeom
@@ -62,7 +63,7 @@ def readdpltrials (basedir,ntrial):
   ldpl = []
   for i in range(ntrial):
     fn = os.path.join(basedir,'dpl_'+str(i)+'.txt')
-    if not os.path.exists(fn): break
+    if not fio.table_exists(fn): break
     ldpl.append(readtxt(fn))
     if debug: print('loaded ', fn)
 
@@ -87,7 +88,22 @@ def readtxt (fn, silent=False):
   contents = []
 
   try:
-    contents = np.loadtxt(fn)
+    contents = fio.read_table(fn) # text or binary (see fileio.read_table)
+  except OSError:
+    if not silent:
+      print('Warning: could not read file:', fn)
+  except ValueError:
+    if not silent:
+      print('Warning: error reading data from:', fn)
+
+  return contents
+
+# spikes as text or binary (see spikefn.read_spikes)
+def readspk (fn, silent=False):
+  contents = []
+
+  try:
+    contents = spikefn.read_spikes(fn)
   except OSError:
     if not silent:
       print('Warning: could not read file:', fn)
@@ -108,7 +124,8 @@ def updatedat (paramf):
     if k in ddat:
       del ddat[k]
     silent = not os.path.exists(basedir)
-    ddat[k] = readtxt(dfile[k], silent)
+    if k == 'spk': ddat[k] = readspk(dfile[k], silent)
+    else: ddat[k] = readtxt(dfile[k], silent)
     if len(ddat[k]) == 0:
       del ddat[k]
 
@@ -192,6 +209,7 @@ def calcerr (ddat, tstop, tstart=0.0):
   ddat['lerr'] = lerr
   return lerr, errtot
 
+# weights: one per sample of the simulated dipole (every paramrw.recdt ms, see chunk_evinputs)
 def weighted_rmse(ddat, tstop, weights, tstart=0.0):
   from numpy import sqrt
   from scipy import signal
@@ -0,0 +1,88 @@
+# simprofile.py - wall time of each phase of a simulation run, per rank
+#
+# phases are timed with
+#   with simprofile.phase('psolve'): ...
+# and summed over the life of the process (or since reset()). run.py writes the times of
+# all ranks and the spike exchange counts to profile.json in the simulation directory:
+#   {"nhost": 4, "phases": ["parse", ...],
+#    "summary": {"psolve": {"min": ..., "mean": ..., "max": ..., "n": ...}, ...},
+#    "ranks": [{"phases": {"psolve": {"s": ..., "n": ...}, ...}, "spikes": {...}}, ...]}
+# the max over ranks of a phase is its wall time; max against mean shows load imbalance.
+# phases: parse (ExpParams), create (cells and feeds), connect, arrangelayers, finitialize,
+# psolve, reduce (allreduce and gathers), decimate (record_dt, see decimate.py), write
+# (output files, in the background writer), analysis (spectral analysis), figures
+#
+# printing a profile: python simprofile.py data/default/profile.json
+
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from neuron import h
+
+dphase = {} # phase name -> [s, count] on this rank, in order of first use
+# the background writer (fileio.AsyncWriter) adds its 'write' times from its own thread
+lock = threading.Lock()
+
+def add (name, dt):
+  with lock:
+    if name not in dphase: dphase[name] = [0., 0]
+    dphase[name][0] += dt
+    dphase[name][1] += 1
+
+@contextmanager
+def phase (name):
+  t0 = time.time()
+  try:
+    yield
+  finally:
+    add(name, time.time() - t0)
+
+def reset ():
+  with lock: dphase.clear()
+
+# spike exchange counts of this rank (ParallelContext.spike_statistics), and the time
+# integrating, waiting for and sending spikes
+def spike_stats (pc):
+  nsend, nrecv, nuseful = h.ref(0), h.ref(0), h.ref(0)
+  nsendmax = pc.spike_statistics(nsend, nrecv, nuseful)
+  return {'nsend': int(nsend[0]), 'nrecv': int(nrecv[0]), 'nrecv_useful': int(nuseful[0]), 'nsendmax': int(nsendmax),
+          'step_time': pc.step_time(), 'wait_time': pc.wait_time(), 'send_time': pc.send_time()}
+
+# phase times of this rank
+def phases ():
+  with lock: return dict((name, {'s': v[0], 'n': v[1]}) for name, v in dphase.items())
+
+# times and spike counts of this rank
+def snapshot (pc):
+  return {'phases': phases(), 'spikes': spike_stats(pc)}
+
+# writes the snapshots of all ranks (lsnap, in rank order) to fname
+def write (fname, lsnap):
+  lname = []
+  for snap in lsnap: lname += [name for name in snap['phases'] if name not in lname]
+  dsum = {}
+  for name in lname:
+    ls = [snap['phases'][name]['s'] if name in snap['phases'] else 0. for snap in lsnap]
+    n = max(snap['phases'][name]['n'] if name in snap['phases'] else 0 for snap in lsnap)
+    dsum[name] = {'min': min(ls), 'mean': sum(ls) / len(ls), 'max': max(ls), 'n': n}
+  with open(fname, 'w') as fp:
+    json.dump({'nhost': len(lsnap), 'phases': lname, 'summary': dsum, 'ranks': lsnap}, fp, indent=1)
+
+def read (fname):
+  with open(fname, 'r') as fp: return json.load(fp)
+
+# one line per phase: wall time (max over ranks), mean and the share of the total
+def report (dprof):
+  ttot = sum(d['max'] for d in dprof['summary'].values())
+  for name in dprof['phases']:
+    d = dprof['summary'][name]
+    print('%14s: %9.3f s max, %9.3f s mean over %d ranks, %5.1f%%' % (name, d['max'], d['mean'], dprof['nhost'], 100. * d['max'] / ttot if ttot > 0. else 0.))
+  lsend = [rank['spikes']['nsend'] for rank in dprof['ranks']]
+  lwait = [rank['spikes']['wait_time'] for rank in dprof['ranks']]
+  print('spikes sent: %d (max %d on one rank), max spike wait %.3f s' % (sum(lsend), max(lsend), max(lwait)))
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2: print('usage: python simprofile.py profile.json')
+  else: report(read(sys.argv[1]))
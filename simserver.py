@@ -0,0 +1,157 @@
+# simserver.py - persistent simulation server (run.py server mode) and its client
+#
+# the server ranks load NEURON, the mechanisms and the network once and then run the
+# param files sent by clients, applying param changes to the existing network when
+# possible (NetworkOnNode.update_params). outputs are written as by a normal run.
+#
+# starting a server: mpiexec -np 4 nrniv -python -mpi run.py param/default.param server 5005
+#
+# protocol: one JSON object per line over a local TCP socket, one reply per request
+#   {"cmd": "run", "paramf": "param/default.param", "ntrial": 1, "simlength": 0.0, "forkat": 0.0, "abortf": ""}
+#   {"cmd": "quit"}
+#   reply: {"status": "ok" or "error", "datdir": ..., "rebuilt": ..., "twall": ..., "error": ...}
+#
+# client command line:
+#   python simserver.py run param/default.param [ntrial=1] [port=5005]
+#   python simserver.py quit [port=5005]
+#   python simserver.py bench param/default.param [ncore=1] [nrun=5] [port=5005]
+#     (latency of server requests against spawning a new simulation per run)
+
+import os
+import sys
+import json
+import shlex
+import socket
+import time
+from subprocess import Popen
+
+host = '127.0.0.1' # local connections only
+defport = 5005
+
+def valid_request (req):
+  if not isinstance(req, dict): return False
+  if req.get('cmd') == 'quit': return True
+  if req.get('abortf') and not os.path.isfile(str(req['abortf'])): return False
+  return req.get('cmd') == 'run' and os.path.isfile(str(req.get('paramf', '')))
+
+class SimServer ():
+  def __init__ (self, port=defport):
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.sock.bind((host, port))
+    self.sock.listen(1)
+    self.conn = None
+    self.fp = None
+
+  # blocks until the next request; a connection can send any number of requests
+  def next_request (self):
+    while True:
+      if self.conn is None:
+        self.conn, addr = self.sock.accept()
+        self.fp = self.conn.makefile('r')
+      line = self.fp.readline()
+      if not line: # client closed the connection
+        self.__close_conn()
+        continue
+      try:
+        return json.loads(line)
+      except ValueError:
+        return None
+
+  def reply (self, d):
+    try:
+      self.conn.sendall((json.dumps(d) + '\n').encode())
+    except (OSError, AttributeError):
+      self.__close_conn()
+
+  def __close_conn (self):
+    if self.conn is not None:
+      self.fp.close()
+      self.conn.close()
+    self.conn = self.fp = None
+
+  def close (self):
+    self.__close_conn()
+    self.sock.close()
+
+class SimClient ():
+  # timeout (s) is for connecting; requests wait until the simulation is done
+  def __init__ (self, port=defport, timeout=10.):
+    self.sock = socket.create_connection((host, port), timeout)
+    self.sock.settimeout(None)
+    self.fp = self.sock.makefile('r')
+
+  def request (self, d):
+    self.sock.sendall((json.dumps(d) + '\n').encode())
+    line = self.fp.readline()
+    if not line: raise RuntimeError('simulation server closed the connection')
+    return json.loads(line)
+
+  # runs a param file; the reply's tclient is the request latency seen by the client
+  def run (self, paramf, ntrial=1, simlength=0.0, forkat=0.0, abortf=''):
+    t0 = time.time()
+    rep = self.request({'cmd': 'run', 'paramf': paramf, 'ntrial': ntrial, 'simlength': simlength, 'forkat': forkat, 'abortf': abortf})
+    rep['tclient'] = time.time() - t0
+    return rep
+
+  def quit (self):
+    rep = self.request({'cmd': 'quit'})
+    self.close()
+    return rep
+
+  def close (self):
+    self.fp.close()
+    self.sock.close()
+
+# starts a server with ncore ranks and returns (process, client) once it accepts connections
+def start_server (paramf, ncore=1, port=defport, simf='run.py', tmax=120.):
+  if ncore > 1:
+    cmd = 'mpiexec -np ' + str(ncore) + ' nrniv -python -mpi -nobanner ' + simf + ' ' + paramf + ' server ' + str(port)
+  else:
+    cmd = 'nrniv -python -nobanner ' + simf + ' ' + paramf + ' server ' + str(port)
+  proc = Popen(shlex.split(cmd, posix="win" not in sys.platform), cwd=os.getcwd())
+  t0 = time.time()
+  while True:
+    try:
+      return proc, SimClient(port)
+    except OSError:
+      if proc.poll() is not None: raise RuntimeError('simulation server exited with return code %d' % proc.returncode)
+      if time.time() - t0 > tmax:
+        proc.kill()
+        raise RuntimeError('simulation server did not start within %g s' % tmax)
+      time.sleep(0.5)
+
+# request latency of a server against cold spawns of the same simulation
+def bench (paramf, ncore=1, nrun=5, port=defport):
+  import simcompare
+  from conf import dconf
+  lcold = [simcompare.runsim(paramf, ncore)[0] for i in range(nrun)]
+  t0 = time.time()
+  proc, client = start_server(paramf, ncore, port, dconf['simf'])
+  tstart = time.time() - t0
+  lwarm = []
+  for i in range(nrun):
+    rep = client.run(paramf)
+    if rep['status'] != 'ok': raise RuntimeError(rep.get('error', 'request failed'))
+    lwarm.append(rep['tclient'])
+  client.quit()
+  proc.wait()
+  print('cold spawn: mean %.3f s, min %.3f s per run (%d runs)' % (sum(lcold) / nrun, min(lcold), nrun))
+  print('server: startup %.3f s, mean %.3f s, min %.3f s per request' % (tstart, sum(lwarm) / nrun, min(lwarm)))
+  return lcold, tstart, lwarm
+
+if __name__ == '__main__':
+  lcmd = [arg for arg in sys.argv[1:] if '=' not in arg and not arg.endswith('.param')]
+  dopt = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+  lparamf = [arg for arg in sys.argv[1:] if arg.endswith('.param')]
+  paramf = lparamf[0] if lparamf else os.path.join('param', 'default.param')
+  port = int(dopt.get('port', defport))
+  cmd = lcmd[0] if lcmd else 'run'
+  if cmd == 'bench':
+    bench(paramf, int(dopt.get('ncore', 1)), int(dopt.get('nrun', 5)), port)
+  elif cmd == 'quit':
+    print(SimClient(port).quit())
+  else:
+    client = SimClient(port)
+    print(client.run(paramf, int(dopt.get('ntrial', 1))))
+    client.close()
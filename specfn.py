@@ -63,8 +63,11 @@ class MorletSpec():
             # Number of cycles in wavelet (>5 advisable)
             self.width = 7.
 
-            # Calculate sampling frequency
-            self.fs = 1000. / self.p_dict['dt']
+            # Calculate sampling frequency from the sample interval of the data (the
+            # recording interval of a simulation, see paramrw.recdt)
+            if len(self.tvec) > 1: self.dt = self.tvec[1] - self.tvec[0]
+            else: self.dt = paramrw.recdt(self.p_dict)
+            self.fs = 1000. / self.dt
 
             # Generate Spec data
             self.TFR = self.__traces2TFR()
@@ -107,7 +110,7 @@ class MorletSpec():
         # range should probably be 0 to len(self.S_trans)
         # shift tvec to reflect change
         # this is in ms
-        self.t = 1000. * np.arange(1, len(self.S_trans)+1) / self.fs + self.tmin - self.p_dict['dt']
+        self.t = 1000. * np.arange(1, len(self.S_trans)+1) / self.fs + self.tmin - self.dt
 
         # preallocation
         B = np.zeros((len(self.f), len(self.S_trans)))
@@ -237,7 +240,7 @@ class PhaseLock():
         self.width = 7.
 
         # Calculate sampling frequency
-        self.fs = 1000. / self.p['dt']
+        self.fs = 1000. / paramrw.recdt(self.p)
 
         self.data = self.__traces2PLS()
 
@@ -887,21 +890,24 @@ def spec_dpl_kernel(fparam, fts, fspec, f_max):
     # Do the conversion prior to generating these spec
     # dpl.convert_fAm_to_nAm()
 
+    # Save spec results
+    np.savez_compressed(fspec, **spec_dpl(dpl, paramrw.read(fparam)[1], f_max))
+
+# spec results of a Dipole in memory, as saved by spec_dpl_kernel
+def spec_dpl(dpl, p_dict, f_max):
     # Generate various spec results
-    spec_agg = MorletSpec(dpl.t, dpl.dpl['agg'], fparam, f_max)
-    spec_L2 = MorletSpec(dpl.t, dpl.dpl['L2'], fparam, f_max)
-    spec_L5 = MorletSpec(dpl.t, dpl.dpl['L5'], fparam, f_max)
+    spec_agg = MorletSpec(dpl.t, dpl.dpl['agg'], None, f_max, p_dict)
+    spec_L2 = MorletSpec(dpl.t, dpl.dpl['L2'], None, f_max, p_dict)
+    spec_L5 = MorletSpec(dpl.t, dpl.dpl['L5'], None, f_max, p_dict)
 
     # Get max spectral power data
     # for now, only doing this for agg
     max_agg = spec_agg.max()
 
     # Generate periodogram resutls
-    p_dict = paramrw.read(fparam)[1]
-    pgram = Welch(dpl.t, dpl.dpl['agg'], p_dict['dt'])
+    pgram = Welch(dpl.t, dpl.dpl['agg'], paramrw.recdt(p_dict))
 
-    # Save spec results
-    np.savez_compressed(fspec, time=spec_agg.t, freq=spec_agg.f, TFR=spec_agg.TFR, max_agg=max_agg, t_L2=spec_L2.t, f_L2=spec_L2.f, TFR_L2=spec_L2.TFR, t_L5=spec_L5.t, f_L5=spec_L5.f, TFR_L5=spec_L5.TFR, pgram_p=pgram.P, pgram_f=pgram.f)
+    return dict(time=spec_agg.t, freq=spec_agg.f, TFR=spec_agg.TFR, max_agg=max_agg, t_L2=spec_L2.t, f_L2=spec_L2.f, TFR_L2=spec_L2.TFR, t_L5=spec_L5.t, f_L5=spec_L5.f, TFR_L5=spec_L5.TFR, pgram_p=pgram.P, pgram_f=pgram.f)
 
 def analysis_simp (opts, fparam, fdpl, fspec):
   opts_run = {'type': 'dpl_laminar',
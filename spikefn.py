@@ -11,12 +11,129 @@ import matplotlib.pyplot as plt
 import itertools as it
 import os
 import paramrw
+from gidreg import GidRegistry
+
+# spike files hold one spike per row (time, gid): as text, or as a binary .npy n x 2
+# array next to the text file name ([sim] spkfmt in conf.py, see fileio.write_table)
+def spkfname_npy (fspikes):
+  return fio.npyname(fspikes)
+
+# writes spk (n x 2 array of time, gid) in one go; fmt is 'txt', 'npy' or 'both'.
+# the file of the other format and the index of the earlier spikes are removed
+def write_spikes (fspikes, spk, fmt='txt'):
+  SpikeIndex.remove(fspikes)
+  fio.write_table(fspikes, np.asarray(spk).reshape(-1, 2), ['%3.2f', '%d'], fmt)
+
+# reads the spikes of fspikes, from its .npy version if there is one;
+# returns n x 2 array of time, gid
+def read_spikes (fspikes):
+  return fio.read_table(fspikes).reshape(-1, 2)
+
+# spike file fspikes exists as text or .npy
+def spikes_exist (fspikes):
+  return fio.table_exists(fspikes)
+
+# spikes sorted by (trial, gid, time) with the offset of each (trial, gid) row, as in a
+# CSR matrix: the spikes of a gid, or of a range of gids (a cell type), are one slice
+#   times[offsets[trial * ngid + gid]:offsets[trial * ngid + gid + 1]]
+# saved next to the spike file as two .npy arrays that load memory-mapped
+class SpikeIndex ():
+  def __init__ (self, times, offsets, ntrial=1):
+    self.t = times
+    self.offsets = offsets
+    self.ntrial = ntrial
+    self.ngid = (len(offsets) - 1) // ntrial
+
+  # from an n x 2 array of (time, gid)
+  @classmethod
+  def from_spikes (cls, s_all, ngid=None):
+    return cls.from_trials([s_all], ngid)
+
+  # from a list of n x 2 arrays of (time, gid), one per trial
+  @classmethod
+  def from_trials (cls, lspk, ngid=None):
+    lspk = [np.asarray(spk, dtype='float64').reshape(-1, 2) for spk in lspk]
+    if ngid is None: ngid = max([int(spk[:, 1].max()) + 1 for spk in lspk if len(spk)] + [0])
+    t = np.concatenate([spk[:, 0] for spk in lspk])
+    gids = np.concatenate([spk[:, 1] for spk in lspk]).astype(np.int64)
+    trials = np.concatenate([np.full(len(spk), i, dtype=np.int64) for i, spk in enumerate(lspk)])
+    sel = (gids >= 0) & (gids < ngid)
+    row = trials[sel] * ngid + gids[sel]
+    t = t[sel]
+    order = np.lexsort((t, row))
+    counts = np.bincount(row, minlength=len(lspk) * ngid)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return cls(t[order], offsets, len(lspk))
+
+  # rows (trial * ngid + gid) of gids [start, stop) in each requested trial (None: all)
+  def __rows (self, start, stop, trial):
+    start, stop = max(0, min(start, self.ngid)), max(0, min(stop, self.ngid))
+    ltrial = range(self.ntrial) if trial is None else [trial]
+    return [(i * self.ngid + start, i * self.ngid + stop) for i in ltrial]
+
+  # spike times of gids [start, stop) as one array (a view when a single trial is asked)
+  def range_times (self, start, stop, trial=None):
+    lt = [self.t[self.offsets[r0]:self.offsets[r1]] for r0, r1 in self.__rows(start, stop, trial)]
+    if len(lt) == 1: return lt[0]
+    return np.concatenate(lt)
+
+  # gid of each spike of range_times(start, stop, trial)
+  def range_gids (self, start, stop, trial=None):
+    lgid = []
+    for r0, r1 in self.__rows(start, stop, trial):
+      lgid.append(np.repeat(np.arange(r0, r1) % self.ngid, np.diff(self.offsets[r0:r1 + 1])))
+    return np.concatenate(lgid) if lgid else np.zeros(0, dtype=np.int64)
+
+  # spike times of one gid; trial None: all trials
+  def times (self, gid, trial=None):
+    return self.range_times(int(gid), int(gid) + 1, trial)
+
+  # spike times of each gid in gids
+  def spike_list (self, gids, trial=None):
+    return [self.times(gid, trial) for gid in gids]
+
+  # files of the index saved next to fspikes
+  @staticmethod
+  def fnames (fspikes):
+    base = os.path.splitext(fspikes)[0]
+    return [base + '.csr_t.npy', base + '.csr_off.npy', base + '.csr_ntrial.npy']
+
+  def save (self, fspikes):
+    lf = SpikeIndex.fnames(fspikes)
+    np.save(lf[0], np.asarray(self.t))
+    np.save(lf[1], np.asarray(self.offsets))
+    np.save(lf[2], np.array([self.ntrial]))
+
+  # removes the saved index of fspikes (write_spikes does, since it no longer matches)
+  @staticmethod
+  def remove (fspikes):
+    for f in SpikeIndex.fnames(fspikes):
+      if os.path.isfile(f): os.remove(f)
+
+  # the saved index of fspikes, None if there is none
+  @classmethod
+  def load (cls, fspikes):
+    lf = cls.fnames(fspikes)
+    if not all(os.path.isfile(f) for f in lf): return None
+    return cls(np.load(lf[0], mmap_mode='r'), np.load(lf[1], mmap_mode='r'), int(np.load(lf[2])[0]))
+
+# spike index of fspikes: the saved one if there is one, else built from the spikes
+def read_index (fspikes):
+  idx = SpikeIndex.load(fspikes)
+  if idx is None: idx = SpikeIndex.from_spikes(read_spikes(fspikes))
+  return idx
+
+# writes the spikes and, with binary spike files, their index
+def write_spikes_indexed (fspikes, spk, fmt='txt'):
+  write_spikes(fspikes, spk, fmt)
+  if fmt != 'txt': SpikeIndex.from_spikes(spk).save(fspikes)
 
 # meant as a class for ONE cell type
 class Spikes():
-  def __init__ (self, s_all, ranges):
+  # idx optionally holds the spikes already indexed by gid (see SpikeIndex)
+  def __init__ (self, s_all, ranges, idx=None):
     self.r = ranges
-    self.spike_list = self.filter(s_all)
+    self.spike_list = self.filter(s_all, idx)
     self.N_cells = len(self.r)
     self.N_spikingcells = len(self.spike_list)
     # this is set externally
@@ -24,13 +141,11 @@ class Spikes():
 
   # returns spike_list, a list of lists of spikes.
   # Each list corresponds to a cell, counted by range
-  def filter (self, s_all):
+  def filter (self, s_all, idx=None):
     spike_list = []
     if len(s_all) > 0:
-      for ri in self.r:
-        srange = s_all[s_all[:, 1] == ri][:, 0]
-        srange[srange.argsort()]
-        spike_list.append(srange)
+      if idx is None: idx = SpikeIndex.from_spikes(s_all)
+      spike_list = idx.spike_list(self.r)
 
     return spike_list
 
@@ -66,6 +181,8 @@ class ExtInputs (Spikes):
       self.gid_dict, self.p_dict = paramrw.read(fparam)
     except OSError:
       raise ValueError
+    self.gidreg = GidRegistry(self.gid_dict)
+    self.idx = None # spikes indexed by gid (SpikeIndex), set when the spike file is read
     self.evoked = evoked
     # parse evoked prox and dist input gids from gid_dict
     # print('getting evokedinput gids')
@@ -138,24 +255,22 @@ class ExtInputs (Spikes):
 
   def unique_times (self,s_all,lidx):
     self.r = [x for x in lidx]
-    lfilttime = self.filter(s_all); ltime = []
-    for arr in lfilttime:
-      for time in arr:
-        ltime.append(time)
-    return np.array(list(set(ltime)))
+    lfilttime = self.filter(s_all, self.idx)
+    if not lfilttime: return np.array([])
+    return np.unique(np.concatenate(lfilttime))
 
   def get_times (self, gid, s_all):
     # self.filter() inherited from Spikes()
     # self.r weirdness is necessary to use self.filter()
     # i.e. self.r must exist and be a list to execute self.filter()
     self.r = [gid]
-    return self.filter(s_all)[0]
+    return self.filter(s_all, self.idx)[0]
 
   def __get_extinput_times (self, fspk):
     # load all spike times from file
     s_all = []
     try:
-      s_all = np.loadtxt(open(fspk, 'rb'))
+      s_all = read_spikes(fspk)
     except OSError:
       print('Warning: could not read file:', fspk)
     except ValueError:
@@ -165,6 +280,7 @@ class ExtInputs (Spikes):
       # couldn't read spike times
       raise ValueError
 
+    self.idx = read_index(fspk)
     inputs = {k:np.array([]) for k in ['prox','dist','evprox','evdist','pois']}
     if self.gid_prox is not None: inputs['prox'] = self.get_times(self.gid_prox,s_all)
     if self.gid_dist is not None: inputs['dist'] = self.get_times(self.gid_dist,s_all)
@@ -261,11 +377,11 @@ def filter_spike_dict (s_dict, str_startswith):
 def bin_count(bins_per_second, tinterval): return bins_per_second * tinterval / 1000.
 
 # splits ext random feeds (of type exttype) by supplied cell type
-def split_extrand(s, gid_dict, celltype, exttype):
+def split_extrand(s, gid_dict, celltype, exttype, idx=None):
   gid_cell = gid_dict[celltype]
   gid_exttype_start = gid_dict[exttype][0]
   gid_exttype_cell = [gid + gid_exttype_start for gid in gid_dict[celltype]]
-  return Spikes(s, gid_exttype_cell)
+  return Spikes(s, gid_exttype_cell, idx)
 
 # histogram bin optimization
 def hist_bin_opt(x, N_trials):
@@ -310,35 +426,35 @@ def spikes_from_file(fparam, fspikes):
     else:
       src_unique_list.append(key)
   # check to see if there are spikes in here, otherwise return an empty array
-  if os.stat(fspikes).st_size:
-    s = np.loadtxt(open(fspikes, 'rb'))
-  else:
-    s = np.array([], dtype='float64')
+  s = read_spikes(fspikes)
+  if not len(s): s = np.array([], dtype='float64')
+  # index the spikes by gid once, shared by all the Spikes below
+  idx = read_index(fspikes)
   # get the skeleton s_dict from the cell_list
   s_dict = dict.fromkeys(src_list)
   # iterate through just the src keys
   for key in s_dict.keys():
     # sort of a hack to separate extgauss
-    s_dict[key] = Spikes(s, gid_dict[key])
+    s_dict[key] = Spikes(s, gid_dict[key], idx)
     # figure out its extgauss feed
     newkey_gauss = 'extgauss_' + key
-    s_dict[newkey_gauss] = split_extrand(s, gid_dict, key, 'extgauss')
+    s_dict[newkey_gauss] = split_extrand(s, gid_dict, key, 'extgauss', idx)
     # figure out its extpois feed
     newkey_pois = 'extpois_' + key
-    s_dict[newkey_pois] = split_extrand(s, gid_dict, key, 'extpois')
+    s_dict[newkey_pois] = split_extrand(s, gid_dict, key, 'extpois', idx)
   # do the keys in unique list
-  for key in src_unique_list: s_dict[key] = Spikes(s, gid_dict[key])
+  for key in src_unique_list: s_dict[key] = Spikes(s, gid_dict[key], idx)
   # Deal with alpha feeds (extinputs)
   # order guaranteed by order of inputs in p_ext in paramrw
   # and by details of gid creation in class_net
   # A little kludgy to deal with the fact that one might not exist
   if len(gid_dict['extinput']) > 1:
-    s_dict['alpha_feed_prox'] = Spikes(s, [gid_dict['extinput'][0]])
-    s_dict['alpha_feed_dist'] = Spikes(s, [gid_dict['extinput'][1]])
+    s_dict['alpha_feed_prox'] = Spikes(s, [gid_dict['extinput'][0]], idx)
+    s_dict['alpha_feed_dist'] = Spikes(s, [gid_dict['extinput'][1]], idx)
   else:
     # not sure why this is done here
     # handle the extinput: this is a LIST!
-    s_dict['extinput'] = [Spikes(s, [gid]) for gid in gid_dict['extinput']]
+    s_dict['extinput'] = [Spikes(s, [gid], idx) for gid in gid_dict['extinput']]
   return s_dict
 
 # from the supplied key name, return a marker style
@@ -0,0 +1,145 @@
+# statetemplate.py - per cell type initial-state templates
+#
+# a template holds the initial value of every state of a cell (segment voltages and,
+# optionally, the STATE variables of its density mechanisms) in a fixed segment order;
+# it is the same for all cells of one type, so NetworkOnNode can set the states of all
+# its cells with one PtrVector scatter instead of walking the segments in python
+#
+# creating full-state templates from the resting state of lone cells:
+#   nrniv -python statetemplate.py param/default.param stateinit.npz [tsettle]
+
+import os
+import sys
+import numpy as np
+from neuron import h
+
+# resting voltages by cell type (and section name for L5 pyramidal cells), as set
+# by the original NetworkOnNode.state_init
+dvinit = {
+  'L2_pyramidal': -71.46,
+  'L5_pyramidal': {
+    'L5Pyr_apical_1': -71.32,
+    'L5Pyr_apical_2': -69.08,
+    'L5Pyr_apical_tuft': -67.30,
+    None: -72.,
+  },
+  'L2_basket': -64.9737,
+  'L5_basket': -64.9737,
+}
+
+# sections of a cell in a fixed order (whole tree from the soma)
+def get_sections (cell):
+  seclist = h.SectionList()
+  seclist.wholetree(sec=cell.soma)
+  return [sect for sect in seclist]
+
+# names of the STATE variables of the density mechanisms in sect (e.g. m_hh2)
+def state_names (sect):
+  lname = []
+  strdef = h.ref('')
+  for mech in sect(0.5):
+    ms = h.MechanismStandard(mech.name(), 3) # 3: STATE variables
+    for i in range(int(ms.count())):
+      ms.name(strdef, i)
+      lname.append(strdef[0])
+  return lname
+
+# (name, pointer) of the voltage and, with states, the mechanism states of each segment
+def get_refs (cell, states=True):
+  lref = []
+  for sect in get_sections(cell):
+    lstate = state_names(sect) if states else []
+    for seg in sect:
+      lref.append(('v', seg._ref_v))
+      for name in lstate: lref.append((name, getattr(seg, '_ref_' + name)))
+  return lref
+
+# resting voltage of each segment of cell, in get_refs(cell, False) order
+def vinit_values (cell):
+  lv = []
+  for sect in get_sections(cell):
+    vinit = dvinit[cell.celltype]
+    if isinstance(vinit, dict): vinit = vinit.get(sect.name(), vinit[None])
+    lv += [vinit] * sect.nseg
+  return np.array(lv)
+
+# current values of the states of cell: (names, values)
+def capture (cell, states=True):
+  lref = get_refs(cell, states)
+  return [name for name, ref in lref], np.array([ref[0] for name, ref in lref])
+
+# templates are stored as <celltype>_names and <celltype>_vals arrays
+def write (fname, dtmpl):
+  darr = {}
+  for celltype, (lname, vals) in dtmpl.items():
+    darr[celltype + '_names'] = np.array(lname)
+    darr[celltype + '_vals'] = np.asarray(vals, dtype=float)
+  np.savez(fname, **darr)
+
+# returns dict of celltype -> (names, values); None on failure
+def read (fname):
+  try:
+    dat = np.load(fname)
+  except:
+    print("Warning: could not read state template file %s" % fname)
+    return None
+  dtmpl = {}
+  for key in dat.files:
+    if key.endswith('_names'):
+      celltype = key[:-len('_names')]
+      dtmpl[celltype] = ([str(name) for name in dat[key]], dat[celltype + '_vals'])
+  return dtmpl
+
+# sets a fixed list of pointers to fixed values; with PtrVector this is one call
+class StateSetter ():
+  def __init__ (self, lref, vals):
+    self.vals = h.Vector(np.asarray(vals, dtype=float))
+    if hasattr(h, 'PtrVector'):
+      self.ptr = h.PtrVector(len(lref))
+      for i, ref in enumerate(lref): self.ptr.pset(i, ref)
+      self.lref = None
+    else: # older NEURON: set the values one by one
+      self.ptr = None
+      self.lref = lref
+
+  def apply (self):
+    if self.ptr is not None:
+      self.ptr.scatter(self.vals)
+    else:
+      for ref, val in zip(self.lref, self.vals): ref[0] = val
+
+# resting states of lone prototype cells: initialized to the template voltages and
+# integrated without inputs for tsettle ms
+def settle (p, lcelltype, tsettle=500.):
+  import loadbal
+  h.dt = p['dt']
+  h.celsius = p['celsius']
+  dtmpl = {}
+  for celltype in lcelltype:
+    cell = loadbal.create_prototype(celltype, p)
+    for (name, ref), v in zip(get_refs(cell, False), vinit_values(cell)): ref[0] = v
+    h.finitialize()
+    while h.t < tsettle: h.fadvance()
+    dtmpl[celltype] = capture(cell)
+    del cell
+  return dtmpl
+
+if __name__ == '__main__':
+  import paramrw
+  h.load_file("stdrun.hoc")
+  f_psim = os.path.join('param', 'default.param')
+  fout = 'stateinit.npz'
+  tsettle = 500.
+  for arg in sys.argv[1:]:
+    if arg.endswith('.param'): f_psim = arg
+    elif arg.endswith('.npz'): fout = arg
+    else: tsettle = float(arg)
+  p_exp = paramrw.ExpParams(f_psim)
+  if len(p_exp.expmt_groups) > 0: expmt_group = p_exp.expmt_groups[0]
+  else: expmt_group = None
+  p = p_exp.return_pdict(expmt_group, 0)
+  dtmpl = settle(p, ['L2_basket', 'L2_pyramidal', 'L5_basket', 'L5_pyramidal'], tsettle)
+  for celltype, (lname, vals) in dtmpl.items(): print('%14s: %d states, soma v %.3f mV' % (celltype, len(lname), vals[0]))
+  write(fout, dtmpl)
+  print('wrote', fout)
+  h.quit()
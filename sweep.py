@@ -0,0 +1,70 @@
+# sweep.py - parameter sweeps over all the simulations of a param file
+#
+# paramrw.ExpParams expands the ranges and linspace values of a param file into N_sims
+# simulations for each of its expmt_groups; a sweep runs every (expmt_group, sim, trial)
+# combination. run.py schedules them on groups of ranks through the bulletin board:
+#   mpiexec -np 16 nrniv -python -mpi run.py param/sweep.param sweep [ranks per simulation=1]
+# outputs use the fileio.SimulationPaths layout (dsim/<expmt_group>/<datatype>/<file>).
+# the combinations that finished are listed in dsim/sweep_done.txt, and a sweep that is
+# started again (e.g. after a crash) skips them. the seed of the random seeds is kept in
+# dsim/sweep_seed.txt, so the trials of a sim that run after a restart use the same seeds
+# as the ones that ran before it
+
+import os
+
+fdone = 'sweep_done.txt'
+fseed = 'sweep_seed.txt'
+
+# all (expmt_group, sim index, trial) combinations of p_exp; ntrial > 0 overrides the
+# N_trials param of the simulations
+def combinations (p_exp, ntrial=0):
+  lcomb = []
+  for expmt_group in p_exp.expmt_groups:
+    for i in range(p_exp.N_sims):
+      if ntrial > 0: n = ntrial
+      else: n = max(1, int(p_exp.return_pdict(expmt_group, i).get('N_trials', 1)))
+      lcomb += [(expmt_group, i, trial) for trial in range(n)]
+  return lcomb
+
+def done_file (ddir):
+  return os.path.join(ddir.dsim, fdone)
+
+# combinations listed as finished in the sim directory of ddir
+def read_done (ddir):
+  sdone = set()
+  if not os.path.isfile(done_file(ddir)): return sdone
+  with open(done_file(ddir), 'r') as fp:
+    for line in fp.readlines():
+      sp = line.split()
+      if len(sp) == 3: sdone.add((sp[0], int(sp[1]), int(sp[2])))
+  return sdone
+
+# appends a finished combination; flushed right away so that it survives a crash
+def mark_done (ddir, comb):
+  with open(done_file(ddir), 'a') as fp:
+    fp.write('%s %d %d\n' % comb)
+    fp.flush()
+    os.fsync(fp.fileno())
+
+# the world seed saved in the sim directory of ddir, or seed (saved) for a new sweep
+def world_seed (ddir, seed):
+  fname = os.path.join(ddir.dsim, fseed)
+  if os.path.isfile(fname):
+    with open(fname, 'r') as fp:
+      sp = fp.read().split()
+      if sp: return int(sp[0])
+  with open(fname, 'w') as fp:
+    fp.write('%d\n' % seed)
+    fp.flush()
+    os.fsync(fp.fileno())
+  return seed
+
+# output files of one combination, with the keys of run.setoutfiles
+def outfiles (ddir, expmt_group, i, trial):
+  doutf = {}
+  for key, datatype in [('file_dpl', 'rawdpl'), ('file_current', 'rawcurrent'), ('file_param', 'param'),
+                        ('file_spikes', 'rawspk'), ('file_spec', 'rawspec'), ('file_dpl_norm', 'normdpl'),
+                        ('file_vsoma', 'vsoma'), ('file_lfp', 'lfp'), ('file_gidreg', 'gidreg')]:
+    doutf[key] = ddir.create_sim_filename(expmt_group, datatype, i, trial)
+  doutf['filename_debug'] = 'debug.dat'
+  return doutf
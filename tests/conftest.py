@@ -0,0 +1,5 @@
+# the modules are imported from the top level of the repository
+import os.path as op
+import sys
+
+sys.path.insert(0, op.join(op.dirname(op.abspath(__file__)), op.pardir))
@@ -0,0 +1,60 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+
+def _signal(n, dt=0.025):
+    t = dt * np.arange(n)
+    return np.column_stack((t, np.sin(2 * np.pi * 10. * t / 1000.), np.cos(2 * np.pi * 3. * t / 1000.) + 0.1 * t))
+
+
+def test_chunked_equals_whole():
+    """Test that decimating in chunks gives the output of one go"""
+    from decimate import Decimator, decimate
+
+    x = _signal(4001)
+    for q in [2, 4, 10]:
+        whole = decimate(x, q)
+        for nchunk in [1, 7, q, 4 * q + 1, 397, 4001]:
+            dec = Decimator(q)
+            parts = [dec.push(x[i:i + nchunk]) for i in range(0, len(x), nchunk)]
+            parts.append(dec.finish())
+            assert_array_equal(np.concatenate(parts), whole)
+
+
+def test_output_length_and_time():
+    """Test the number of output rows and the picked time column"""
+    from decimate import decimate
+
+    for nin in [1, 2, 9, 10, 11, 100, 1001]:
+        x = _signal(nin)
+        for q in [2, 3, 10]:
+            y = decimate(x, q)
+            assert len(y) == (nin - 1) // q + 1
+            assert_array_equal(y[:, 0], x[::q, 0])
+
+
+def test_dc_gain():
+    """Test that a constant passes unchanged"""
+    from decimate import lowpass_taps, decimate
+
+    for q in [2, 4, 40]:
+        assert_allclose(lowpass_taps(q).sum(), 1.)
+        x = np.column_stack((np.arange(1000.), np.full(1000, 3.5)))
+        assert_allclose(decimate(x, q)[:, 1], 3.5)
+
+
+def test_alias_attenuated():
+    """Test that a tone above the new Nyquist frequency is removed"""
+    from decimate import decimate
+
+    dt, q = 0.025, 10 # 40 kHz to 4 kHz, Nyquist 2 kHz
+    t = dt * np.arange(40001)
+    slow = np.sin(2 * np.pi * 10. * t / 1000.)
+    fast = np.sin(2 * np.pi * 3900. * t / 1000.) # aliases to 100 Hz when sampled
+    y = decimate(np.column_stack((t, slow + fast)), q)
+    # away from the edges the output is the slow tone within 1% of the fast amplitude
+    hw = 4 * q
+    err = y[hw:-hw, 1] - slow[::q][hw:-hw]
+    assert np.abs(err).max() < 0.01
+    # plain sampling keeps the alias
+    assert np.abs(fast[::q]).max() > 0.5
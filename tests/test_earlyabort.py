@@ -0,0 +1,72 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+def test_bound_matches_weighted_rmse(tmp_path):
+    """Test that the error bound of a finished run is its weighted RMSE"""
+    import decimate
+    import earlyabort
+    import simdat
+    from dipolefn import Dipole
+    from params_default import get_params_default
+
+    dt, q, tstop = 0.025, 4, 100.
+    p = get_params_default()
+    p.update({'dt': dt, 'record_dt': q * dt, 'tstop': tstop})
+
+    # raw dipoles recorded every step (record_aa), with power above the
+    # Nyquist frequency of record_dt
+    t = dt * np.arange(int(round(tstop / dt)) + 1)
+    L2 = 2e5 * np.sin(2 * np.pi * 10. * t / 1000.) + 5e4 * np.sin(2 * np.pi * 7000. * t / 1000.)
+    L5 = -3e5 * np.cos(2 * np.pi * 15. * t / 1000.) + 5e4 * np.cos(2 * np.pi * 9000. * t / 1000.)
+
+    # the saved dipole (run.savedat)
+    td, L2d, L5d = decimate.decimate(np.column_stack((t, L2, L5)), q).T
+    dpl = Dipole(np.column_stack((td, L2d + L5d, L2d, L5d)))
+    dpl.baseline_renormalize(p)
+    dpl.convert_fAm_to_nAm()
+    dpl.scale(p['dipole_scalefctr'])
+    dpl.smooth_ms(p['dipole_smooth_win'])
+
+    exp = np.column_stack((dpl.t, dpl.dpl['agg'] + 0.3 * np.sin(2 * np.pi * 20. * dpl.t / 1000.)))
+    weights = np.linspace(0.5, 2., len(dpl.t))
+    tstart, tstop_opt = 20., 60.
+
+    ddat = {'dpl': np.column_stack((dpl.t, dpl.dpl['agg'])), 'dextdata': {'exp': exp}}
+    simdat.weighted_rmse(ddat, tstop_opt, weights, tstart=tstart)
+
+    fname = op.join(str(tmp_path), 'target.npz')
+    earlyabort.write_target(fname, [exp], weights, tstart, tstop_opt, 1e9)
+    errbound = earlyabort.ErrorBound(fname, p, q * dt)
+    assert_allclose(errbound.bound(t, L2, L5), ddat['werrtot'], rtol=1e-6)
+
+
+def test_abort_removes_earlier_outputs(tmp_path):
+    """Test that an aborted run leaves no outputs of the run before it"""
+    import earlyabort
+    import simcompare
+    from fileio import read_table, table_exists
+    from paramrw import recdt
+    from params_default import get_params_default
+
+    fparam = op.join(str(tmp_path), 'test_abort.param')
+    simcompare.write_param(op.join('param', 'default.param'), fparam,
+                           {'tstop': 40., 'sim_prefix': 'test_abort'})
+    datdir = simcompare.getdatdir(fparam)
+    simcompare.runsim(fparam)
+    dpl = read_table(op.join(datdir, 'dpl.txt'))
+    assert earlyabort.read_aborted(datdir) is None
+
+    # a target the run can not get close to
+    p = get_params_default()
+    p.update({'tstop': 40.})
+    fabort = op.join(str(tmp_path), 'opttarget.npz')
+    dat = np.column_stack((dpl[:, 0], dpl[:, 1] + 1e3))
+    weights = np.ones(int(round(40. / recdt(p))) + 1)
+    earlyabort.write_target(fabort, [dat], weights, 0., 40., 1e-3)
+    simcompare.runsim(fparam, extra='abort ' + fabort)
+    assert earlyabort.read_aborted(datdir) is not None
+    for name in ['dpl.txt', 'rawdpl.txt', 'i.txt', 'spk.txt']:
+        assert not table_exists(op.join(datdir, name))
@@ -0,0 +1,29 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+def test_write_table_keeps_one_format(tmp_path):
+    """Test that a table rewritten in another format is not read from the old file"""
+    from fileio import npyname, read_table, table_exists, write_table
+
+    fname = op.join(str(tmp_path), 'dpl.txt')
+    x_old = np.column_stack((np.arange(10.), np.ones(10)))
+    x_new = 2. * x_old
+    fmt = ['%03.3f', '%9.8f']
+    assert not table_exists(fname)
+
+    # a .npy from an earlier run, then text written in the same second
+    write_table(fname, x_old, fmt, 'npy')
+    write_table(fname, x_new, fmt, 'txt')
+    assert op.isfile(fname) and not op.isfile(npyname(fname))
+    assert_allclose(read_table(fname), x_new)
+
+    write_table(fname, x_old, fmt, 'both')
+    assert op.isfile(fname) and op.isfile(npyname(fname))
+    assert_allclose(read_table(fname, mmap=True), x_old)
+
+    write_table(fname, x_new, fmt, 'npy')
+    assert not op.isfile(fname) and table_exists(fname)
+    assert_allclose(read_table(fname), x_new)
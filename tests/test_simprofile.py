@@ -0,0 +1,30 @@
+import sys
+import threading
+
+
+def test_add_from_another_thread():
+    """Test that phase times added by a writer thread are all counted"""
+    import simprofile
+
+    simprofile.reset()
+    # switch threads often, to interleave with the dict iteration of phases()
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    nadd = 20000
+    try:
+        thread = threading.Thread(target=lambda: [simprofile.add('write', 1e-6) for i in range(nadd)])
+        thread.start()
+        # new phases are added while the writer runs
+        i = 0
+        while thread.is_alive():
+            simprofile.add('phase_%d' % (i % 500), 0.)
+            simprofile.phases()
+            i += 1
+        thread.join()
+    finally:
+        sys.setswitchinterval(switch)
+    dph = simprofile.phases()
+    assert dph['write']['n'] == nadd
+    assert abs(dph['write']['s'] - nadd * 1e-6) < 1e-9
+    simprofile.reset()
+    assert simprofile.phases() == {}
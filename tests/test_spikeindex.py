@@ -0,0 +1,107 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+
+def _random_spikes(rng, n, ngid, tstop=170.):
+    # times at the precision of the text spike files
+    return np.column_stack((np.round(rng.uniform(0., tstop, n), 2), rng.integers(0, ngid, n))).astype('float64')
+
+
+def _filter(s_all, gid):
+    # spike times of gid as found before the index
+    return np.sort(s_all[s_all[:, 1] == gid][:, 0])
+
+
+def test_from_trials():
+    """Test the index of multi-trial spikes against filtering by gid"""
+    from spikefn import SpikeIndex
+
+    rng = np.random.default_rng(0)
+    lspk = [_random_spikes(rng, n, 30) for n in [500, 0, 321]]
+    idx = SpikeIndex.from_trials(lspk)
+    ngid = int(max(spk[:, 1].max() for spk in lspk if len(spk))) + 1
+    assert idx.ngid == ngid and idx.ntrial == 3
+    assert len(idx.offsets) == 3 * ngid + 1
+    assert idx.offsets[-1] == sum(len(spk) for spk in lspk)
+    for trial, spk in enumerate(lspk):
+        counts = np.bincount(spk[:, 1].astype(int), minlength=ngid) if len(spk) else np.zeros(ngid, dtype=int)
+        assert_array_equal(np.diff(idx.offsets[trial * ngid:(trial + 1) * ngid + 1]), counts)
+        for gid in range(ngid):
+            assert_array_equal(idx.times(gid, trial), _filter(spk, gid))
+    s_all = np.concatenate(lspk)
+    for gid in range(ngid):
+        assert_array_equal(np.sort(idx.times(gid)), _filter(s_all, gid))
+
+
+def test_ranges_and_spike_list():
+    """Test range_times, range_gids and spike_list against filtering by gid"""
+    from spikefn import SpikeIndex
+
+    rng = np.random.default_rng(1)
+    s_all = _random_spikes(rng, 2000, 50)
+    idx = SpikeIndex.from_spikes(s_all)
+    for start, stop in [(0, 50), (10, 20), (49, 50), (20, 20), (45, 80)]:
+        t, gids = idx.range_times(start, stop), idx.range_gids(start, stop)
+        assert len(t) == len(gids)
+        sel = (s_all[:, 1] >= start) & (s_all[:, 1] < stop)
+        assert len(t) == sel.sum()
+        for gid in range(start, min(stop, 50)):
+            assert_array_equal(t[gids == gid], _filter(s_all, gid))
+    gids = [3, 7, 7, 42, 0]
+    for times, gid in zip(idx.spike_list(gids), gids):
+        assert_array_equal(times, _filter(s_all, gid))
+
+
+def test_gids_beyond_ngid():
+    """Test that gids >= ngid are left out of an index of ngid gids"""
+    from spikefn import SpikeIndex
+
+    rng = np.random.default_rng(2)
+    s_all = _random_spikes(rng, 1000, 40)
+    idx = SpikeIndex.from_spikes(s_all, ngid=25)
+    assert idx.ngid == 25
+    assert idx.offsets[-1] == (s_all[:, 1] < 25).sum()
+    for gid in range(25):
+        assert_array_equal(idx.times(gid), _filter(s_all, gid))
+    for gid in [25, 39, 100]:
+        assert len(idx.times(gid)) == 0
+    assert len(idx.range_times(20, 40)) == ((s_all[:, 1] >= 20) & (s_all[:, 1] < 25)).sum()
+
+
+def test_empty():
+    """Test an index without spikes"""
+    from spikefn import SpikeIndex
+
+    idx = SpikeIndex.from_spikes(np.zeros((0, 2)))
+    assert idx.ngid == 0
+    assert len(idx.times(0)) == 0
+    assert len(idx.range_times(0, 10)) == 0
+    assert len(idx.range_gids(0, 10)) == 0
+    assert [len(t) for t in idx.spike_list([0, 1])] == [0, 0]
+    idx = SpikeIndex.from_spikes(np.zeros((0, 2)), ngid=5)
+    assert_array_equal(idx.offsets, np.zeros(6))
+
+
+def test_rewrite_removes_stale_index(tmp_path):
+    """Test that the saved index of earlier spikes is not loaded"""
+    from spikefn import SpikeIndex, read_index, write_spikes_indexed
+
+    rng = np.random.default_rng(3)
+    s_all = _random_spikes(rng, 300, 20)
+    fspikes = op.join(str(tmp_path), 'spk.txt')
+    write_spikes_indexed(fspikes, s_all, 'npy')
+    idx = SpikeIndex.load(fspikes)
+    assert idx is not None
+    for gid in range(20):
+        assert_array_equal(idx.times(gid), _filter(s_all, gid))
+
+    # newer spikes, written as text only in the same second: the index and .npy are stale
+    s_new = _random_spikes(rng, 100, 20)
+    write_spikes_indexed(fspikes, s_new, 'txt')
+    assert not op.isfile(op.join(str(tmp_path), 'spk.npy'))
+    assert SpikeIndex.load(fspikes) is None
+    idx = read_index(fspikes)
+    for gid in range(20):
+        assert_array_equal(idx.times(gid), _filter(s_new, gid))
@@ -0,0 +1,22 @@
+import os.path as op
+
+from numpy.testing import assert_allclose
+
+
+def test_threads_match_single_thread(tmp_path):
+    """Test that threaded and multisplit runs give the single thread dipole"""
+    import simcompare
+    from fileio import read_table
+
+    fparam = op.join(str(tmp_path), 'test_threads.param')
+    simcompare.write_param(op.join('param', 'default.param'), fparam,
+                           {'tstop': 40., 'sim_prefix': 'test_threads'})
+    ddpl = {}
+    for extra in ['', 'nthread 2', 'nthread 2 multisplit']:
+        simcompare.runsim(fparam, extra=extra)
+        # t, agg, L2, L5 before normalization
+        ddpl[extra] = read_table(op.join(simcompare.getdatdir(fparam), 'rawdpl.txt'))
+    for extra in ['nthread 2', 'nthread 2 multisplit']:
+        assert ddpl[extra].shape == ddpl[''].shape
+        # the cells are summed in another order, and the text has 8 decimals
+        assert_allclose(ddpl[extra], ddpl[''], rtol=1e-8, atol=1e-6)
@@ -6,7 +6,6 @@ from PyQt5.QtWidgets import QCheckBox
 from PyQt5.QtGui import QIcon, QFont, QPixmap
 from PyQt5.QtCore import QCoreApplication, QThread, pyqtSignal, QObject, pyqtSlot
 from PyQt5 import QtCore
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -18,6 +17,7 @@ from DataViewGUI import DataViewGUI
 from neuron import h
 from run import net
 import paramrw
+import fileio as fio
 from filt import boxfilt, hammfilt
 import spikefn
 from math import ceil
@@ -43,7 +43,7 @@ basedir = os.path.join(dconf['datdir'],paramf.split(os.path.sep)[-1].split('.par
 ddat = {}
 ddat['dpltrials'] = readdpltrials(basedir,ntrial)
 try:
-  ddat['dpl'] = np.loadtxt(os.path.join(basedir,'dpl.txt'))
+  ddat['dpl'] = fio.read_table(os.path.join(basedir,'dpl.txt'))
 except:
   print('Could not load',dplpath)
   quit()
@@ -78,9 +78,8 @@ def adjustinputgid (extinputs, gid):
   return gid
 
 def getdspk (fn):
-  ddat = {}
   try:
-    ddat['spk'] = np.loadtxt(fn)
+    idx = spikefn.read_index(fn) # spikes by gid (see spikefn.SpikeIndex)
   except:
     print('Could not load',fn)
     quit()
@@ -88,22 +87,24 @@ def getdspk (fn):
   dhist = {}
   for ty in dclr.keys(): dhist[ty] = []
   haveinputs = False
-  for (t,gid) in ddat['spk']:
-    ty = net.gid_to_type(gid)
+  gidreg = extinputs.gidreg
+  for ty, start, stop in zip(gidreg.names, gidreg.starts, gidreg.stops):
+    # all spikes of a cell or input type are one slice of the index
+    t, gids = idx.range_times(start, stop), idx.range_gids(start, stop)
+    if not len(t): continue
     if ty in dclr:
-      dspk['Cell'][0].append(t)
-      dspk['Cell'][1].append(gid)
-      dspk['Cell'][2].append(dclr[ty])
-      dhist[ty].append(t)
+      dspk['Cell'][0].extend(t)
+      dspk['Cell'][1].extend(gids)
+      dspk['Cell'][2].extend([dclr[ty]] * len(t))
+      dhist[ty].extend(t)
     else:
-      dspk['Input'][0].append(t)
-      dspk['Input'][1].append(adjustinputgid(extinputs, gid))
-      if extinputs.is_prox_gid(gid):
-        dspk['Input'][2].append('r')
-      elif extinputs.is_dist_gid(gid):
-        dspk['Input'][2].append('g')
-      else:
-        dspk['Input'][2].append('orange')
+      # display gid and color per input gid, then per spike
+      lgid = np.arange(start, stop)
+      adjgid = np.array([adjustinputgid(extinputs, gid) for gid in lgid])
+      lclr = np.array(['r' if extinputs.is_prox_gid(gid) else 'g' if extinputs.is_dist_gid(gid) else 'orange' for gid in lgid])
+      dspk['Input'][0].extend(t)
+      dspk['Input'][1].extend(adjgid[gids - start])
+      dspk['Input'][2].extend(lclr[gids - start])
       haveinputs = True
   for ty in dhist.keys():
     dhist[ty] = np.histogram(dhist[ty],range=(0,tstop),bins=int(tstop/binsz))
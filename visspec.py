@@ -18,6 +18,7 @@ from DataViewGUI import DataViewGUI
 from specfn import MorletSpec
 from conf import dconf
 import simdat
+import fileio as fio
 from simdat import readdpltrials
 import paramrw
 from paramrw import quickgetprm
@@ -90,7 +91,7 @@ def loaddat (fname):
           dout[:,i+1] = ddat[i][:,1]
         return dout
       else:
-        ddat = np.loadtxt(os.path.join(basedir,'dpl.txt'))
+        ddat = fio.read_table(os.path.join(basedir,'dpl.txt'))
         #print('ddat.shape:',ddat.shape)
         dout = np.zeros((ddat.shape[0],2))
         #print('dout.shape:',dout.shape)
@@ -18,6 +18,7 @@ from neuron import h
 from run import net
 import paramrw
 import pickle
+import vsomastore
 from conf import dconf
 from gutils import getmplDPI
 
@@ -44,9 +45,24 @@ for i in range(len(sys.argv)):
     maxperty = int(sys.argv[i])
 
 if ntrial <= 1:
-  voltpath = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma.pkl') 
+  voltpath = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma.json') 
 else:
-  voltpath = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma_1.pkl') 
+  voltpath = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma_1.json') 
+
+class PklVolt ():
+  # somatic voltages pickled by older versions, with the interface of vsomastore.VsomaReader
+  def __init__ (self, fname):
+    self.dvolt = pickle.load(open(fname,'rb'))
+    self.t = np.array(self.dvolt['vtime'])
+  def gids (self): return [gid for gid in self.dvolt.keys() if type(gid) == int]
+  def celltype (self, gid): return self.dvolt[gid][0]
+  def volt (self, gid): return np.array(self.dvolt[gid][1])
+
+# reader of the somatic voltages in fname (the shard index), or in its .pkl if an older
+# simulation; the shards are memory-mapped, so only the cells drawn are read
+def readvolt (fname):
+  if os.path.isfile(fname): return vsomastore.VsomaReader(fname)
+  return PklVolt(os.path.splitext(fname)[0] + '.pkl')
 
 class VoltCanvas (FigureCanvas):
   def __init__ (self, paramf, index, parent=None, width=12, height=10, dpi=120, title='Voltage Viewer'):
@@ -62,20 +78,19 @@ class VoltCanvas (FigureCanvas):
     self.G = gridspec.GridSpec(10,1)
     self.plot()
 
-  def drawvolt (self, dvolt, fig, G, sz=8, ltextra=''):
+  def drawvolt (self, vs, fig, G, sz=8, ltextra=''):
     row = 0
     ax = fig.add_subplot(G[row:-1,:])
     lax = [ax]
     dcnt = {} # counts number of times cell of a type drawn  
-    vtime = dvolt['vtime']
+    vtime = vs.t
     yoff = 0
-    # print(dvolt.keys())
-    for gid,it in dvolt.items():
-      ty,vsoma = it[0],it[1]
+    for gid in vs.gids():
+      ty = vs.celltype(gid)
       # print('ty:',ty,'gid:',gid)
-      if type(gid) != int: continue
       if ty not in dcnt: dcnt[ty] = 1
       if dcnt[ty] > maxperty: continue
+      vsoma = vs.volt(gid) # only read for the cells drawn
       #ax.plot(vtime, -vsoma + yoff, dclr[ty], linewidth = self.gui.linewidth)
       ax.plot(vtime, -vsoma + yoff, dclr[ty], linewidth = self.gui.linewidth)
       yoff += max(vsoma) - min(vsoma)
@@ -108,15 +123,12 @@ class VoltCanvas (FigureCanvas):
 
   def plot (self):
     if self.index == 0:
-      if ntrial == 1:
-        dvolt = pickle.load(open(voltpath,'rb'))
-      else:
-        dvolt = pickle.load(open(voltpath,'rb'))
-      self.lax = self.drawvolt(dvolt,self.figure, self.G, 5, ltextra='All Trials')
+      vs = readvolt(voltpath)
+      self.lax = self.drawvolt(vs,self.figure, self.G, 5, ltextra='All Trials')
     else:
-      voltpathtrial = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma_'+str(self.index)+'.pkl') 
-      dvolttrial = pickle.load(open(voltpathtrial,'rb'))
-      self.lax=self.drawvolt(dvolttrial,self.figure, self.G, 5, ltextra='Trial '+str(self.index));
+      voltpathtrial = os.path.join(dconf['datdir'],paramf.split('.param')[0].split(os.path.sep)[-1],'vsoma_'+str(self.index)+'.json') 
+      vstrial = readvolt(voltpathtrial)
+      self.lax=self.drawvolt(vstrial,self.figure, self.G, 5, ltextra='Trial '+str(self.index));
     self.draw()
 
 class VoltGUI (QMainWindow):
@@ -0,0 +1,107 @@
+# vsomastore.py - somatic voltages in per rank binary shards (save_vsoma)
+#
+# every rank writes the voltages of its own cells, so nothing goes through rank 0:
+#   <base>_r<rank>.npy: ncell x nt array of the rank's cells, float32 or float64 by
+#     [sim] vsomafmt; one row per cell, so a cell is one contiguous read
+#   <base>_r<rank>.json: {"gids": [...], "celltypes": [...]} the gid and type of each row
+# and rank 0 writes the index (the vsoma file name of the trial, e.g. vsoma.json):
+#   {"nshard": 4, "nt": 6801, "dtype": "float32", "t": "vsoma_t.npy"}
+# with the recorded times in <base>_t.npy
+#
+# in streaming mode (run.py streamwin) each window is appended to a time major spool
+# file per rank and the voltages are cleared; the spool is turned into the shard after
+# the run, a block of cells at a time
+#
+# reading, loading only the cells asked for:
+#   vs = vsomastore.VsomaReader('data/default/vsoma.json')
+#   vs.gids(), vs.celltype(gid), vs.t, vs.volt(gid)
+
+import os
+import json
+import numpy as np
+
+def basename (fname):
+  return os.path.splitext(fname)[0]
+
+def shardname (fname, rank):
+  return '%s_r%d' % (basename(fname), rank)
+
+def exists (fname):
+  return os.path.isfile(fname) and fname.endswith('.json')
+
+def write_meta (fname, rank, gids, celltypes):
+  with open(shardname(fname, rank) + '.json', 'w') as fp:
+    json.dump({'gids': [int(gid) for gid in gids], 'celltypes': list(celltypes)}, fp)
+
+# writes the shard of rank; x: ncell x nt array, rows in the order of gids
+def write_shard (fname, rank, gids, celltypes, x):
+  np.save(shardname(fname, rank) + '.npy', x)
+  write_meta(fname, rank, gids, celltypes)
+
+# writes the index and the times (rank 0); nshard: number of ranks
+def write_index (fname, nshard, t, dtype):
+  ft = basename(fname) + '_t.npy'
+  np.save(ft, np.asarray(t, dtype='float64'))
+  with open(fname, 'w') as fp:
+    json.dump({'nshard': nshard, 'nt': len(t), 'dtype': np.dtype(dtype).name, 't': os.path.basename(ft)}, fp)
+
+class ShardSpool ():
+  # streamed shard of one rank: windows of ncell voltages are appended time major to a
+  # raw file and transposed into the shard by finish()
+  def __init__ (self, fname, rank, gids, celltypes, dtype):
+    self.fname, self.rank = fname, rank
+    self.gids, self.celltypes = list(gids), list(celltypes)
+    self.dtype = np.dtype(dtype)
+    self.fspool = shardname(fname, rank) + '.spool'
+    if os.path.isfile(self.fspool): os.remove(self.fspool)
+    self.nt = 0
+
+  # lvec: the voltage vectors of the rank's cells (in the order of gids) for the last window
+  def append (self, lvec):
+    if not lvec: return
+    x = np.column_stack([vec.as_numpy() for vec in lvec]).astype(self.dtype)
+    with open(self.fspool, 'ab') as fp: fp.write(x.tobytes())
+    self.nt += x.shape[0]
+
+  # writes the cell major shard from the spool, blk cells at a time, and removes the spool
+  def finish (self, blk=256):
+    ncell = len(self.gids)
+    out = np.lib.format.open_memmap(shardname(self.fname, self.rank) + '.npy', mode='w+', dtype=self.dtype, shape=(ncell, self.nt))
+    if ncell > 0 and self.nt > 0:
+      spool = np.memmap(self.fspool, dtype=self.dtype, mode='r', shape=(self.nt, ncell))
+      for i in range(0, ncell, blk): out[i:i+blk] = spool[:, i:i+blk].T
+      del spool
+    out.flush()
+    del out
+    if os.path.isfile(self.fspool): os.remove(self.fspool)
+    write_meta(self.fname, self.rank, self.gids, self.celltypes)
+
+class VsomaReader ():
+  # fname: the index; the shards are memory-mapped, a cell is read when asked for
+  def __init__ (self, fname):
+    with open(fname, 'r') as fp: self.meta = json.load(fp)
+    self.fname = fname
+    self.t = np.load(os.path.join(os.path.dirname(fname), self.meta['t']))
+    self.dloc = {} # gid -> (shard, row)
+    self.dtype = {} # gid -> celltype
+    self.lshard = [None for i in range(self.meta['nshard'])]
+    for rank in range(self.meta['nshard']):
+      with open(shardname(fname, rank) + '.json', 'r') as fp: d = json.load(fp)
+      for row, (gid, ty) in enumerate(zip(d['gids'], d['celltypes'])):
+        self.dloc[gid] = (rank, row)
+        self.dtype[gid] = ty
+
+  def gids (self):
+    return sorted(self.dloc.keys())
+
+  def celltype (self, gid):
+    return self.dtype[gid]
+
+  def __shard (self, rank):
+    if self.lshard[rank] is None: self.lshard[rank] = np.load(shardname(self.fname, rank) + '.npy', mmap_mode='r')
+    return self.lshard[rank]
+
+  # voltage of cell gid (float64 copy of its row)
+  def volt (self, gid):
+    rank, row = self.dloc[gid]
+    return np.array(self.__shard(rank)[row], dtype='float64')